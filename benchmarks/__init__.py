@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the stats hot paths, run them from the repository root:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/keys.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(**stats_settings):
+    """
+    Configures django with the stats app, an in-memory SQLite database and
+    a local memory cache counting its operations.
+
+    :param stats_settings: ``STATS2_*`` settings
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        INSTALLED_APPS=['django.contrib.contenttypes', 'django_stats2'],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                               'NAME': ':memory:'}},
+        CACHES={'default': {
+            'BACKEND': 'benchmarks.cache.CountingLocMemCache'}},
+        USE_TZ=True,
+        **stats_settings
+    )
+    django.setup()
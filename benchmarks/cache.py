@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def counted(method):
+    def inner(self, *args, **kwargs):
+        # Calls made by other methods of the cache are not counted
+        self.depth += 1
+        try:
+            if self.depth == 1:
+                self.operations += 1
+            return method(self, *args, **kwargs)
+        finally:
+            self.depth -= 1
+    inner.__name__ = method.__name__
+    return inner
+
+
+class CountingLocMemCache(LocMemCache):
+    """Local memory cache keeping the number of operations called on it"""
+    def __init__(self, *args, **kwargs):
+        super(CountingLocMemCache, self).__init__(*args, **kwargs)
+        self.operations = 0
+        self.depth = 0
+
+    add = counted(LocMemCache.add)
+    get = counted(LocMemCache.get)
+    set = counted(LocMemCache.set)
+    delete = counted(LocMemCache.delete)
+    get_many = counted(LocMemCache.get_many)
+    set_many = counted(LocMemCache.set_many)
+    delete_many = counted(LocMemCache.delete_many)
+    has_key = counted(LocMemCache.has_key)
+    incr = counted(LocMemCache.incr)
+    decr = counted(LocMemCache.decr)
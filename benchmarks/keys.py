@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the per call overhead of the cache keys and of the
+``Stat.incr()`` hot path, using a local memory cache and no database.
+
+``format`` is the cache key built the way it was before keys were
+precompiled, every call formatting the whole key, to compare against.
+
+    python benchmarks/keys.py [--number 100000]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import setup  # noqa: E402
+
+setup(STATS2_USE_CACHE=True,
+      STATS2_DDBB_DIRECT_INSERT=False,
+      STATS2_WRITE_BEHIND=False)
+
+from django_stats2.objects import Stat  # noqa: E402
+
+
+def format_cache_key(stat, value_type='total', date=None, date_end=None,
+                     generation=None):
+    return stat.cache_key_format.get(value_type).format(
+        cache_key_prefix=stat.cache_key_prefix,
+        prefix=stat._get_stat_prefix(),
+        name=stat.name,
+        pk=stat.object_id or '',
+        date=date,
+        date_end=date_end,
+        generation=generation)
+
+
+def get_benchmarks():
+    stat = Stat(name='total_visits')
+    today = date.today()
+    return [
+        ('format history key',
+         lambda: format_cache_key(stat, 'history', today)),
+        ('history key', lambda: stat._get_cache_key('history', today)),
+        ('format total key', lambda: format_cache_key(stat)),
+        ('total key', lambda: stat._get_cache_key()),
+        ('incr', lambda: stat.incr(date=today)),
+    ]
+
+
+def run(number):
+    """
+    :returns: Mapping of benchmark name to nanoseconds per call
+    :rtype: dict
+    """
+    results = {}
+    for name, func in get_benchmarks():
+        func()
+        best = min(timeit.repeat(func, number=number, repeat=3))
+        results[name] = best / number * 1e9
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=100000,
+                        help='Calls per measure')
+    args = parser.parse_args()
+
+    for name, nanoseconds in sorted(run(args.number).items()):
+        print('{:<20} {:>10.0f} ns/call'.format(name, nanoseconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the stat operations on every storage mode, against a local
+memory cache and an in-memory SQLite database.
+
+Reports the operations per second, and the database queries and cache
+operations per operation, as JSON to compare them across commits:
+
+    python benchmarks/run.py --output before.json
+    python benchmarks/run.py --compare before.json
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import ROOT, setup  # noqa: E402
+
+setup()
+
+import django  # noqa: E402
+from django.contrib.contenttypes.models import ContentType  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from django_stats2 import backends  # noqa: E402
+from django_stats2 import settings as stats2_settings  # noqa: E402
+from django_stats2.models import (  # noqa: E402
+    ModelStat, ModelStatRollup, ModelStatTotal)
+from django_stats2.objects import Stat  # noqa: E402
+from django_stats2.utils import get_cache  # noqa: E402
+
+
+# Settings of every storage mode, write-behind being the default one
+MODES = {
+    'write-behind': {'USE_CACHE': True, 'DDBB_DIRECT_INSERT': False,
+                     'WRITE_BEHIND': True, 'LOCAL_CACHE': {}},
+    'cache-only': {'USE_CACHE': True, 'DDBB_DIRECT_INSERT': False,
+                   'WRITE_BEHIND': False, 'LOCAL_CACHE': {}},
+    'direct-insert': {'USE_CACHE': False, 'DDBB_DIRECT_INSERT': True,
+                      'WRITE_BEHIND': False, 'LOCAL_CACHE': {}},
+    'mixed': {'USE_CACHE': True, 'DDBB_DIRECT_INSERT': True,
+              'WRITE_BEHIND': False, 'LOCAL_CACHE': {}},
+    'mixed-local': {'USE_CACHE': True, 'DDBB_DIRECT_INSERT': True,
+                    'WRITE_BEHIND': False, 'LOCAL_CACHE': {'reads': 5}},
+}
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+LAST_MONTH = TODAY - timedelta(days=30)
+
+
+def flush(stat):
+    """Increment written into the database by the flush of its backend"""
+    stat.incr(date=TODAY)
+    stat.backend.flush()
+
+
+OPERATIONS = {
+    'incr': lambda stat: stat.incr(date=TODAY),
+    'get': lambda stat: stat.get(TODAY),
+    'total': lambda stat: stat.total(),
+    'get_between_date': lambda stat: stat.get_between_date(LAST_MONTH,
+                                                           TODAY),
+    'set': lambda stat: stat.set(5, date=YESTERDAY),
+    'store': lambda stat: stat.store(5, date=YESTERDAY),
+    'flush': flush,
+}
+
+
+def set_mode(mode):
+    for name, value in MODES[mode].items():
+        setattr(stats2_settings, name, value)
+    backends._backends.clear()
+
+
+def reset():
+    get_cache().clear()
+    for model in (ModelStat, ModelStatRollup, ModelStatTotal):
+        model.objects.all().delete()
+
+
+def get_stat():
+    """Model stat of a content type, which works as any model instance"""
+    content_type = ContentType.objects.get_for_model(ContentType)
+    return Stat(name='reads', model_instance=content_type,
+                content_type=content_type)
+
+
+def measure(mode, operation, number, sample):
+    """
+    :param number: Calls timed
+    :param sample: Calls counting the queries and cache operations
+    :rtype: dict
+    """
+    set_mode(mode)
+    reset()
+    stat = get_stat()
+    func = OPERATIONS[operation]
+
+    # Some history to read, and warm up
+    stat.incr(3, date=LAST_MONTH)
+    stat.incr(2, date=TODAY)
+    func(stat)
+
+    start = time.time()
+    for i in range(number):
+        func(stat)
+    elapsed = time.time() - start
+
+    cache = get_cache()
+    operations = cache.operations
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(sample):
+            func(stat)
+
+    return {
+        'mode': mode,
+        'operation': operation,
+        'number': number,
+        'ops_per_sec': round(number / elapsed, 1) if elapsed else None,
+        'queries_per_op': round(float(len(queries)) / sample, 2),
+        'cache_ops_per_op': round(
+            float(cache.operations - operations) / sample, 2),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(modes, operations, number, sample):
+    call_command('migrate', verbosity=0)
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'results': [measure(mode, operation, number, sample)
+                    for mode in modes
+                    for operation in operations],
+    }
+
+
+def compare(report, previous):
+    """Prints the change of ops/sec of every result against the previous"""
+    previous_results = dict(
+        ((result['mode'], result['operation']), result)
+        for result in previous['results'])
+
+    for result in report['results']:
+        key = (result['mode'], result['operation'])
+        before = previous_results.get(key)
+        if not before or not before['ops_per_sec']:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        print('{:<14} {:<17} {:>+7.1%}  queries {} -> {}  '
+              'cache ops {} -> {}'.format(
+                  key[0], key[1], change,
+                  before['queries_per_op'], result['queries_per_op'],
+                  before['cache_ops_per_op'], result['cache_ops_per_op']),
+              file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=1000,
+                        help='Calls timed per operation and mode')
+    parser.add_argument('--sample', type=int, default=100,
+                        help='Calls counting queries and cache operations')
+    parser.add_argument('--mode', action='append', choices=sorted(MODES),
+                        help='Storage modes to run, all by default')
+    parser.add_argument('--operation', action='append',
+                        choices=sorted(OPERATIONS),
+                        help='Operations to run, all by default')
+    parser.add_argument('--output', help='File to write the JSON report to')
+    parser.add_argument('--compare',
+                        help='Previous JSON report to compare against')
+    args = parser.parse_args()
+
+    report = run(args.mode or sorted(MODES),
+                 args.operation or sorted(OPERATIONS),
+                 args.number, args.sample)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(report, json.load(previous))
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,3 @@
 __version__ = '0.2.4'
+
+default_app_config = 'django_stats2.apps.Stats2Config'
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Async API for ASGI deployments, requires python 3 and asgiref.
+
+The cache of the default backend is used through the native async methods
+of django caches (django >= 4.0) and the database is read with the async
+ORM (django >= 4.1) when available. The rest of the operations, like the
+database writes which need transactions, run in a thread with
+``sync_to_async`` once per call for all the stats involved: buffer the
+increments with :class:`buffered_stats` to write them all at once.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from timeit import default_timer
+
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet, Sum
+from django.utils import timezone
+
+from django_stats2 import buffer
+from django_stats2 import leaderboard
+from django_stats2 import settings as stats2_settings
+from django_stats2 import signals
+from django_stats2.backends import get_backends
+from django_stats2.backends.cache import CacheBackend
+from django_stats2.backends.db import DatabaseBackend
+from django_stats2.backends.default import (
+    MISS_LOCK_POLL, DefaultBackend, get_between_value)
+from django_stats2.prefetch import get_counter_stats
+
+
+def _to_date(date):
+    if isinstance(date, datetime):
+        return date.date()
+    return date
+
+
+def _get_async_cache(backend):
+    """
+    Returns the cache of the default backend if it can be used natively,
+    None otherwise
+    """
+    if not isinstance(backend, DefaultBackend) or \
+            not stats2_settings.USE_CACHE:
+        return None
+
+    cache_backend = backend.cache_backend
+    # Only the key per day layout, the hash one needs the sync clients
+    if type(cache_backend) is not CacheBackend:
+        return None
+
+    cache = cache_backend.cache
+    return cache if hasattr(cache, 'aget_many') else None
+
+
+async def _get_ddbb_many(ddbb_backend, stats, date=None):
+    if len(stats) == 1 and hasattr(QuerySet, 'aaggregate'):
+        stat = stats[0]
+        stat_result = await ddbb_backend.get_queryset(stat, date) \
+            .aaggregate(Sum('value'))
+        return {stat: stat_result.get('value__sum') or 0}
+
+    return await sync_to_async(ddbb_backend.get_many)(stats, date)
+
+
+async def _wait(cache, cache_keys):
+    """
+    Async :meth:`django_stats2.backends.default.DefaultBackend._wait`,
+    returns the cached values found.
+    """
+    deadline = default_timer() + stats2_settings.MISS_LOCK_WAIT
+    while True:
+        await asyncio.sleep(MISS_LOCK_POLL)
+        cached = await cache.aget_many(cache_keys)
+        if len(cached) == len(cache_keys) or default_timer() >= deadline:
+            return cached
+
+
+async def _get_missing(backend, cache, stats, cache_keys, date=None):
+    """
+    Reads the stats missing in the cache from the database and caches
+    them, locking their keys like the sync
+    :meth:`django_stats2.backends.default.DefaultBackend.get_many` so only
+    one process reads each of them.
+    """
+    cache_backend = backend.cache_backend
+    value_type = cache_backend._get_value_type(date)
+    values = {}
+
+    locked, waiting = await sync_to_async(backend._lock_missing)(
+        OrderedDict((stat, cache_keys[stat]) for stat in stats))
+    missing = list(locked)
+    if waiting:
+        # Being read by other processes
+        cached = await _wait(cache, [cache_keys[stat] for stat in waiting])
+        for stat in waiting:
+            if cache_keys[stat] in cached:
+                values[stat] = cached[cache_keys[stat]]
+            else:
+                missing.append(stat)
+
+    try:
+        if missing:
+            start = default_timer()
+            ddbb_values = await _get_ddbb_many(backend.ddbb_backend,
+                                               missing, date)
+            signals.ddbb_read.send(sender=backend.__class__,
+                                   value_type=value_type,
+                                   values=len(missing),
+                                   duration=default_timer() - start)
+            values.update(ddbb_values)
+            await cache.aset_many(
+                dict((cache_keys[stat], value)
+                     for stat, value in ddbb_values.items()),
+                timeout=cache_backend.get_cache_timeout(value_type))
+    finally:
+        if stats2_settings.MISS_LOCK_TIMEOUT and locked:
+            await sync_to_async(cache_backend.unlock)(
+                [cache_keys[stat] for stat in locked])
+
+    return values
+
+
+async def get_many(stats, date=None):
+    """
+    Async :meth:`django_stats2.backends.base.BaseBackend.get_many` for
+    stats of any backend.
+
+    :returns: Mapping of every stat to its value for the date, or its total
+    :rtype: dict
+    """
+    date = _to_date(date)
+
+    by_backend = OrderedDict()
+    for stat in stats:
+        by_backend.setdefault(stat.backend, []).append(stat)
+
+    values = {}
+    for backend, backend_stats in by_backend.items():
+        if isinstance(backend, DatabaseBackend):
+            values.update(await _get_ddbb_many(backend, backend_stats, date))
+            continue
+
+        cache = _get_async_cache(backend)
+        if cache is None:
+            values.update(
+                await sync_to_async(backend.get_many)(backend_stats, date))
+            continue
+
+        local_keys = {}
+        if stats2_settings.LOCAL_CACHE:
+            local_values, backend_stats, local_keys = backend.get_local(
+                backend_stats, date)
+            values.update(local_values)
+            if not backend_stats:
+                continue
+
+        cache_backend = backend.cache_backend
+        cache_keys = cache_backend.get_cache_keys(backend_stats, date)
+        cached = await cache.aget_many(list(cache_keys.values()))
+        missing = []
+        for stat in backend_stats:
+            if cache_keys[stat] in cached:
+                values[stat] = cached[cache_keys[stat]]
+            else:
+                missing.append(stat)
+
+        value_type = cache_backend._get_value_type(date)
+        backend._cache_read(value_type, len(backend_stats) - len(missing),
+                            len(missing))
+        if missing:
+            values.update(await _get_missing(backend, cache, missing,
+                                             cache_keys, date))
+
+        if local_keys:
+            backend.set_local(values, local_keys)
+
+    return values
+
+
+async def get(stat, date=None):
+    prefetch_key = stat._get_prefetch_key(date)
+    if prefetch_key in stat._prefetched:
+        return int(stat._prefetched[prefetch_key])
+
+    values = await get_many([stat], date)
+    return int(values[stat])
+
+
+async def get_between(stat, date_start, date_end):
+    date_start, date_end = _to_date(date_start), _to_date(date_end)
+    backend = stat.backend
+    cache = _get_async_cache(backend)
+
+    if cache is None:
+        return await sync_to_async(backend.between)(stat, date_start,
+                                                    date_end)
+
+    cache_backend = backend.cache_backend
+    generation = await sync_to_async(cache_backend.get_generation)(stat)
+    cache_key = stat._get_cache_key('between', date_start, date_end,
+                                    generation=generation)
+    entry = await cache.aget(cache_key)
+
+    if entry is not None:
+        backend._cache_read('between', 1, 0)
+        value, expensive = get_between_value(entry)
+        if not expensive or not backend._recompute_early(entry):
+            return value
+
+    # Missing or to refresh, with a lock so only one process reads it
+    return await sync_to_async(backend.between)(stat, date_start, date_end)
+
+
+async def get_series(stat, date_start, date_end, fill_zeros=True):
+    date_start, date_end = _to_date(date_start), _to_date(date_end)
+    assert date_start <= date_end, "Start date must be before end date."
+
+    series = await sync_to_async(stat.backend.range)(stat, date_start,
+                                                     date_end)
+    return OrderedDict((date, int(value))
+                       for date, value in series.items()
+                       if value or fill_zeros)
+
+
+async def _incr_cache(cache, cache_backend, rows):
+    history, totals = cache_backend.get_increments(rows)
+    missing = {}
+
+    for cache_key, value in history.items():
+        try:
+            await cache.aincr(cache_key, value)
+        except ValueError:
+            missing[cache_key] = value
+
+    for total_key, value in totals.items():
+        try:
+            await cache.aincr(total_key, value)
+        except ValueError:
+            # Will get cached on get()
+            pass
+
+    if missing:
+        await cache.aset_many(
+            missing, timeout=cache_backend.get_cache_timeout('history'))
+
+
+async def incr_many(rows):
+    """
+    Async :meth:`django_stats2.backends.base.BaseBackend.incr_many` for
+    stats of any backend.
+
+    :param rows: ``(stat, date, value)`` tuples
+    :type rows: iterable
+    """
+    by_backend = OrderedDict()
+    for stat, date, value in rows:
+        by_backend.setdefault(stat.backend, []).append(
+            (stat, stat._get_bucket(date), value))
+
+    for backend, backend_rows in by_backend.items():
+        cache = _get_async_cache(backend)
+        if cache is None:
+            await sync_to_async(backend.incr_many)(backend_rows)
+            continue
+
+        backend.clear_local_cache(
+            (stat, date) for stat, date, value in backend_rows)
+        await _incr_cache(cache, backend.cache_backend, backend_rows)
+
+        if stats2_settings.DDBB_DIRECT_INSERT:
+            await sync_to_async(backend._write_ddbb)(
+                len(backend_rows), 'incr_many', backend_rows)
+        elif stats2_settings.WRITE_BEHIND:
+            await sync_to_async(_record_deltas)(backend, backend_rows)
+
+        # Once the database is updated, so derived values don't get cached
+        # again with the old values
+        await cache.adelete_many(
+            backend.cache_backend.get_generation_keys(
+                stat for stat, date, value in backend_rows))
+
+
+def _record_deltas(backend, rows):
+    for stat, date, value in rows:
+        backend._record_delta(stat, date, value)
+
+
+async def incr(stat, value=1, date=None):
+    date = stat._get_bucket(date)
+    stat._prefetched.clear()
+    leaderboard.track(stat, value)
+    if not buffer.add_to_buffer(stat, date, value):
+        await incr_many([(stat, date, value)])
+
+
+async def set(stat, value, date=None):
+    stats_buffer = buffer.get_buffer()
+    if stats_buffer is not None:
+        # Written before, or the value would be increased on exit
+        await flush_buffer(stats_buffer, stat)
+
+    stat._prefetched.clear()
+    date = _to_date(date) or timezone.now().date()
+    await sync_to_async(stat.backend.set)(stat, value, date)
+    return value
+
+
+async def prefetch_stats(instances, *names, date=None):
+    """
+    Async :func:`django_stats2.prefetch.prefetch_stats`. The instances must
+    be already retrieved, like ``[note async for note in queryset]``.
+    """
+    date = _to_date(date)
+    stats = get_counter_stats(instances, names)
+
+    if stats:
+        values = await get_many(stats, date)
+        for stat, value in values.items():
+            stat._set_prefetched(value, date)
+
+    return instances
+
+
+async def flush(batch_size=None):
+    """
+    Writes the pending increments of every backend into its persistent
+    storage, see the ``stats2_flush`` command.
+
+    :returns: Number of values written
+    :rtype: int
+    """
+    flushed = 0
+    for backend in get_backends():
+        flushed += await sync_to_async(backend.flush)(batch_size=batch_size)
+    return flushed
+
+
+async def flush_buffer(stats_buffer, stat=None):
+    """
+    Writes the increments of the buffer and empties it
+
+    :param stat: Only write the increments of this stat
+    """
+    rows = []
+    for backend_rows in stats_buffer.pop_rows(stat).values():
+        rows.extend(backend_rows)
+    await incr_many(rows)
+
+
+class buffered_stats(buffer.buffered_stats):
+    """
+    Async context manager that buffers all the stat increments done inside
+    it, in the running task, and writes them when leaving the outermost
+    block.
+
+    ::
+
+        async with buffered_stats():
+            await note.reads.aincr()
+            await Stat(name='total_visits').aincr()
+    """
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        stats_buffer = self._pop()
+        if stats_buffer is not None:
+            await flush_buffer(stats_buffer)
@@ -8,6 +8,11 @@ class Stats2Config(AppConfig):
     name = 'django_stats2'
 
     def ready(self):
-        assert stats2_settings.USE_CACHE == stats2_settings.DDBB_DIRECT_INSERT == False,\
+        assert stats2_settings.USE_CACHE or \
+            stats2_settings.DDBB_DIRECT_INSERT, \
             "django_stats2: Configuration error. USE_CACHE and "\
-            "DDBB_DIRECT_INSERT can't be both False, enable at least one." % stats2_settings.USE_CACHE
+            "DDBB_DIRECT_INSERT can't be both False, enable at least one."
+
+        if stats2_settings.METRICS:
+            from django_stats2 import metrics
+            metrics.connect()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from django_stats2 import settings as stats2_settings
+
+
+DEFAULT_BACKEND_ALIAS = 'default'
+DEFAULT_BACKEND = 'django_stats2.backends.default.DefaultBackend'
+
+# Backend instances by alias, shared by all the stats using them
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _create_backend(alias):
+    config = stats2_settings.BACKENDS.get(alias)
+    if config is None:
+        if alias != DEFAULT_BACKEND_ALIAS:
+            raise ImproperlyConfigured(
+                'django_stats2: The "{}" stats backend is not '
+                'configured.'.format(alias))
+        config = {'BACKEND': DEFAULT_BACKEND}
+
+    try:
+        backend_class = import_string(config['BACKEND'])
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            'django_stats2: Could not find the "{}" stats backend '
+            'class: {}'.format(alias, e))
+
+    return backend_class(alias, **config.get('OPTIONS', {}))
+
+
+def get_backend(alias=DEFAULT_BACKEND_ALIAS):
+    """
+    Returns the backend configured in ``STATS2_BACKENDS`` with the alias.
+
+    :rtype: :class:`django_stats2.backends.base.BaseBackend`
+    """
+    backend = _backends.get(alias)
+    if backend is None:
+        with _backends_lock:
+            if alias not in _backends:
+                _backends[alias] = _create_backend(alias)
+            backend = _backends[alias]
+    return backend
+
+
+def get_stat_backend(name):
+    """
+    Returns the backend used by the stats with the name
+
+    :raises ImproperlyConfigured: When the stats have a finer
+        ``STATS2_GRANULARITY`` than the backend can store
+    """
+    backend = get_backend(
+        stats2_settings.STAT_BACKENDS.get(name, DEFAULT_BACKEND_ALIAS))
+    if stats2_settings.GRANULARITY.get(name, 'day') != 'day' and \
+            not backend.supports_buckets:
+        raise ImproperlyConfigured(
+            'django_stats2: The "{}" stats backend can not store the {} '
+            'buckets of the "{}" stats.'.format(
+                backend.alias, stats2_settings.GRANULARITY[name], name))
+    return backend
+
+
+def get_backends():
+    """Returns all the configured backends"""
+    aliases = set(stats2_settings.BACKENDS)
+    aliases.add(DEFAULT_BACKEND_ALIAS)
+    return [get_backend(alias) for alias in sorted(aliases)]
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from django_stats2.utils import get_bucket_range
+
+
+class BaseBackend(object):
+    """
+    Storage for the stats values.
+
+    Stats are given as :class:`django_stats2.objects.Stat` instances, which
+    know the keys (``_get_row_key``, ``_get_cache_key``) to store them with.
+    A ``None`` date means the total of the stat. Increments of the stats
+    with a finer granularity come with the start of their minute or hour
+    instead of the day.
+    """
+    # Whether the minute or hour buckets of those stats are stored
+    supports_buckets = False
+
+    def __init__(self, alias='default', **options):
+        self.alias = alias
+        self.options = options
+
+    def _get_dates(self, date_start, date_end):
+        return [date_start + timedelta(days=days)
+                for days in range((date_end - date_start).days + 1)]
+
+    def get(self, stat, date=None):
+        """Returns the value of the stat for the date, or its total"""
+        return self.get_many([stat], date)[stat]
+
+    def get_many(self, stats, date=None):
+        """
+        :returns: Mapping of every stat to its value for the date, or its
+            total
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def incr_many(self, rows):
+        """
+        Adds the values to the stats, negative values decrement them.
+
+        :param rows: ``(stat, date, value)`` tuples
+        :type rows: iterable
+        """
+        raise NotImplementedError
+
+    def set(self, stat, value, date=None):
+        """Sets the value of the stat for the date, or its total"""
+        raise NotImplementedError
+
+    def store(self, stat, value, date):
+        """Sets the value of the stat in the persistent storage"""
+        self.set(stat, value, date)
+
+    def clear_cache(self, rows):
+        """
+        Drops the cached values of the stats, their totals and the given
+        days, once they have been written straight into the database.
+
+        :param rows: ``(stat, date)`` tuples
+        """
+
+    def warm_cache(self, values, date=None):
+        """
+        Caches the values read straight from the database, for the stats
+        not cached already.
+
+        :param values: Mapping of stats to their value for the date, or
+            their total
+        """
+
+    def range(self, stat, date_start, date_end):
+        """
+        :returns: Mapping of every day between both dates (included) to the
+            value of the stat
+        :rtype: :class:`collections.OrderedDict`
+        """
+        raise NotImplementedError
+
+    def between(self, stat, date_start, date_end):
+        """Returns the sum of the values between both dates (included)"""
+        return sum(self.range(stat, date_start, date_end).values())
+
+    def buckets(self, stat, date_start, date_end):
+        """
+        :returns: Mapping of every minute or hour of the days between both
+            dates (included) to the value of the stat
+        :rtype: :class:`collections.OrderedDict`
+        """
+        raise NotImplementedError
+
+    def flush(self, batch_size=None):
+        """
+        Writes the pending values into the persistent storage.
+
+        :param batch_size: Number of values written at once, for the
+            backends writing them in batches
+        :returns: Number of values written
+        :rtype: int
+        """
+        return 0
+
+
+class DictBackend(BaseBackend):
+    """
+    Base for the backends storing every stat as a mapping of its days, and
+    the total, to their values. Stats with a finer granularity also map the
+    start of their minutes or hours.
+    """
+    supports_buckets = True
+    total_field = 'total'
+
+    def _get_field(self, date):
+        if isinstance(date, datetime):
+            date = date.date()
+        return self.total_field if date is None else date.isoformat()
+
+    def _get_bucket_field(self, date):
+        """Returns the field of the minute or hour bucket, None for days"""
+        if not isinstance(date, datetime):
+            return None
+        if timezone.is_aware(date):
+            date = date.astimezone(timezone.get_fixed_timezone(0))
+        return date.isoformat()
+
+    def range(self, stat, date_start, date_end):
+        dates = self._get_dates(date_start, date_end)
+        values = self._get_fields(stat, [self._get_field(date)
+                                         for date in dates])
+        return OrderedDict((date, value or 0)
+                           for date, value in zip(dates, values))
+
+    def buckets(self, stat, date_start, date_end):
+        buckets = get_bucket_range(date_start, date_end, stat.granularity)
+        values = self._get_fields(stat, [self._get_bucket_field(bucket)
+                                         for bucket in buckets])
+        return OrderedDict((bucket, value or 0)
+                           for bucket, value in zip(buckets, values))
+
+    def _get_fields(self, stat, fields):
+        """Returns the values of the fields of the stat, None if missing"""
+        raise NotImplementedError
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.cache import caches
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.backends.base import BaseBackend
+from django_stats2.utils import get_cache, get_generation
+
+
+# Adds the increments to the days of a stat hash in a single call, and to its
+# total only if it's cached (otherwise it's retrieved on get()).
+# ARGV: timeout (0 for none) followed by (field, value) pairs.
+INCR_SCRIPT = """
+local total = redis.call('HEXISTS', KEYS[1], 'total') == 1
+for i = 2, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    if total then
+        redis.call('HINCRBY', KEYS[1], 'total', ARGV[i + 1])
+    end
+end
+if tonumber(ARGV[1]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+"""
+
+
+def get_redis_client(cache):
+    """
+    Returns the client of the redis server behind the django cache
+    (django-redis or the django builtin one), None for other caches.
+    """
+    for client in (getattr(cache, 'client', None),
+                   getattr(cache, '_cache', None)):
+        if hasattr(client, 'get_client'):
+            return client.get_client(write=True)
+    return None
+
+
+class CacheBackend(BaseBackend):
+    """
+    Stores the values in a django cache, with a key per day plus one for
+    the total. On its own the values are lost once evicted, it's mostly
+    used as the cache layer of
+    :class:`django_stats2.backends.default.DefaultBackend`.
+
+    Options:
+
+    - ``CACHE``: Alias of the cache in ``settings.CACHES``, defaults to
+      ``STATS2_CACHE_KEY``.
+    """
+    def __init__(self, alias='default', **options):
+        super(CacheBackend, self).__init__(alias, **options)
+        # Looked up once instead of on every write
+        self.timeouts = dict(
+            (value_type, self._get_setting_timeout(value_type))
+            for value_type in ('total', 'history', 'between', 'buckets'))
+
+    @property
+    def cache(self):
+        if 'CACHE' in self.options:
+            return caches[self.options['CACHE']]
+        return get_cache()
+
+    def _get_value_type(self, date):
+        return 'history' if date else 'total'
+
+    def _get_setting_timeout(self, value_type):
+        return getattr(stats2_settings,
+                       'CACHE_TIMEOUT_{}'.format(value_type).upper(),
+                       None)
+
+    def get_cache_timeout(self, value_type='total'):
+        if value_type in self.timeouts:
+            return self.timeouts[value_type]
+        return self._get_setting_timeout(value_type)
+
+    def lock(self, cache_key):
+        """
+        Locks the value of the cache key while it's read from the database
+
+        :returns: Whether the lock was acquired
+        :rtype: bool
+        """
+        return self.cache.add(cache_key + ':lock', True,
+                              timeout=stats2_settings.MISS_LOCK_TIMEOUT)
+
+    def unlock(self, cache_keys):
+        self.cache.delete_many([cache_key + ':lock'
+                                for cache_key in cache_keys])
+
+    def get_cache_keys(self, stats, date=None):
+        value_type = self._get_value_type(date)
+        return dict((stat, stat._get_cache_key(value_type, date))
+                    for stat in stats)
+
+    def get_cached(self, stats, date=None):
+        """Returns the cached values of the stats, skipping the misses"""
+        cache_keys = self.get_cache_keys(stats, date)
+        cached = self.cache.get_many(list(cache_keys.values()))
+        return dict((stat, cached[cache_key])
+                    for stat, cache_key in cache_keys.items()
+                    if cache_key in cached)
+
+    def get_cached_range(self, stat, dates):
+        """Returns the cached values of the days, skipping the misses"""
+        cache_keys = dict((date, stat._get_cache_key('history', date))
+                          for date in dates)
+        cached = self.cache.get_many(list(cache_keys.values()))
+        return dict((date, cached[cache_key])
+                    for date, cache_key in cache_keys.items()
+                    if cache_key in cached)
+
+    def get_many(self, stats, date=None):
+        values = self.get_cached(stats, date)
+        return dict((stat, values.get(stat, 0)) for stat in stats)
+
+    def set_many(self, values, date=None):
+        """
+        :param values: Mapping of stat to value
+        :type values: dict
+        """
+        cache_keys = self.get_cache_keys(values, date)
+        self.cache.set_many(
+            dict((cache_keys[stat], value) for stat, value in values.items()),
+            timeout=self.get_cache_timeout(self._get_value_type(date)))
+
+    def set_range(self, stat, values):
+        """
+        :param values: Mapping of date to value
+        :type values: dict
+        """
+        self.cache.set_many(
+            dict((stat._get_cache_key('history', date), value)
+                 for date, value in values.items()),
+            timeout=self.get_cache_timeout('history'))
+
+    def set(self, stat, value, date=None):
+        self.set_many({stat: value}, date)
+
+    def delete(self, stat, date=None):
+        value_type = self._get_value_type(date)
+        self.cache.delete(stat._get_cache_key(value_type, date))
+
+    def delete_many(self, rows):
+        """
+        :param rows: ``(stat, date)`` tuples, with a None date for the
+            totals
+        """
+        self.cache.delete_many([
+            stat._get_cache_key(self._get_value_type(date), date)
+            for stat, date in rows])
+
+    def get_stale_keys(self, stat):
+        """
+        Returns the cache keys of the stat values that may not include the
+        increments pending to be written into the database
+        """
+        return [stat._get_cache_key('total')]
+
+    def get_increments(self, rows):
+        """
+        Returns the increments of the history and total cache keys of the
+        rows
+        """
+        history = OrderedDict()
+        totals = OrderedDict()
+        for stat, date, value in rows:
+            cache_key = stat._get_cache_key('history', date)
+            history[cache_key] = history.get(cache_key, 0) + value
+            total_key = stat._get_cache_key('total')
+            totals[total_key] = totals.get(total_key, 0) + value
+        return history, totals
+
+    def incr_many(self, rows):
+        cache = self.cache
+        history, totals = self.get_increments(rows)
+        missing = {}
+
+        for cache_key, value in history.items():
+            try:
+                cache.incr(cache_key, value)
+            except ValueError:
+                missing[cache_key] = value
+
+        for total_key, value in totals.items():
+            try:
+                cache.incr(total_key, value)
+            except ValueError:
+                # Will get cached on get()
+                pass
+
+        if missing:
+            cache.set_many(missing,
+                           timeout=self.get_cache_timeout('history'))
+
+    def range(self, stat, date_start, date_end):
+        dates = self._get_dates(date_start, date_end)
+        values = self.get_cached_range(stat, dates)
+        return OrderedDict((date, values.get(date, 0)) for date in dates)
+
+    def get_generation(self, stat):
+        """
+        Returns the current generation of the stat, part of the cache keys
+        of the values derived from it so all of them are invalidated at once
+        by :meth:`invalidate`.
+        """
+        return get_generation(self.cache, stat._get_cache_key('generation'))
+
+    def get_generation_keys(self, stats):
+        generations = set()
+        for stat in stats:
+            generations.update(stat._get_generation_keys())
+        return list(generations)
+
+    def invalidate(self, stats):
+        """Drops the generations of the stats"""
+        self.cache.delete_many(self.get_generation_keys(stats))
+
+
+class HashCacheBackend(CacheBackend):
+    """
+    Stores all the days of a stat, and its total, in a single cache entry
+    so series are read with a single call and the cache holds a key per
+    stat instead of one per day.
+
+    On redis caches the entry is a hash and increments of the day and the
+    total are a single atomic call. On other caches it's a packed dict,
+    updated reading and writing it back, so concurrent writes to the same
+    stat can lose cache increments: use them for per process caches only.
+    """
+    total_field = 'total'
+
+    def get_client(self):
+        return get_redis_client(self.cache)
+
+    def _get_key(self, stat):
+        return stat._get_cache_key('hash')
+
+    def _get_field(self, date):
+        if isinstance(date, datetime):
+            date = date.date()
+        return self.total_field if date is None else date.isoformat()
+
+    def _get_timeout(self):
+        return self.get_cache_timeout('history')
+
+    def _to_int(self, value):
+        return int(value) if value is not None else None
+
+    def _get_packed(self, stats):
+        """Returns the packed dicts of the stats by cache key"""
+        cache_keys = set(self._get_key(stat) for stat in stats)
+        return self.cache.get_many(list(cache_keys))
+
+    def get_cached(self, stats, date=None):
+        field = self._get_field(date)
+        client = self.get_client()
+
+        if client is not None:
+            pipe = client.pipeline(transaction=False)
+            for stat in stats:
+                pipe.hget(self.cache.make_key(self._get_key(stat)), field)
+            values = zip(stats, pipe.execute())
+        else:
+            packed = self._get_packed(stats)
+            values = [(stat, packed.get(self._get_key(stat), {}).get(field))
+                      for stat in stats]
+
+        return dict((stat, self._to_int(value))
+                    for stat, value in values if value is not None)
+
+    def get_cached_range(self, stat, dates):
+        fields = [self._get_field(date) for date in dates]
+        client = self.get_client()
+
+        if client is not None:
+            values = client.hmget(self.cache.make_key(self._get_key(stat)),
+                                  fields)
+        else:
+            packed = self.cache.get(self._get_key(stat)) or {}
+            values = [packed.get(field) for field in fields]
+
+        return dict((date, self._to_int(value))
+                    for date, value in zip(dates, values)
+                    if value is not None)
+
+    def _set_fields(self, values):
+        """
+        :param values: ``(stat, field, value)`` tuples, ``None`` values
+            remove the field
+        """
+        timeout = self._get_timeout()
+        client = self.get_client()
+
+        if client is not None:
+            pipe = client.pipeline(transaction=False)
+            for stat, field, value in values:
+                key = self.cache.make_key(self._get_key(stat))
+                if value is None:
+                    pipe.hdel(key, field)
+                else:
+                    pipe.hset(key, field, value)
+                    if timeout:
+                        pipe.expire(key, int(timeout))
+            pipe.execute()
+            return
+
+        packed = self._get_packed(stat for stat, field, value in values)
+        for stat, field, value in values:
+            fields = packed.setdefault(self._get_key(stat), {})
+            if value is None:
+                fields.pop(field, None)
+            else:
+                fields[field] = value
+        self.cache.set_many(packed, timeout=timeout)
+
+    def set_many(self, values, date=None):
+        field = self._get_field(date)
+        self._set_fields([(stat, field, value)
+                          for stat, value in values.items()])
+
+    def set_range(self, stat, values):
+        self._set_fields([(stat, self._get_field(date), value)
+                          for date, value in values.items()])
+
+    def delete(self, stat, date=None):
+        self._set_fields([(stat, self._get_field(date), None)])
+
+    def delete_many(self, rows):
+        self._set_fields([(stat, self._get_field(date), None)
+                          for stat, date in rows])
+
+    def get_stale_keys(self, stat):
+        return [self._get_key(stat)]
+
+    def incr_many(self, rows):
+        # Increments by stat and day
+        increments = OrderedDict()
+        for stat, date, value in rows:
+            stat_increments = increments.setdefault(
+                self._get_key(stat), (stat, OrderedDict()))[1]
+            field = self._get_field(date)
+            stat_increments[field] = stat_increments.get(field, 0) + value
+
+        timeout = self._get_timeout()
+        client = self.get_client()
+
+        if client is not None:
+            pipe = client.pipeline(transaction=False)
+            for cache_key, (stat, stat_increments) in increments.items():
+                args = [int(timeout or 0)]
+                for field, value in stat_increments.items():
+                    args.extend((field, value))
+                pipe.eval(INCR_SCRIPT, 1, self.cache.make_key(cache_key),
+                          *args)
+            pipe.execute()
+            return
+
+        packed = self.cache.get_many(list(increments))
+        for cache_key, (stat, stat_increments) in increments.items():
+            fields = packed.setdefault(cache_key, {})
+            if self.total_field in fields:
+                fields[self.total_field] += sum(stat_increments.values())
+            for field, value in stat_increments.items():
+                fields[field] = fields.get(field, 0) + value
+        self.cache.set_many(packed, timeout=timeout)
+
+
+# Cache layers of the DefaultBackend by STATS2_CACHE_LAYOUT
+CACHE_LAYOUTS = {
+    'keys': CacheBackend,
+    'hash': HashCacheBackend,
+}
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict, OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q, Sum
+
+from django_stats2.backends.base import BaseBackend
+from django_stats2.models import (
+    ModelStat, ModelStatBucket, ModelStatRollup, ModelStatTotal)
+from django_stats2.utils import get_bucket_range, split_date_range
+
+
+class DatabaseBackend(BaseBackend):
+    """
+    Stores the values in :class:`django_stats2.models.ModelStat`, keeping
+    its rollups and totals up to date.
+    """
+    supports_buckets = True
+
+    def get_queryset(self, stat, date=None):
+        """Returns the rows to sum for the value of the stat"""
+        if date is None:
+            return ModelStatTotal.objects.filter(**stat._get_rollup_kwargs())
+        return ModelStat.objects.filter(**stat._get_manager_kwargs(date))
+
+    def get(self, stat, date=None):
+        stat_result = self.get_queryset(stat, date).aggregate(Sum('value'))
+        return stat_result.get('value__sum') or 0
+
+    def get_many(self, stats, date=None):
+        """
+        Returns the values of the model stats using one grouped query per
+        content type, global stats are retrieved one by one.
+        """
+        values = {}
+        by_content_type = defaultdict(list)
+        for stat in stats:
+            if stat.model_instance:
+                by_content_type[stat.content_type.pk].append(stat)
+            else:
+                values[stat] = self.get(stat, date)
+
+        for content_type_id, content_type_stats in by_content_type.items():
+            filters = {
+                'content_type_id': content_type_id,
+                'object_id__in': set(stat.object_id
+                                     for stat in content_type_stats),
+                'name__in': set(stat.name for stat in content_type_stats),
+            }
+            if date:
+                queryset = ModelStat.objects.filter(date=date, **filters)
+            else:
+                queryset = ModelStatTotal.objects.filter(**filters)
+
+            rows = queryset.order_by() \
+                .values('object_id', 'name').annotate(value=Sum('value'))
+            rows = dict(((row['object_id'], row['name']), row['value'])
+                        for row in rows)
+            values.update(
+                (stat, rows.get((stat.object_id, stat.name), 0))
+                for stat in content_type_stats)
+
+        return values
+
+    def incr_many(self, rows):
+        ModelStat.objects.incr_many(
+            stat._get_row_key(None)[:3] + (stat._get_bucket(date), value)
+            for stat, date, value in rows)
+
+    def set(self, stat, value, date=None):
+        ModelStat.objects.set_value(stat._get_row_key(date), value)
+
+    def range(self, stat, date_start, date_end):
+        rows = ModelStat.objects.filter(
+            date__gte=date_start,
+            date__lte=date_end,
+            **stat._get_manager_kwargs()
+        ).order_by().values('date').annotate(value=Sum('value'))
+        values = dict((row['date'], row['value']) for row in rows)
+        return OrderedDict((date, values.get(date, 0))
+                           for date in self._get_dates(date_start, date_end))
+
+    def buckets(self, stat, date_start, date_end):
+        buckets = get_bucket_range(date_start, date_end, stat.granularity)
+        rows = ModelStatBucket.objects.filter(
+            timestamp__gte=buckets[0],
+            timestamp__lte=buckets[-1],
+            **stat._get_rollup_kwargs()
+        ).order_by().values('timestamp').annotate(value=Sum('value'))
+        values = dict((row['timestamp'], row['value']) for row in rows)
+        return OrderedDict((bucket, values.get(bucket, 0))
+                           for bucket in buckets)
+
+    def between(self, stat, date_start, date_end):
+        """
+        Sums the full years and months of the range from the rollups and
+        only the remaining days from the daily stats.
+        """
+        days, months, years = split_date_range(date_start, date_end)
+        value = 0
+
+        if days:
+            stat_result = ModelStat.objects.filter(
+                reduce(or_, (Q(date__gte=start, date__lte=end)
+                             for start, end in days)),
+                **stat._get_manager_kwargs()
+            ).aggregate(Sum('value'))
+            value += stat_result.get('value__sum') or 0
+
+        if months or years:
+            stat_result = ModelStatRollup.objects.filter(
+                Q(period=ModelStatRollup.PERIOD_MONTH, date__in=months) |
+                Q(period=ModelStatRollup.PERIOD_YEAR, date__in=years),
+                **stat._get_rollup_kwargs()
+            ).aggregate(Sum('value'))
+            value += stat_result.get('value__sum') or 0
+
+        return value
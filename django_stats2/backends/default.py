@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+import time
+from collections import OrderedDict
+from timeit import default_timer
+
+from django_stats2 import settings as stats2_settings
+from django_stats2 import signals, writebehind
+from django_stats2.backends.base import BaseBackend
+from django_stats2.backends.cache import CACHE_LAYOUTS
+from django_stats2.backends.db import DatabaseBackend
+from django_stats2.local import LocalCache
+
+
+# Seconds between the checks of a value locked by another process
+MISS_LOCK_POLL = 0.05
+
+
+def get_between_value(entry):
+    """
+    Returns the value of a cached between entry, and whether it can be
+    computed again early (stored with the time it took and its expiration)
+    """
+    if isinstance(entry, tuple):
+        return entry[0], bool(stats2_settings.BETWEEN_EARLY_RECOMPUTE)
+    return entry, False
+
+
+class DefaultBackend(BaseBackend):
+    """
+    Stores the values in the cache, the database or both as set by the
+    ``STATS2_USE_CACHE``, ``STATS2_DDBB_DIRECT_INSERT`` and
+    ``STATS2_WRITE_BEHIND`` settings, with the cache working as a
+    read-through layer in front of the database.
+
+    Options:
+
+    - ``LAYOUT``: Layout of the values in the cache, ``keys`` for a key per
+      day (:class:`django_stats2.backends.cache.CacheBackend`) or ``hash``
+      for a single entry per stat
+      (:class:`django_stats2.backends.cache.HashCacheBackend`). Defaults to
+      ``STATS2_CACHE_LAYOUT``.
+    - ``CACHE``: Alias of the cache in ``settings.CACHES``.
+
+    The stats listed in ``STATS2_LOCAL_CACHE`` are also kept for a few
+    seconds in an in-process LRU, in front of the cache.
+    """
+    supports_buckets = True
+
+    def __init__(self, alias='default', **options):
+        super(DefaultBackend, self).__init__(alias, **options)
+        layout = options.get('LAYOUT', stats2_settings.CACHE_LAYOUT)
+        self.cache_backend = CACHE_LAYOUTS[layout](alias, **options)
+        self.ddbb_backend = DatabaseBackend(alias)
+        self.local_cache = LocalCache(stats2_settings.LOCAL_CACHE_SIZE)
+
+    def _read_ddbb(self, value_type, values, method, *args):
+        """
+        Calls the method of the database backend sending
+        :data:`django_stats2.signals.ddbb_read`.
+
+        :param values: Number of values read
+        """
+        start = default_timer()
+        result = getattr(self.ddbb_backend, method)(*args)
+        signals.ddbb_read.send(sender=self.__class__, value_type=value_type,
+                               values=values,
+                               duration=default_timer() - start)
+        return result
+
+    def _write_ddbb(self, rows, method, *args):
+        """
+        Calls the method of the database backend sending
+        :data:`django_stats2.signals.ddbb_write`.
+        """
+        start = default_timer()
+        getattr(self.ddbb_backend, method)(*args)
+        signals.ddbb_write.send(sender=self.__class__, rows=rows,
+                                duration=default_timer() - start)
+
+    def _cache_read(self, value_type, hits, misses):
+        signals.cache_read.send(sender=self.__class__, value_type=value_type,
+                                hits=hits, misses=misses)
+
+    def _wait(self, read, done):
+        """
+        Calls ``read`` until ``done`` is true for its result, or for up to
+        ``STATS2_MISS_LOCK_WAIT`` seconds.
+        """
+        deadline = default_timer() + stats2_settings.MISS_LOCK_WAIT
+        while True:
+            time.sleep(MISS_LOCK_POLL)
+            result = read()
+            if done(result) or default_timer() >= deadline:
+                return result
+
+    def _lock_missing(self, cache_keys):
+        """
+        Locks the missing cache keys so only one process reads each of them
+        from the database.
+
+        :param cache_keys: Mapping of the missing items to their cache key
+        :returns: Locked items and items locked by other processes
+        :rtype: tuple
+        """
+        if not stats2_settings.MISS_LOCK_TIMEOUT:
+            return list(cache_keys), []
+
+        locked, waiting = [], []
+        for item, cache_key in cache_keys.items():
+            if self.cache_backend.lock(cache_key):
+                locked.append(item)
+            else:
+                waiting.append(item)
+        return locked, waiting
+
+    def get_local(self, stats, date=None):
+        """
+        Looks up the stats listed in ``STATS2_LOCAL_CACHE`` in the
+        in-process cache.
+
+        :returns: Mapping of the stats found to their value, the rest of
+            the stats, and the cache keys of the missing listed ones to pass
+            to :meth:`set_local` once retrieved
+        :rtype: tuple
+        """
+        local_ttls = stats2_settings.LOCAL_CACHE
+        value_type = 'history' if date else 'total'
+        values = {}
+        local_keys = {}
+        remote = []
+        for stat in stats:
+            if stat.name in local_ttls:
+                cache_key = stat._get_cache_key(value_type, date)
+                value = self.local_cache.get(cache_key)
+                if value is not None:
+                    values[stat] = value
+                    continue
+                local_keys[stat] = cache_key
+            remote.append(stat)
+        return values, remote, local_keys
+
+    def set_local(self, values, local_keys):
+        local_ttls = stats2_settings.LOCAL_CACHE
+        for stat, cache_key in local_keys.items():
+            if stat in values:
+                self.local_cache.set(cache_key, values[stat],
+                                     local_ttls[stat.name])
+
+    def get_many(self, stats, date=None):
+        if not stats2_settings.LOCAL_CACHE:
+            return self._get_many(stats, date)
+
+        values, remote, local_keys = self.get_local(stats, date)
+        if remote:
+            remote_values = self._get_many(remote, date)
+            values.update(remote_values)
+            self.set_local(remote_values, local_keys)
+        return values
+
+    def clear_local_cache(self, rows):
+        """
+        Drops the in-process cached totals, and days, of the stats written
+        by this process.
+
+        :param rows: ``(stat, date)`` tuples, with a None date for the
+            stats set without one
+        """
+        local_ttls = stats2_settings.LOCAL_CACHE
+        if not local_ttls:
+            return
+
+        cache_keys = []
+        for stat, date in rows:
+            if stat.name in local_ttls:
+                cache_keys.append(stat._get_cache_key('total'))
+                if date is not None:
+                    cache_keys.append(stat._get_cache_key('history', date))
+        self.local_cache.delete_many(cache_keys)
+
+    def _get_many(self, stats, date=None):
+        value_type = 'history' if date else 'total'
+        if not stats2_settings.USE_CACHE:
+            return self._read_ddbb(value_type, len(stats), 'get_many',
+                                   stats, date)
+
+        values = self.cache_backend.get_cached(stats, date)
+
+        # If we don't have the cache values we retrieve them from the ddbb
+        missing = [stat for stat in stats if stat not in values]
+        self._cache_read(value_type, len(values), len(missing))
+        if not missing:
+            return values
+
+        cache_keys = OrderedDict(
+            (stat, stat._get_cache_key(value_type, date))
+            for stat in missing)
+        locked, waiting = self._lock_missing(cache_keys)
+        missing = list(locked)
+        if waiting:
+            # Being read by other processes
+            values.update(self._wait(
+                lambda: self.cache_backend.get_cached(waiting, date),
+                lambda found: len(found) == len(waiting)))
+            missing.extend(stat for stat in waiting if stat not in values)
+
+        try:
+            if missing:
+                ddbb_values = self._read_ddbb(value_type, len(missing),
+                                              'get_many', missing, date)
+                values.update(ddbb_values)
+
+                # Store in cache for future access
+                self.cache_backend.set_many(ddbb_values, date)
+        finally:
+            if stats2_settings.MISS_LOCK_TIMEOUT and locked:
+                self.cache_backend.unlock(
+                    [cache_keys[stat] for stat in locked])
+
+        return values
+
+    def _record_delta(self, stat, date, value):
+        """Keeps track of the increment to write it on the next flush"""
+        content_type_id, object_id, name, day = stat._get_row_key(None)
+        # Removed on flush, computed again from the database
+        stale_keys = self.cache_backend.get_stale_keys(stat)
+        stale_keys.extend(stat._get_generation_keys())
+
+        writebehind.record(
+            self.cache_backend.cache,
+            content_type_id=content_type_id,
+            object_id=object_id,
+            name=name,
+            date=stat._get_bucket(date),
+            value=value,
+            cache_keys=stale_keys)
+
+    def incr_many(self, rows):
+        rows = list(rows)
+        self.clear_local_cache((stat, date) for stat, date, value in rows)
+
+        if stats2_settings.USE_CACHE:
+            self.cache_backend.incr_many(rows)
+
+        if stats2_settings.DDBB_DIRECT_INSERT:
+            self._write_ddbb(len(rows), 'incr_many', rows)
+        elif stats2_settings.WRITE_BEHIND:
+            for stat, date, value in rows:
+                self._record_delta(stat, date, value)
+
+        if stats2_settings.USE_CACHE:
+            # Once the database is updated, so derived values don't get
+            # cached again with the old values
+            self.cache_backend.invalidate(stat for stat, date, value in rows)
+
+    def set(self, stat, value, date=None):
+        self.clear_local_cache([(stat, date)])
+        if stats2_settings.USE_CACHE:
+            self.cache_backend.set(stat, value, date)
+
+        if stats2_settings.DDBB_DIRECT_INSERT:
+            self._write_ddbb(1, 'set', stat, value, date)
+
+        if stats2_settings.USE_CACHE:
+            self.cache_backend.invalidate([stat])
+
+            # Delete cache for this totals if a specified date is modified
+            # and database direct insert is present
+            if date and stats2_settings.DDBB_DIRECT_INSERT:
+                self.cache_backend.delete(stat)
+
+    def store(self, stat, value, date):
+        self.clear_local_cache([(stat, date)])
+        self._write_ddbb(1, 'set', stat, value, date)
+        if stats2_settings.USE_CACHE:
+            self.cache_backend.invalidate([stat])
+
+    def clear_cache(self, rows):
+        stats = OrderedDict()
+        for stat, date in rows:
+            stats.setdefault(stat._get_row_key(None)[:3], stat)
+        rows = [(stat, None) for stat in stats.values()] + list(rows)
+
+        self.clear_local_cache(rows)
+        if not stats2_settings.USE_CACHE:
+            return
+
+        self.cache_backend.delete_many(rows)
+        self.cache_backend.invalidate(stats.values())
+
+    def warm_cache(self, values, date=None):
+        if not stats2_settings.USE_CACHE:
+            return
+
+        # Cached values may include increments not written into the
+        # database yet, only the missing ones are set
+        cached = self.cache_backend.get_cached(list(values), date)
+        self.cache_backend.set_many(
+            dict((stat, value) for stat, value in values.items()
+                 if stat not in cached), date)
+
+    def range(self, stat, date_start, date_end):
+        dates = self._get_dates(date_start, date_end)
+        if not stats2_settings.USE_CACHE:
+            return self._read_ddbb('history', len(dates), 'range',
+                                   stat, date_start, date_end)
+
+        values = self.cache_backend.get_cached_range(stat, dates)
+
+        missing = [date for date in dates if date not in values]
+        self._cache_read('history', len(values), len(missing))
+        if missing:
+            # One query for the whole range of missing days
+            ddbb_values = self._read_ddbb('history', len(missing), 'range',
+                                          stat, missing[0], missing[-1])
+            missing_values = dict((date, ddbb_values[date])
+                                  for date in missing)
+            values.update(missing_values)
+
+            # Store in cache for future access
+            self.cache_backend.set_range(stat, missing_values)
+
+        return OrderedDict((date, values[date]) for date in dates)
+
+    def between(self, stat, date_start, date_end):
+        if not stats2_settings.USE_CACHE:
+            return self._read_ddbb('between', 1, 'between',
+                                   stat, date_start, date_end)
+
+        cache = self.cache_backend.cache
+        cache_key = stat._get_cache_key(
+            'between', date_start, date_end,
+            generation=self.cache_backend.get_generation(stat))
+        entry = cache.get(cache_key)
+        self._cache_read('between', int(entry is not None),
+                         int(entry is None))
+
+        locked = False
+        if entry is not None:
+            value, expensive = get_between_value(entry)
+            if not expensive or not self._recompute_early(entry):
+                return value
+            # Refreshed before it expires by a single process, the rest keep
+            # reading the current value
+            if stats2_settings.MISS_LOCK_TIMEOUT:
+                locked = self.cache_backend.lock(cache_key)
+                if not locked:
+                    return value
+        else:
+            # If we don't have the cache value we retrieve it from the ddbb
+            locked = bool(self._lock_missing({stat: cache_key})[0])
+            if stats2_settings.MISS_LOCK_TIMEOUT and not locked:
+                # Being read by another process
+                entry = self._wait(lambda: cache.get(cache_key),
+                                   lambda found: found is not None)
+                if entry is not None:
+                    return get_between_value(entry)[0]
+
+        try:
+            start = default_timer()
+            value = self._read_ddbb('between', 1, 'between',
+                                    stat, date_start, date_end)
+
+            # Store in cache for future access
+            timeout = self.cache_backend.get_cache_timeout('between')
+            if stats2_settings.BETWEEN_EARLY_RECOMPUTE and timeout:
+                # With the time it took and when it expires, for XFetch
+                cache.set(cache_key, (value, default_timer() - start,
+                                      time.time() + timeout),
+                          timeout=timeout)
+            else:
+                cache.set(cache_key, value, timeout=timeout)
+        finally:
+            if stats2_settings.MISS_LOCK_TIMEOUT and locked:
+                self.cache_backend.unlock([cache_key])
+
+        return value
+
+    def _recompute_early(self, entry):
+        """
+        XFetch: the closer to the expiration and the longer it takes to
+        compute the value, the likelier it is to be computed again
+        """
+        value, delta, expiry = entry
+        beta = stats2_settings.BETWEEN_EARLY_RECOMPUTE
+        return time.time() - delta * beta * \
+            math.log(1 - random.random()) >= expiry
+
+    def buckets(self, stat, date_start, date_end):
+        if not stats2_settings.USE_CACHE:
+            return self._read_ddbb('buckets', 1, 'buckets',
+                                   stat, date_start, date_end)
+
+        cache = self.cache_backend.cache
+        cache_key = stat._get_cache_key(
+            'buckets', date_start, date_end,
+            generation=self.cache_backend.get_generation(stat))
+        buckets = cache.get(cache_key)
+        self._cache_read('buckets', int(buckets is not None),
+                         int(buckets is None))
+
+        if buckets is None:
+            buckets = self._read_ddbb('buckets', 1, 'buckets',
+                                      stat, date_start, date_end)
+            cache.set(cache_key, buckets,
+                      timeout=self.cache_backend.get_cache_timeout('buckets'))
+
+        return buckets
+
+    def flush(self, batch_size=None):
+        # The deltas are journaled in the cache of the backend
+        return writebehind.flush(batch_size=batch_size,
+                                 cache=self.cache_backend.cache)
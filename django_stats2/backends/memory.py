@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from django_stats2.backends.base import DictBackend
+
+
+class MemoryBackend(DictBackend):
+    """
+    Keeps the values in a dict of the running process: the fastest store,
+    but values are not shared between processes nor survive a restart.
+    Useful for tests and for stats only needed while the process lives.
+    """
+    def __init__(self, alias='default', **options):
+        super(MemoryBackend, self).__init__(alias, **options)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def _get_key(self, stat):
+        return stat._get_row_key(None)[:3]
+
+    def _get_fields(self, stat, fields):
+        values = self.values.get(self._get_key(stat), {})
+        return [values.get(field) for field in fields]
+
+    def get_many(self, stats, date=None):
+        field = self._get_field(date)
+        return dict((stat, self._get_fields(stat, [field])[0] or 0)
+                    for stat in stats)
+
+    def incr_many(self, rows):
+        with self.lock:
+            for stat, date, value in rows:
+                values = self.values.setdefault(self._get_key(stat), {})
+                field = self._get_field(date)
+                values[field] = values.get(field, 0) + value
+                values[self.total_field] = \
+                    values.get(self.total_field, 0) + value
+                bucket = self._get_bucket_field(date)
+                if bucket is not None:
+                    values[bucket] = values.get(bucket, 0) + value
+
+    def set(self, stat, value, date=None):
+        with self.lock:
+            values = self.values.setdefault(self._get_key(stat), {})
+            field = self._get_field(date)
+            if date is not None:
+                values[self.total_field] = \
+                    values.get(self.total_field, 0) + value - \
+                    values.get(field, 0)
+            values[field] = value
+
+    def clear(self):
+        """Removes all the stored values"""
+        with self.lock:
+            self.values = {}
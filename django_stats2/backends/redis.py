@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from django_stats2.backends.base import DictBackend
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class RedisHashBackend(DictBackend):
+    """
+    Stores every stat in a hash of a Redis compatible server, with a field
+    per day plus one for the total, and one per minute or hour for the stats
+    with a finer granularity. Increments of the day and the total are
+    sent in a single pipeline.
+
+    Options:
+
+    - ``CLIENT``: The client, or the dotted path to a callable returning it.
+      Any object with the ``redis.StrictRedis`` hash and pipeline methods
+      can be used.
+    - ``URL``: Server URL to create a ``redis.StrictRedis`` client, which
+      requires the ``redis`` package.
+    """
+    def __init__(self, alias='default', **options):
+        super(RedisHashBackend, self).__init__(alias, **options)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._get_client()
+        return self._client
+
+    def _get_client(self):
+        client = self.options.get('CLIENT')
+        if isinstance(client, string_types):
+            return import_string(client)()
+        if client is not None:
+            return client
+
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                'django_stats2: The redis package is required to use the '
+                '"{}" stats backend with an URL.'.format(self.alias))
+        return redis.StrictRedis.from_url(self.options.get('URL'))
+
+    def _get_key(self, stat):
+        return stat._get_cache_key('hash')
+
+    def _to_int(self, value):
+        return int(value) if value is not None else None
+
+    def _get_fields(self, stat, fields):
+        return [self._to_int(value)
+                for value in self.client.hmget(self._get_key(stat), fields)]
+
+    def get_many(self, stats, date=None):
+        field = self._get_field(date)
+        pipe = self.client.pipeline(transaction=False)
+        for stat in stats:
+            pipe.hget(self._get_key(stat), field)
+        return dict((stat, self._to_int(value) or 0)
+                    for stat, value in zip(stats, pipe.execute()))
+
+    def incr_many(self, rows):
+        pipe = self.client.pipeline(transaction=False)
+        for stat, date, value in rows:
+            key = self._get_key(stat)
+            pipe.hincrby(key, self._get_field(date), value)
+            pipe.hincrby(key, self.total_field, value)
+            bucket = self._get_bucket_field(date)
+            if bucket is not None:
+                pipe.hincrby(key, bucket, value)
+        pipe.execute()
+
+    def set(self, stat, value, date=None):
+        key = self._get_key(stat)
+        field = self._get_field(date)
+
+        if date is None:
+            self.client.hset(key, field, value)
+            return
+
+        # Added as a difference so increments done in the meantime are kept
+        # in both the day and the total
+        delta = value - (self._to_int(self.client.hget(key, field)) or 0)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(key, field, delta)
+        pipe.hincrby(key, self.total_field, delta)
+        pipe.execute()
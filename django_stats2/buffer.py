@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+In-process buffer that coalesces the stat increments done during a request
+or a task and writes them all at once when it ends.
+
+Increments to the same stat, object and date are summed up so every one of
+them costs a single cache increment and a single row on one bulk write to
+its backend, no matter how many times it was hit.
+"""
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+try:
+    # Local to the running task on async code, to the thread otherwise
+    from asgiref.local import Local
+except ImportError:
+    from threading import local as Local
+
+
+_local = Local()
+
+# Number of blocks open in any thread or task, increments skip looking up
+# the local buffer (slow for asgiref locals) while there are none
+_open_blocks = 0
+_open_blocks_lock = threading.Lock()
+
+
+class StatsBuffer(object):
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    def add(self, stat, date, value):
+        # The date is the bucket for the stats with a finer granularity
+        row_key = stat._get_row_key(None)[:3] + (date, )
+        if row_key in self.entries:
+            stat, current = self.entries[row_key]
+            value += current
+        self.entries[row_key] = (stat, value)
+
+    def pop_rows(self, stat=None):
+        """
+        Empties the buffer and returns its increments grouped by backend
+
+        :param stat: Only remove and return the increments of this stat
+        :returns: Mapping of backend to ``(stat, date, value)`` tuples
+        :rtype: :class:`collections.OrderedDict`
+        """
+        if stat is None:
+            entries = self.entries
+            self.entries = OrderedDict()
+        else:
+            stat_key = stat._get_row_key(None)[:3]
+            entries = OrderedDict(
+                (row_key, entry) for row_key, entry in self.entries.items()
+                if row_key[:3] == stat_key)
+            for row_key in entries:
+                del self.entries[row_key]
+
+        by_backend = OrderedDict()
+        for row_key, (stat, value) in entries.items():
+            if value:
+                by_backend.setdefault(stat.backend, []).append(
+                    (stat, row_key[3], value))
+        return by_backend
+
+    def flush(self, stat=None):
+        """
+        Writes the buffered increments and empties the buffer
+
+        :param stat: Only write the increments of this stat
+        """
+        # One bulk write per backend
+        for backend, rows in self.pop_rows(stat).items():
+            backend.incr_many(rows)
+
+
+def get_buffer():
+    """Returns the active buffer of the current thread or task, if any"""
+    if not _open_blocks:
+        return None
+
+    buffers = getattr(_local, 'buffers', None)
+    if buffers:
+        return buffers[0]
+    return None
+
+
+def add_to_buffer(stat, date, value):
+    """
+    Adds the increment to the active buffer.
+
+    :returns: False if there is no active buffer and the increment must be
+        written straight away
+    :rtype: bool
+    """
+    stats_buffer = get_buffer()
+    if stats_buffer is None:
+        return False
+
+    stats_buffer.add(stat, date, value)
+    return True
+
+
+def flush_stat(stat):
+    """
+    Writes the buffered increments of the stat, if any, so values set
+    afterwards are not increased when the buffer is written.
+    """
+    stats_buffer = get_buffer()
+    if stats_buffer is not None:
+        stats_buffer.flush(stat)
+
+
+class buffered_stats(object):
+    """
+    Context manager (and decorator) that buffers all the stat increments done
+    inside it and writes them when leaving the outermost block.
+
+    ::
+
+        with buffered_stats():
+            note.reads.incr()
+            Stat(name='total_visits').incr()
+    """
+    def __enter__(self):
+        global _open_blocks
+        with _open_blocks_lock:
+            _open_blocks += 1
+
+        # Replaced instead of modified so it's never shared between tasks
+        buffers = getattr(_local, 'buffers', ())
+
+        if buffers:
+            # Nested blocks join the outermost buffer
+            _local.buffers = buffers + (buffers[0], )
+        else:
+            _local.buffers = (StatsBuffer(), )
+        return _local.buffers[0]
+
+    def _pop(self):
+        """Leaves the block, returns the buffer if it must be written"""
+        global _open_blocks
+        with _open_blocks_lock:
+            _open_blocks -= 1
+
+        buffers = _local.buffers
+        _local.buffers = buffers[:-1]
+        if len(buffers) == 1:
+            return buffers[0]
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stats_buffer = self._pop()
+        if stats_buffer is not None:
+            stats_buffer.flush()
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return inner
@@ -1,13 +1,39 @@
 # -*- coding: utf-8 -*-
+from django.contrib.contenttypes.models import ContentType
+
 from django_stats2.objects import Stat
+from django_stats2.unique import UniqueStat
 
 
 class StatField(object):
     """
-    The main field object to use with django models that works with
-    :class:`django_stats2.mixins.StatsMixin` to create the appropiate
-    :class:`django_stats2.objects.Stat` instances for every field in the model.
+    The main field object to use with django models. Works as a descriptor
+    that creates the appropiate :class:`django_stats2.objects.Stat` the first
+    time the attribute is accessed on a model instance, so loading models
+    with stat fields is as cheap as loading models without them.
     """
+    stat_class = Stat
+
+    def __init__(self):
+        self.name = None
+        # Cache key prefix for every model class using this field
+        self._prefixes = {}
+
+    def contribute_to_class(self, cls, name):
+        """Called by django when the model class is created"""
+        self.name = name
+        cls._stat_fields = tuple(getattr(cls, '_stat_fields', ())) + (name, )
+        setattr(cls, name, self)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        stat = self.prepare(self.name, instance)
+        # Stored in the instance so next accesses skip the descriptor
+        instance.__dict__[self.name] = stat
+        return stat
+
     def prepare(self, name, model_instance):
         """
         Creates a new :class:`django_stats2.objects.Stat`.
@@ -18,7 +44,22 @@ class StatField(object):
         :type model: :class:`django.db.models.Model`
         :rtype: :class:`django_stats2.objects.Stat`
         """
-        return Stat(
+        model = type(model_instance)
+        if model not in self._prefixes:
+            self._prefixes[model] = model.__name__.lower()
+
+        return self.stat_class(
             name=name,
             model_instance=model_instance,
+            # Shared by all the instances through the content types cache
+            content_type=ContentType.objects.get_for_model(model),
+            prefix=self._prefixes[model],
         )
+
+
+class UniqueStatField(StatField):
+    """
+    Counts distinct identifiers per day, see
+    :class:`django_stats2.unique.UniqueStat`.
+    """
+    stat_class = UniqueStat
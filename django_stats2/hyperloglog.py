@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+HyperLogLog sketches to estimate the number of distinct identifiers.
+
+A sketch is a fixed array of ``2 ** precision`` one byte registers, so its
+size doesn't depend on the number of identifiers added (4 KB with the
+default precision, for a standard error of ~1.6%). Sketches are merged
+taking the maximum of every register, which gives the sketch of the union.
+"""
+import hashlib
+import math
+
+from django.utils.encoding import force_bytes
+
+from django_stats2 import settings as stats2_settings
+
+
+class HyperLogLog(object):
+    def __init__(self, registers=None, precision=None):
+        """
+        :param registers: Registers of a stored sketch, as returned by
+            :meth:`to_bytes`
+        :param precision: Number of bits of the register index, defaults to
+            ``STATS2_UNIQUE_PRECISION``
+        :type precision: int
+        """
+        if registers is not None:
+            self.registers = bytearray(registers)
+            self.precision = len(self.registers).bit_length() - 1
+        else:
+            self.precision = precision or stats2_settings.UNIQUE_PRECISION
+            self.registers = bytearray(1 << self.precision)
+
+    def add(self, identifier):
+        """
+        :returns: Whether the sketch changed
+        :rtype: bool
+        """
+        # 64 bits hash: the first bits select the register, the rest
+        # gives the rank (position of the first 1 bit)
+        value = int(hashlib.sha1(force_bytes(identifier)).hexdigest()[:16],
+                    16)
+        bits = 64 - self.precision
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        """Adds the identifiers of the other sketch to this one"""
+        if len(other.registers) != len(self.registers):
+            raise ValueError("Can't merge sketches of different precision.")
+
+        self.registers = bytearray(
+            max(register, other_register)
+            for register, other_register in zip(self.registers,
+                                                other.registers))
+
+    def count(self):
+        """
+        :returns: Estimated number of distinct identifiers added
+        :rtype: int
+        """
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(
+            m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -register
+                                       for register in self.registers)
+
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting
+            estimate = m * math.log(float(m) / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
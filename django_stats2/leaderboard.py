@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Rankings of the model instances with the highest values of a stat.
+
+:func:`top` runs a single grouped and ordered query, cached until any
+instance of the model gets a new value for the stat. The optional heavy
+hitters tracker, fed by ``Stat.incr()``, keeps an approximate ranking in
+memory so near real time rankings don't need any query at all.
+"""
+import threading
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Sum
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.models import ModelStat, ModelStatTotal
+from django_stats2.utils import get_cache, get_generation
+
+
+key_format = {
+    'top': '{cache_key_prefix}:{prefix}:{name}:top:{limit}:{date}_{date_end}:{generation}',  # noqa
+    'generation': '{cache_key_prefix}:{prefix}:{name}:top:generation',
+}
+
+# Heavy hitters trackers by (content_type_id, name)
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+class HeavyHitters(object):
+    """
+    Space-Saving counters: keeps track of the ``capacity`` keys with the
+    highest counts using constant memory.
+
+    A key that was not tracked replaces the one with the lowest count and
+    inherits that count, which is kept as its maximum ``error``. Any key
+    whose count is above ``total / capacity`` is guaranteed to be tracked.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # key -> (count, error)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, value=1):
+        with self.lock:
+            if key in self.counters:
+                count, error = self.counters[key]
+                self.counters[key] = (count + value, error)
+            elif len(self.counters) < self.capacity:
+                self.counters[key] = (value, 0)
+            else:
+                min_key = min(self.counters,
+                              key=lambda item: self.counters[item][0])
+                min_count = self.counters.pop(min_key)[0]
+                self.counters[key] = (min_count + value, min_count)
+
+    def top(self, n):
+        """
+        :returns: List of ``(key, count, error)`` tuples, highest counts
+            first
+        :rtype: list
+        """
+        with self.lock:
+            items = sorted(self.counters.items(),
+                           key=lambda item: (-item[1][0], item[0]))
+        return [(key, count, error) for key, (count, error) in items[:n]]
+
+
+def get_tracker(content_type_id, name):
+    """Returns the heavy hitters tracker of the stat, if any"""
+    return _trackers.get((content_type_id, name))
+
+
+def track(stat, value):
+    """Feeds the heavy hitters tracker of the stat with an increment"""
+    capacity = stats2_settings.HEAVY_HITTERS_CAPACITY
+    if not capacity or value <= 0 or not stat.model_instance:
+        return
+
+    key = (stat.content_type.pk, stat.name)
+    tracker = _trackers.get(key)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.setdefault(key, HeavyHitters(capacity))
+
+    tracker.add(stat.object_id, value)
+
+
+def get_generation_key(prefix, name):
+    """
+    Returns the cache key of the generation of the rankings of a stat,
+    deleted on every write of the stat for any instance of the model.
+    """
+    return key_format['generation'].format(
+        cache_key_prefix=stats2_settings.CACHE_PREFIX,
+        prefix=prefix,
+        name=name)
+
+
+def _get_ddbb_top(content_type, name, n, date_start=None, date_end=None):
+    if date_start:
+        rows = ModelStat.objects.filter(
+            content_type_id=content_type.pk,
+            name=name,
+            date__gte=date_start,
+            date__lte=date_end,
+        ).order_by().values('object_id').annotate(value=Sum('value'))
+    else:
+        rows = ModelStatTotal.objects.filter(
+            content_type_id=content_type.pk,
+            name=name,
+        ).order_by().values('object_id').annotate(value=Sum('value'))
+
+    rows = rows.order_by('-value', 'object_id')[:n]
+    return [(row['object_id'], row['value']) for row in rows]
+
+
+def top(model, name, n=10, date_start=None, date_end=None,
+        approximate=False):
+    """
+    Returns the ``n`` instances of the model with the highest values of the
+    stat, all time or between both dates (included).
+
+    ::
+
+        top(Note, 'reads', 20, date.today() - timedelta(days=6), date.today())
+
+    :param model: Model class with the stat field
+    :param name: Name of the stat
+    :type name: string
+    :param approximate: Rank using the in-memory heavy hitters tracker
+        instead of the database. Values are counted since the process
+        started (dates are ignored) and may be overestimated.
+    :type approximate: bool
+    :returns: List of ``(instance, value)`` tuples, highest values first
+    :rtype: list
+    """
+    if isinstance(date_start, datetime):
+        date_start = date_start.date()
+    if isinstance(date_end, datetime):
+        date_end = date_end.date()
+
+    assert (date_start is None) == (date_end is None), \
+        "Both dates must be provided."
+
+    content_type = ContentType.objects.get_for_model(model)
+
+    if approximate:
+        tracker = get_tracker(content_type.pk, name)
+        ranking = []
+        if tracker:
+            ranking = [(object_id, count)
+                       for object_id, count, error in tracker.top(n)]
+    elif stats2_settings.USE_CACHE:
+        cache = get_cache()
+        prefix = model.__name__.lower()
+        cache_key = key_format['top'].format(
+            cache_key_prefix=stats2_settings.CACHE_PREFIX,
+            prefix=prefix,
+            name=name,
+            limit=n,
+            date=date_start or '',
+            date_end=date_end or '',
+            generation=get_generation(cache,
+                                      get_generation_key(prefix, name)))
+        ranking = cache.get(cache_key)
+
+        if ranking is None:
+            ranking = _get_ddbb_top(content_type, name, n, date_start,
+                                    date_end)
+            cache.set(cache_key, ranking,
+                      timeout=stats2_settings.CACHE_TIMEOUT_TOP)
+    else:
+        ranking = _get_ddbb_top(content_type, name, n, date_start, date_end)
+
+    instances = model._default_manager.in_bulk(
+        [object_id for object_id, value in ranking])
+    return [(instances[object_id], value)
+            for object_id, value in ranking
+            if object_id in instances]
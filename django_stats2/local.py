@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+
+class LocalCache(object):
+    """
+    In-process LRU of values expiring after a time to live, in front of the
+    shared cache for the hottest stats. Thread safe.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        # Least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the value of the key, None if missing or expired"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < default_timer():
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        """
+        :param ttl: Seconds the value is kept for
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, default_timer() + ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
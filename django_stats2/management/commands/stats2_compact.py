@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.models import COMPACT_BATCH_SIZE, ModelStat
+
+
+class Command(BaseCommand):
+    help = 'Deletes the daily values of the stats older than their ' \
+           'retention (STATS2_RETENTION), keeping them in the monthly ' \
+           'rollups and the totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', dest='days', type=int, default=None,
+                            help='Retention of the stats not listed in '
+                                 'STATS2_RETENTION, kept forever if not set')
+        parser.add_argument('--stat', dest='stats', action='append',
+                            default=None,
+                            help='Compact only the stat with this name, '
+                                 'can be repeated')
+        parser.add_argument('--batch-size', dest='batch_size', type=int,
+                            default=COMPACT_BATCH_SIZE,
+                            help='Approximate number of rows deleted per '
+                                 'transaction')
+
+    def get_cutoff(self, days):
+        """Whole months older than the retention are compacted"""
+        return (timezone.now().date() - timedelta(days=days)).replace(day=1)
+
+    def handle(self, *args, **options):
+        stats = options['stats']
+        retention = stats2_settings.RETENTION
+
+        # Stats compacted up to every cutoff date
+        policies = {}
+        for name, days in retention.items():
+            if days is not None and (stats is None or name in stats):
+                policies.setdefault(self.get_cutoff(days), []).append(name)
+
+        deleted = 0
+        for cutoff, names in sorted(policies.items()):
+            deleted += ModelStat.objects.compact(
+                cutoff, names=names, batch_size=options['batch_size'])
+
+        if options['days'] is not None:
+            names = None
+            if stats is not None:
+                names = [name for name in stats if name not in retention]
+            if names is None or names:
+                deleted += ModelStat.objects.compact(
+                    self.get_cutoff(options['days']), names=names,
+                    exclude=list(retention),
+                    batch_size=options['batch_size'])
+
+        self.stdout.write('Compacted {} daily stat values.'.format(deleted))
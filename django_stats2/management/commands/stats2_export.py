@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from django_stats2 import transfer
+
+
+class Command(BaseCommand):
+    help = 'Streams the daily values of the stats as CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='format', default='csv',
+                            choices=transfer.FORMATS)
+        parser.add_argument('--output', dest='output', default=None,
+                            help='File to write to, stdout by default')
+        parser.add_argument('--stat', dest='stats', action='append',
+                            default=None,
+                            help='Export only the stat with this name, can '
+                                 'be repeated')
+        parser.add_argument('--date-start', dest='date_start', default=None,
+                            help='First day to export, YYYY-MM-DD')
+        parser.add_argument('--date-end', dest='date_end', default=None,
+                            help='Last day to export, YYYY-MM-DD')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                            default=transfer.EXPORT_CHUNK_SIZE,
+                            help='Rows fetched from the database at once')
+
+    def get_date(self, value):
+        if value is None:
+            return None
+        date = parse_date(value)
+        if date is None:
+            raise CommandError('Wrong date "{}".'.format(value))
+        return date
+
+    def handle(self, *args, **options):
+        rows = transfer.export_stats(
+            names=options['stats'],
+            date_start=self.get_date(options['date_start']),
+            date_end=self.get_date(options['date_end']),
+            chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                count = transfer.write_rows(rows, output, options['format'])
+            self.stdout.write('Exported {} daily stat values.'.format(count))
+        else:
+            transfer.write_rows(rows, self.stdout, options['format'])
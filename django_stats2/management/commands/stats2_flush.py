@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.backends import get_backends
+from django_stats2.models import ModelStatBucket
+
+
+class Command(BaseCommand):
+    help = 'Writes the pending increments of every stats backend into ' \
+           'its persistent storage and deletes the expired minute and ' \
+           'hour values'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', dest='batch_size', type=int,
+                            default=None,
+                            help='Number of pending deltas per query')
+
+    def handle(self, *args, **options):
+        flushed = sum(backend.flush(batch_size=options['batch_size'])
+                      for backend in get_backends())
+        self.stdout.write('Flushed {} stat deltas.'.format(flushed))
+
+        if stats2_settings.BUCKET_RETENTION is not None:
+            pruned = ModelStatBucket.objects.prune(
+                timezone.now() -
+                timedelta(days=stats2_settings.BUCKET_RETENTION))
+            self.stdout.write('Pruned {} stat buckets.'.format(pruned))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_stats2 import transfer
+
+
+class Command(BaseCommand):
+    help = 'Stores the daily values of the stats of a CSV or JSON lines ' \
+           'file, as written by stats2_export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input',
+                            help='File to read from, - for stdin')
+        parser.add_argument('--format', dest='format', default='csv',
+                            choices=transfer.FORMATS)
+        parser.add_argument('--add', dest='add', action='store_true',
+                            default=False,
+                            help='Add the values to the stored ones instead '
+                                 'of replacing them')
+        parser.add_argument('--batch-size', dest='batch_size', type=int,
+                            default=transfer.IMPORT_BATCH_SIZE,
+                            help='Rows written per transaction')
+
+    def import_rows(self, input, options):
+        rows = transfer.read_rows(input, options['format'])
+        try:
+            return transfer.import_stats(rows, add=options['add'],
+                                         batch_size=options['batch_size'])
+        except (KeyError, ValueError) as e:
+            raise CommandError('Wrong row: {}'.format(e))
+
+    def handle(self, *args, **options):
+        if options['input'] == '-':
+            count = self.import_rows(sys.stdin, options)
+        else:
+            with open(options['input']) as input:
+                count = self.import_rows(input, options)
+
+        self.stdout.write('Imported {} daily stat values.'.format(count))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_stats2.warm import WARM_BATCH_SIZE, warm_cache
+
+
+class Command(BaseCommand):
+    help = 'Caches the totals and the last days of the stats, read from ' \
+           'the database with a few grouped queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stat', dest='stats', action='append',
+                            default=None,
+                            help='Warm only the stat with this name, can be '
+                                 'repeated')
+        parser.add_argument('--model', dest='models', action='append',
+                            default=None,
+                            help='Warm only the stats of this model '
+                                 '(app_label.Model) and the global ones, '
+                                 'can be repeated')
+        parser.add_argument('--days', dest='days', type=int, default=7,
+                            help='Days of history cached, today included')
+        parser.add_argument('--batch-size', dest='batch_size', type=int,
+                            default=WARM_BATCH_SIZE,
+                            help='Number of stats read and cached at once')
+
+    def get_model(self, label):
+        try:
+            return apps.get_model(label)
+        except (LookupError, ValueError):
+            raise CommandError('Unknown model "{}".'.format(label))
+
+    def handle(self, *args, **options):
+        models = None
+        if options['models'] is not None:
+            models = [self.get_model(label) for label in options['models']]
+
+        count = warm_cache(names=options['stats'], models=models,
+                           days=options['days'],
+                           batch_size=options['batch_size'])
+        self.stdout.write('Warmed {} stats.'.format(count))
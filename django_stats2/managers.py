@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from django_stats2.models import ModelStat, ModelStatTotal
+from django_stats2.unique import UniqueStat
+
+try:
+    from django.db.models import OuterRef, Subquery
+except ImportError:
+    # Django < 1.11
+    OuterRef = Subquery = None
+
+
+# Name of the annotations of the stats given without an alias
+ANNOTATION_FORMAT = '{name}_value'
+
+
+def _to_date(date):
+    if isinstance(date, datetime):
+        return date.date()
+    return date
+
+
+class StatsQuerySet(models.QuerySet):
+    """
+    QuerySet of a model with :class:`django_stats2.fields.StatField` that
+    can annotate the stat values to filter and order by them in SQL.
+    """
+    def _get_stat_subquery(self, name, date=None, date_start=None,
+                           date_end=None):
+        content_type = ContentType.objects.get_for_model(self.model)
+        filters = {
+            'content_type_id': content_type.pk,
+            'object_id': OuterRef('pk'),
+            'name': name,
+        }
+
+        if date is not None:
+            queryset = ModelStat.objects.filter(date=_to_date(date),
+                                                **filters)
+        elif date_start is not None or date_end is not None:
+            if date_start is not None:
+                filters['date__gte'] = _to_date(date_start)
+            if date_end is not None:
+                filters['date__lte'] = _to_date(date_end)
+            queryset = ModelStat.objects.filter(**filters)
+        else:
+            queryset = ModelStatTotal.objects.filter(**filters)
+
+        # Sum of the shards of the stat, grouped by the outer object
+        queryset = queryset.order_by().values('object_id') \
+            .annotate(stat_value=Sum('value')).values('stat_value')
+        return Coalesce(
+            Subquery(queryset, output_field=models.BigIntegerField()), 0,
+            output_field=models.BigIntegerField())
+
+    def with_stats(self, *names, **kwargs):
+        """
+        Annotates the database values of the stats, their total or the sum
+        of the days of a date or range, as ``<name>_value``:
+
+            Note.objects.with_stats('reads').order_by('-reads_value')
+            Note.objects.with_stats('reads', date_start=date(2017, 1, 1)) \\
+                .filter(reads_value__gte=100)
+
+        Stats can be given an alias as keyword arguments:
+        ``with_stats(month_reads='reads', date_start=...)``.
+
+        Values written only to the cache and not flushed yet are not
+        included. Requires Django 1.11 or later.
+
+        :param date: Day of the values
+        :type date: datetime.date
+        :param date_start: First day of the values, inclusive
+        :type date_start: datetime.date
+        :param date_end: Last day of the values, inclusive
+        :type date_end: datetime.date
+        :rtype: :class:`StatsQuerySet`
+        :raises ValueError: With a name not of a counter stat field
+        """
+        if Subquery is None:
+            raise NotImplementedError(
+                'django_stats2: with_stats requires Django 1.11 or later.')
+
+        dates = dict((key, kwargs.pop(key, None))
+                     for key in ('date', 'date_start', 'date_end'))
+        stats = dict((ANNOTATION_FORMAT.format(name=name), name)
+                     for name in names)
+        stats.update(kwargs)
+
+        stat_fields = getattr(self.model, '_stat_fields', ())
+        for name in stats.values():
+            if name not in stat_fields:
+                raise ValueError(
+                    'django_stats2: {} has no "{}" stat field.'.format(
+                        self.model.__name__, name))
+            # Unique stats are stored as sketches, not as values to sum
+            if issubclass(getattr(self.model, name).stat_class, UniqueStat):
+                raise ValueError(
+                    'django_stats2: "{}" of {} is not a counter stat '
+                    'field.'.format(name, self.model.__name__))
+
+        return self.annotate(**dict(
+            (alias, self._get_stat_subquery(name, **dates))
+            for alias, name in stats.items()))
+
+
+class StatsManager(models.Manager.from_queryset(StatsQuerySet)):
+    """Manager providing :meth:`StatsQuerySet.with_stats`"""
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+In-process counters and timers of the stats internals, fed by the
+:mod:`django_stats2.signals` once :func:`connect` is called (on start up
+when ``STATS2_METRICS`` is enabled).
+
+The values are kept per process, every worker reports its own ones.
+"""
+import threading
+from collections import OrderedDict
+
+from django_stats2 import signals
+
+
+# Metrics by name: (type, help)
+METRICS = OrderedDict([
+    ('stats2_cache_hits_total',
+     ('counter', 'Values read from the cache.')),
+    ('stats2_cache_misses_total',
+     ('counter', 'Values missing in the cache.')),
+    ('stats2_ddbb_read_seconds',
+     ('summary', 'Reads of the values missing in the cache from the '
+                 'database.')),
+    ('stats2_ddbb_read_values_total',
+     ('counter', 'Values read from the database.')),
+    ('stats2_ddbb_write_seconds',
+     ('summary', 'Writes of increments and values into the database.')),
+    ('stats2_ddbb_write_rows_total',
+     ('counter', 'Increments and values written into the database.')),
+    ('stats2_duplicates_merged_total',
+     ('counter', 'Duplicated rows merged.')),
+    ('stats2_flush_seconds',
+     ('summary', 'Write-behind flush batches.')),
+    ('stats2_flush_rows_total',
+     ('counter', 'Write-behind deltas written into the database.')),
+])
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                         .replace('"', '\\"')
+                                         .replace('\n', '\\n'))
+        for name, value in labels))
+
+
+class Metrics(object):
+    """Thread safe registry of counters and summaries"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _add(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def incr(self, name, value=1, **labels):
+        self._add(name, labels, value)
+
+    def observe(self, name, seconds, **labels):
+        """Adds a measure to the ``_count`` and ``_sum`` of a summary"""
+        with self._lock:
+            for suffix, value in (('_count', 1), ('_sum', seconds)):
+                key = (name + suffix, tuple(sorted(labels.items())))
+                self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, name, **labels):
+        """
+        :param name: Name of the counter, or of the summary followed by
+            ``_count`` or ``_sum``
+        """
+        return self._values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        """
+        :returns: The metrics in the Prometheus text exposition format
+        :rtype: str
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            if metric_type == 'summary':
+                names = (name + '_count', name + '_sum')
+            else:
+                names = (name, )
+            for (value_name, labels), value in values:
+                if value_name in names:
+                    lines.append('{}{} {}'.format(
+                        value_name, _format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Metrics()
+
+
+def _on_cache_read(sender, value_type, hits, misses, **kwargs):
+    if hits:
+        registry.incr('stats2_cache_hits_total', hits, value_type=value_type)
+    if misses:
+        registry.incr('stats2_cache_misses_total', misses,
+                      value_type=value_type)
+
+
+def _on_ddbb_read(sender, value_type, values, duration, **kwargs):
+    registry.observe('stats2_ddbb_read_seconds', duration,
+                     value_type=value_type)
+    registry.incr('stats2_ddbb_read_values_total', values,
+                  value_type=value_type)
+
+
+def _on_ddbb_write(sender, rows, duration, **kwargs):
+    registry.observe('stats2_ddbb_write_seconds', duration)
+    registry.incr('stats2_ddbb_write_rows_total', rows)
+
+
+def _on_duplicates_merged(sender, rows, **kwargs):
+    registry.incr('stats2_duplicates_merged_total', rows,
+                  model=sender._meta.model_name)
+
+
+def _on_flushed(sender, rows, duration, **kwargs):
+    registry.observe('stats2_flush_seconds', duration)
+    registry.incr('stats2_flush_rows_total', rows)
+
+
+RECEIVERS = (
+    (signals.cache_read, _on_cache_read),
+    (signals.ddbb_read, _on_ddbb_read),
+    (signals.ddbb_write, _on_ddbb_write),
+    (signals.duplicates_merged, _on_duplicates_merged),
+    (signals.flushed, _on_flushed),
+)
+
+
+def connect():
+    """Starts collecting the metrics"""
+    for signal, receiver in RECEIVERS:
+        signal.connect(receiver, dispatch_uid='django_stats2.metrics')
+
+
+def disconnect():
+    for signal, receiver in RECEIVERS:
+        signal.disconnect(dispatch_uid='django_stats2.metrics')
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    MiddlewareMixin = object
+
+from django_stats2.buffer import buffered_stats
+
+
+class StatsBufferMiddleware(MiddlewareMixin):
+    """
+    Buffers the stat increments done during the request and writes them
+    once the response is ready.
+    """
+    def process_request(self, request):
+        request._stats2_buffer = buffered_stats()
+        request._stats2_buffer.__enter__()
+
+    def process_response(self, request, response):
+        stats_buffer = getattr(request, '_stats2_buffer', None)
+        if stats_buffer is not None:
+            del request._stats2_buffer
+            stats_buffer.__exit__(None, None, None)
+        return response
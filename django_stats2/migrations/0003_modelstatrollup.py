@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_rollups(apps, schema_editor):
+    ModelStat = apps.get_model('django_stats2', 'ModelStat')
+    ModelStatRollup = apps.get_model('django_stats2', 'ModelStatRollup')
+
+    rollups = {}
+    rows = ModelStat.objects.values_list(
+        'content_type_id', 'object_id', 'name', 'date', 'value')
+    for content_type_id, object_id, name, date, value in rows.iterator():
+        for period, start in (('month', date.replace(day=1)),
+                              ('year', date.replace(month=1, day=1))):
+            key = (content_type_id or 0, object_id or 0, name, period, start)
+            rollups[key] = rollups.get(key, 0) + value
+
+    ModelStatRollup.objects.bulk_create([
+        ModelStatRollup(content_type_id=key[0], object_id=key[1],
+                        name=key[2], period=key[3], date=key[4],
+                        value=value)
+        for key, value in rollups.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_stats2', '0002_auto_20161025_1156'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelStatRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=128)),
+                ('period', models.CharField(choices=[('month', 'Month'), ('year', 'Year')], max_length=5)),
+                ('date', models.DateField()),
+                ('value', models.BigIntegerField(default=0)),
+                ('content_type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstatrollup',
+            unique_together=set([('content_type', 'object_id', 'name', 'period', 'date')]),
+        ),
+        migrations.RunPython(create_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_totals(apps, schema_editor):
+    ModelStat = apps.get_model('django_stats2', 'ModelStat')
+    ModelStatTotal = apps.get_model('django_stats2', 'ModelStatTotal')
+
+    totals = {}
+    rows = ModelStat.objects.values_list(
+        'content_type_id', 'object_id', 'name', 'value')
+    for content_type_id, object_id, name, value in rows.iterator():
+        key = (content_type_id or 0, object_id or 0, name)
+        totals[key] = totals.get(key, 0) + value
+
+    ModelStatTotal.objects.bulk_create([
+        ModelStatTotal(content_type_id=key[0], object_id=key[1],
+                       name=key[2], value=value)
+        for key, value in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_stats2', '0003_modelstatrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelStatTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=128)),
+                ('value', models.BigIntegerField(default=0)),
+                ('content_type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstattotal',
+            unique_together=set([('content_type', 'object_id', 'name')]),
+        ),
+        migrations.RunPython(create_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_stats2', '0004_modelstattotal'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='modelstat',
+            index_together=set([('content_type', 'object_id'), ('content_type', 'name', 'date')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_stats2', '0005_modelstat_name_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelstat',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modelstatrollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modelstattotal',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstat',
+            unique_together=set([('content_type', 'object_id', 'name', 'date', 'shard')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstatrollup',
+            unique_together=set([('content_type', 'object_id', 'name', 'period', 'date', 'shard')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstattotal',
+            unique_together=set([('content_type', 'object_id', 'name', 'shard')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_stats2', '0006_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelStatSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=128)),
+                ('date', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('content_type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstatsketch',
+            unique_together=set([('content_type', 'object_id', 'name', 'date')]),
+        ),
+    ]
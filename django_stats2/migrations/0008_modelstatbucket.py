@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('django_stats2', '0007_modelstatsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelStatBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=128)),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('shard', models.PositiveSmallIntegerField(default=0)),
+                ('value', models.IntegerField(default=0)),
+                ('content_type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='modelstatbucket',
+            unique_together=set([('content_type', 'object_id', 'name', 'timestamp', 'shard')]),
+        ),
+    ]
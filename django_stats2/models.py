@@ -1,7 +1,443 @@
 # -*- coding: utf-8 -*-
+import random
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import reduce
+from operator import or_
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, F, Min, Q, Sum, When
+
+from django_stats2 import settings as stats2_settings
+from django_stats2 import signals
+from django_stats2.hyperloglog import HyperLogLog
+from django_stats2.utils import chunks
+
+
+# Rows per INSERT statement, keeps the query under the backends parameter
+# limits (999 on old sqlite versions)
+UPSERT_BATCH_SIZE = 100
+
+# Rows deleted per transaction when compacting, keeps the locks short
+COMPACT_BATCH_SIZE = 1000
+
+
+def _delete(queryset):
+    """
+    Deletes the rows of the queryset and returns how many they were, as
+    delete() returns nothing before Django 1.9.
+    """
+    deleted = queryset.count()
+    queryset.delete()
+    return deleted
+
+
+def _get_sort_key(key):
+    # NULL key values (global stats) sort last
+    return tuple((value is None, value) for value in key)
+
+
+class CounterManager(models.Manager):
+    """
+    Manager for models storing a ``value`` counter per row, with the rows
+    identified by the values of ``key_fields``.
+    """
+    key_fields = ()
+
+    def _supports_upsert(self, connection):
+        """
+        Whether the database can add to a row or create it with a single
+        ``INSERT ... ON CONFLICT`` like statement.
+        """
+        if connection.vendor == 'postgresql':
+            return connection.pg_version >= 90500
+        if connection.vendor == 'sqlite':
+            return connection.Database.sqlite_version_info >= (3, 24, 0)
+        return connection.vendor == 'mysql'
+
+    def _get_key_kwargs(self, key):
+        return dict(zip(self.key_fields, key))
+
+    def _upsert(self, connection, values):
+        meta = self.model._meta
+        quote_name = connection.ops.quote_name
+        fields = dict((field.attname, field)
+                      for field in meta.concrete_fields)
+        key_fields = [fields[name] for name in self.key_fields]
+        columns = [quote_name(field.column) for field in key_fields]
+        value_column = quote_name(fields['value'].column)
+
+        if connection.vendor == 'mysql':
+            on_conflict = 'ON DUPLICATE KEY UPDATE {value} = {value} + ' \
+                          'VALUES({value})'
+        else:
+            on_conflict = 'ON CONFLICT ({columns}) DO UPDATE SET ' \
+                          '{value} = {table}.{value} + EXCLUDED.{value}'
+        on_conflict = on_conflict.format(columns=', '.join(columns),
+                                         table=quote_name(meta.db_table),
+                                         value=value_column)
+        placeholders = '({})'.format(
+            ', '.join(['%s'] * (len(key_fields) + 1)))
+
+        for chunk in chunks(values.items(), UPSERT_BATCH_SIZE):
+            params = []
+            for key, value in chunk:
+                params.extend(
+                    field.get_db_prep_value(key_value, connection)
+                    for field, key_value in zip(key_fields, key))
+                params.append(value)
+
+            sql = 'INSERT INTO {table} ({columns}) VALUES {rows} {on_conflict}'
+            sql = sql.format(
+                table=quote_name(meta.db_table),
+                columns=', '.join(columns + [value_column]),
+                rows=', '.join([placeholders] * len(chunk)),
+                on_conflict=on_conflict)
+
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    def _incr_existing(self, values):
+        """
+        Adds the values to the existing rows with a single ``UPDATE`` and
+        returns the keys that were not found.
+        """
+        lookup = reduce(or_, (Q(**self._get_key_kwargs(key))
+                              for key in values))
+
+        existing = {}
+        for row in self.filter(lookup).values_list('pk', *self.key_fields):
+            existing.setdefault(tuple(row[1:]), row[0])
+
+        if existing:
+            self.filter(pk__in=existing.values()).update(value=Case(
+                *[When(pk=pk, then=F('value') + values[key])
+                  for key, pk in existing.items()],
+                default=F('value'),
+                output_field=self.model._meta.get_field('value')))
+
+        return [key for key in values if key not in existing]
+
+    def _incr_one(self, key, value):
+        """Update-then-insert of a single row"""
+        kwargs = self._get_key_kwargs(key)
+        updated = self.filter(**kwargs).update(value=F('value') + value)
+
+        if updated > 1:
+            # Duplicated rows (see _incr_fallback) got the value added more
+            # than once
+            self.merge_duplicates(correction=value * (1 - updated), **kwargs)
+        elif not updated:
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(value=value, **kwargs)
+            except IntegrityError:
+                # Created by another process in the meantime
+                self.filter(**kwargs).update(value=F('value') + value)
+
+    def _incr_fallback(self, values):
+        """
+        Update-then-insert for the rows that can't be upserted. Global stats
+        have no unique constraint (NULL values are never equal) so a race
+        can create duplicated rows, which are fine since stats are always
+        read as a sum of rows.
+        """
+        if len(values) == 1:
+            key, value = list(values.items())[0]
+            return self._incr_one(key, value)
+
+        for attempt in range(2):
+            try:
+                with transaction.atomic(using=self.db):
+                    missing = self._incr_existing(values)
+                    self.bulk_create([
+                        self.model(value=values[key],
+                                   **self._get_key_kwargs(key))
+                        for key in missing
+                    ])
+                return
+            except IntegrityError:
+                # Created by another process in the meantime, try again
+                if attempt:
+                    raise
+
+    def _incr_values(self, values):
+        connection = connections[self.db]
+        # Rows are always written in the same order so concurrent writes
+        # wait for each other instead of deadlocking
+        values = OrderedDict((key, values[key])
+                             for key in sorted(values, key=_get_sort_key))
+
+        upsert = OrderedDict()
+        if self._supports_upsert(connection):
+            # NULL values never conflict
+            for key, value in values.items():
+                if None not in key:
+                    upsert[key] = value
+
+        fallback = OrderedDict((key, value) for key, value in values.items()
+                               if key not in upsert)
+
+        if upsert:
+            self._upsert(connection, upsert)
+        if fallback:
+            self._incr_fallback(fallback)
+
+    def _coalesce(self, rows):
+        """Sums the values of the rows with the same key"""
+        values = OrderedDict()
+        for row in rows:
+            key, value = tuple(row[:-1]), row[-1]
+            values[key] = values.get(key, 0) + value
+        return values
+
+    def incr(self, key, value):
+        """
+        Atomically adds the value to the row, creating it if needed.
+
+        :param key: Values of the ``key_fields``
+        :type key: tuple
+        """
+        self.incr_many([tuple(key) + (value, )])
+
+    def incr_many(self, rows):
+        """
+        Adds the values to the stored rows, creating the missing ones.
+
+        :param rows: Tuples with the values of the ``key_fields`` followed
+            by the value to add
+        :type rows: iterable
+        """
+        values = self._coalesce(rows)
+        if not values:
+            return
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            self._incr_values(values)
+
+    def merge_duplicates(self, correction=0, **kwargs):
+        """
+        Merges all the rows matching ``kwargs`` into the first one.
+
+        :param correction: Value added to the merged row
+        :type correction: int
+        :returns: The merged row
+        """
+        with transaction.atomic(using=self.db):
+            items = self.select_for_update().filter(**kwargs).order_by('pk')
+            model_obj = items.first()
+            duplicates = items.exclude(pk=model_obj.pk)
+
+            for item in duplicates:
+                model_obj.value += item.value
+
+            model_obj.value += correction
+            model_obj.save()
+            removed = _delete(duplicates)
+
+        if removed:
+            signals.duplicates_merged.send(sender=self.model, rows=removed)
+
+        return model_obj
+
+
+class ModelStatManager(CounterManager):
+    key_fields = ('content_type_id', 'object_id', 'name', 'date', 'shard')
+
+    def get_shard(self, name):
+        """
+        Returns the shard a write of the stat goes to, a random one of the
+        ``STATS2_SHARDS`` configured for its name or 0 if it's not sharded.
+        """
+        shards = stats2_settings.SHARDS.get(name, 1)
+        if shards > 1:
+            return random.randrange(shards)
+        return 0
+
+    def _split_buckets(self, values):
+        """
+        Returns the sharded values of the days and the values of the minute
+        or hour buckets, given instead of the day by the stats with a finer
+        granularity.
+        """
+        days = OrderedDict()
+        buckets = OrderedDict()
+        for key, value in values.items():
+            content_type_id, object_id, name, date = key
+            shard = self.get_shard(name)
+
+            if isinstance(date, datetime):
+                bucket_key = (content_type_id or 0, object_id or 0, name,
+                              date, shard)
+                buckets[bucket_key] = buckets.get(bucket_key, 0) + value
+                date = date.date()
+
+            key = (content_type_id, object_id, name, date, shard)
+            days[key] = days.get(key, 0) + value
+        return days, buckets
+
+    def _get_rollup_rows(self, values):
+        for key, value in values.items():
+            content_type_id, object_id, name, date, shard = key
+            for period in (ModelStatRollup.PERIOD_MONTH,
+                           ModelStatRollup.PERIOD_YEAR):
+                yield (content_type_id or 0, object_id or 0, name, period,
+                       ModelStatRollup.get_period_start(period, date), shard,
+                       value)
+
+    def _get_total_rows(self, values):
+        for key, value in values.items():
+            content_type_id, object_id, name, date, shard = key
+            yield (content_type_id or 0, object_id or 0, name, shard, value)
+
+    def _incr_aggregates(self, values):
+        ModelStatRollup.objects.incr_many(self._get_rollup_rows(values))
+        ModelStatTotal.objects.incr_many(self._get_total_rows(values))
+
+    def incr_many(self, rows):
+        """
+        Adds the values to the stored stats, creating the missing ones, and
+        updates the rollups and totals. Sharded stats are added to one of
+        their shards.
+
+        :param rows: ``(content_type_id, object_id, name, date, value)``
+            tuples, with the start of the minute or hour bucket as ``date``
+            for the stats with a finer granularity
+        :type rows: iterable
+        """
+        values, buckets = self._split_buckets(self._coalesce(rows))
+        if not values:
+            return
+
+        with transaction.atomic(using=self.db):
+            self._incr_values(values)
+            self._incr_aggregates(values)
+            if buckets:
+                ModelStatBucket.objects.incr_many(
+                    key + (value, ) for key, value in buckets.items())
+
+    def set_value(self, key, value):
+        """
+        Sets the value of the stat for a day, updating the rollups and totals.
+        The shards of the day are merged into a single row.
+
+        :param key: ``(content_type_id, object_id, name, date)``
+        :type key: tuple
+        """
+        kwargs = self._get_key_kwargs(tuple(key)[:4])
+
+        with transaction.atomic(using=self.db):
+            try:
+                obj = self.get(**kwargs)
+            except self.model.DoesNotExist:
+                obj = self.model(**kwargs)
+            except self.model.MultipleObjectsReturned:
+                # Sharded stat or race condition on a global stat creation
+                obj = self.merge_duplicates(**kwargs)
+
+            delta = value - obj.value
+            obj.value = value
+            obj.save()
+
+            if delta:
+                self._incr_aggregates({obj._get_key(): delta})
+
+        return obj
+
+    def _fold_month(self, queryset, month):
+        """
+        Adds the difference between the days of the stats and their monthly
+        rollup to the rollups of the month (and its year) and to the
+        totals, like the values of rows written without updating the
+        aggregates. Shards are summed, ``set_value`` merges the days of a
+        sharded stat into a single row.
+
+        :returns: Number of stats whose aggregates were updated
+        """
+        days = dict(
+            ((content_type_id or 0, object_id or 0, name), value)
+            for content_type_id, object_id, name, value in
+            queryset.order_by().values_list(
+                'content_type_id', 'object_id', 'name')
+            .annotate(value=Sum('value')))
+        if not days:
+            return 0
+
+        rollups = ModelStatRollup.objects.filter(
+            period=ModelStatRollup.PERIOD_MONTH, date=month,
+            content_type_id__in=set(key[0] for key in days),
+            object_id__in=set(key[1] for key in days),
+            name__in=set(key[2] for key in days))
+        rollups = dict(
+            (row[:3], row[3]) for row in rollups.order_by().values_list(
+                'content_type_id', 'object_id', 'name')
+            .annotate(value=Sum('value')))
+
+        rollup_rows = []
+        total_rows = []
+        for key, value in days.items():
+            delta = value - rollups.get(key, 0)
+            if delta:
+                content_type_id, object_id, name = key
+                for period in (ModelStatRollup.PERIOD_MONTH,
+                               ModelStatRollup.PERIOD_YEAR):
+                    rollup_rows.append((
+                        content_type_id, object_id, name, period,
+                        ModelStatRollup.get_period_start(period, month),
+                        0, delta))
+                total_rows.append(key + (0, delta))
+
+        ModelStatRollup.objects.incr_many(rollup_rows)
+        ModelStatTotal.objects.incr_many(total_rows)
+        return len(total_rows)
+
+    def compact(self, before, names=None, exclude=(),
+                batch_size=COMPACT_BATCH_SIZE):
+        """
+        Deletes the daily values of the months before the date, which are
+        kept in the monthly rollups and the totals. The days of a stat are
+        folded into its aggregates and deleted in the same transaction,
+        with the stats of about ``batch_size`` rows at once, so an
+        interrupted compaction can be run again.
+
+        :param before: First day of a month
+        :type before: datetime.date
+        :param names: Names of the stats to compact, all of them if None
+        :param exclude: Names of the stats to leave untouched
+        :returns: Number of deleted rows
+        :rtype: int
+        """
+        queryset = self.filter(date__lt=before.replace(day=1))
+        if names is not None:
+            queryset = queryset.filter(name__in=names)
+        if exclude:
+            queryset = queryset.exclude(name__in=exclude)
+
+        deleted = 0
+        while True:
+            first = queryset.aggregate(first=Min('date'))['first']
+            if first is None:
+                return deleted
+
+            month = first.replace(day=1)
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            month_queryset = queryset.filter(date__gte=month,
+                                             date__lt=next_month)
+            stats = list(month_queryset.order_by().values_list(
+                'content_type_id', 'object_id', 'name').distinct())
+
+            # A stat has up to 31 rows a month, or more with shards
+            for stat_keys in chunks(stats, max(1, batch_size // 31)):
+                stats_queryset = month_queryset.filter(reduce(or_, (
+                    Q(content_type_id=content_type_id, object_id=object_id,
+                      name=name)
+                    for content_type_id, object_id, name in stat_keys)))
+
+                with transaction.atomic(using=self.db):
+                    self._fold_month(stats_queryset, month)
+                    deleted += _delete(stats_queryset)
 
 
 class ModelStat(models.Model):
@@ -13,19 +449,193 @@ class ModelStat(models.Model):
     date = models.DateField(db_index=True)
     name = models.CharField(max_length=128)
     value = models.IntegerField(default=0)
+    # Hot stats are spread over several rows per day, see STATS2_SHARDS
+    shard = models.PositiveSmallIntegerField(default=0)
+
+    objects = ModelStatManager()
 
     class Meta:
         unique_together = (
-            ('content_type', 'object_id', 'name', 'date'),
+            ('content_type', 'object_id', 'name', 'date', 'shard'),
         )
         index_together = (
             ('content_type', 'object_id'),
+            ('content_type', 'name', 'date'),
         )
 
+    def _get_key(self):
+        return (self.content_type_id, self.object_id, self.name, self.date,
+                self.shard)
+
     def incr(self, value):
+        type(self).objects.incr(self._get_key()[:4], value)
         self.value += value
-        self.save()
 
     def decr(self, value):
+        type(self).objects.incr(self._get_key()[:4], -value)
         self.value -= value
-        self.save()
+
+
+class ModelStatBucketManager(CounterManager):
+    key_fields = ('content_type_id', 'object_id', 'name', 'timestamp',
+                  'shard')
+
+    def prune(self, before):
+        """
+        Deletes the buckets older than the given datetime, their values are
+        kept in the daily stats.
+
+        :returns: Number of deleted buckets
+        :rtype: int
+        """
+        return _delete(self.filter(timestamp__lt=before))
+
+
+class ModelStatBucket(models.Model):
+    """
+    Minute or hour values of the stats with a finer ``STATS2_GRANULARITY``,
+    written along with their daily :class:`ModelStat` and kept for
+    ``STATS2_BUCKET_RETENTION`` days.
+    """
+    content_type = models.ForeignKey(ContentType,
+                                     on_delete=models.CASCADE,
+                                     db_constraint=False)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    name = models.CharField(max_length=128)
+    # Start of the minute or hour
+    timestamp = models.DateTimeField(db_index=True)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.IntegerField(default=0)
+
+    objects = ModelStatBucketManager()
+
+    class Meta:
+        unique_together = (
+            ('content_type', 'object_id', 'name', 'timestamp', 'shard'),
+        )
+
+
+class ModelStatRollupManager(CounterManager):
+    key_fields = ('content_type_id', 'object_id', 'name', 'period', 'date',
+                  'shard')
+
+
+class ModelStatRollup(models.Model):
+    """
+    Monthly and yearly aggregates of :class:`ModelStat`, maintained on every
+    write so totals and long date ranges are answered reading a few rows.
+    """
+    PERIOD_MONTH = 'month'
+    PERIOD_YEAR = 'year'
+    PERIOD_CHOICES = (
+        (PERIOD_MONTH, 'Month'),
+        (PERIOD_YEAR, 'Year'),
+    )
+
+    content_type = models.ForeignKey(ContentType,
+                                     on_delete=models.CASCADE,
+                                     db_constraint=False)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    name = models.CharField(max_length=128)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # First day of the period
+    date = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    objects = ModelStatRollupManager()
+
+    class Meta:
+        unique_together = (
+            ('content_type', 'object_id', 'name', 'period', 'date', 'shard'),
+        )
+
+    @classmethod
+    def get_period_start(cls, period, date):
+        if period == cls.PERIOD_YEAR:
+            return date.replace(month=1, day=1)
+        return date.replace(day=1)
+
+
+class ModelStatTotalManager(CounterManager):
+    key_fields = ('content_type_id', 'object_id', 'name', 'shard')
+
+
+class ModelStatTotal(models.Model):
+    """
+    All time value of every stat, maintained on every write along with
+    :class:`ModelStat` so totals are read from a single row.
+    """
+    content_type = models.ForeignKey(ContentType,
+                                     on_delete=models.CASCADE,
+                                     db_constraint=False)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    name = models.CharField(max_length=128)
+    shard = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    objects = ModelStatTotalManager()
+
+    class Meta:
+        unique_together = (
+            ('content_type', 'object_id', 'name', 'shard'),
+        )
+
+
+class ModelStatSketchManager(models.Manager):
+    def merge(self, key, sketch):
+        """
+        Merges the sketch into the stored one of the day, creating it if
+        needed.
+
+        :param key: ``(content_type_id, object_id, name, date)``
+        :type key: tuple
+        :type sketch: :class:`django_stats2.hyperloglog.HyperLogLog`
+        :returns: The merged sketch
+        :rtype: :class:`django_stats2.hyperloglog.HyperLogLog`
+        """
+        kwargs = dict(zip(('content_type_id', 'object_id', 'name', 'date'),
+                          key))
+
+        with transaction.atomic(using=self.db):
+            obj = self.select_for_update().filter(**kwargs).first()
+            if obj is None:
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(registers=sketch.to_bytes(), **kwargs)
+                    return sketch
+                except IntegrityError:
+                    # Created by another process in the meantime
+                    obj = self.select_for_update().get(**kwargs)
+
+            merged = HyperLogLog(obj.registers)
+            merged.merge(sketch)
+            obj.registers = merged.to_bytes()
+            obj.save(update_fields=['registers'])
+
+        return merged
+
+
+class ModelStatSketch(models.Model):
+    """
+    Daily HyperLogLog sketch of the distinct identifiers added to a
+    :class:`django_stats2.unique.UniqueStat`.
+    """
+    content_type = models.ForeignKey(ContentType,
+                                     on_delete=models.CASCADE,
+                                     db_constraint=False)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    name = models.CharField(max_length=128)
+    date = models.DateField()
+    registers = models.BinaryField()
+
+    objects = ModelStatSketchManager()
+
+    class Meta:
+        unique_together = (
+            ('content_type', 'object_id', 'name', 'date'),
+        )
@@ -1,116 +1,203 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
 from datetime import datetime
 
-from django.db.models import Sum
 from django.contrib.contenttypes.models import ContentType
-from django.core.cache import caches
-from django.core.cache.backends.base import InvalidCacheBackendError
 from django.utils import timezone
 
-from django_stats2.models import ModelStat
 from django_stats2 import settings as stats2_settings
+from django_stats2 import leaderboard
+from django_stats2.backends import get_stat_backend
+from django_stats2.buffer import add_to_buffer, flush_stat
 
 
 class Stat(object):
+    __slots__ = ('name', 'model_instance', 'content_type', '_prefix',
+                 '_backend', '_prefetched', '_key_base', '_cache_keys')
+
     cache_key_prefix = stats2_settings.CACHE_PREFIX
+    # Start of all the cache keys of a stat, computed once per stat
+    cache_key_base = '{cache_key_prefix}:{prefix}:{name}:{pk}'
     cache_key_format = {
         'history': '{cache_key_prefix}:{prefix}:{name}:{pk}:{date}',
         'total': '{cache_key_prefix}:{prefix}:{name}:{pk}:total',
-        'between': '{cache_key_prefix}:{prefix}:{name}:{pk}:{date}_{date_end}',
+        'between': '{cache_key_prefix}:{prefix}:{name}:{pk}:{date}_{date_end}:{generation}',  # noqa
+        'generation': '{cache_key_prefix}:{prefix}:{name}:{pk}:generation',
+        'buckets': '{cache_key_prefix}:{prefix}:{name}:{pk}:{date}_{date_end}:buckets:{generation}',  # noqa
+        'hash': '{cache_key_prefix}:{prefix}:{name}:{pk}',
     }
 
-    def __init__(self, name, model_instance=None):
+    def __init__(self, name, model_instance=None, content_type=None,
+                 prefix=None):
         """
-        Setup the base fields for the stat to work properly and the cache
-        connection to store the data.
+        Setup the base fields for the stat to work properly. The storage
+        backend is retrieved on first use.
+
+        :param content_type: Content type of the model instance, retrieved
+            from the model if not provided
+        :param prefix: Stat prefix for the cache keys, defaults to
+            :meth:`_get_stat_prefix`
         """
-        self.cache = self._get_cache_instance()
         self.name = name
         self.model_instance = model_instance
+        self._prefix = prefix
+        self._backend = None
+        # Values retrieved in bulk by prefetch_stats
+        self._prefetched = {}
+        # (pk, start of the cache keys) and the cache keys already built
+        self._key_base = None
+        self._cache_keys = {}
         if self.model_instance:
-            self.content_type = ContentType.objects.get_for_model(
-                self.model_instance)
-
-    # Cache handling
-    def _get_cache_instance(self):
-        """Returns a django cache object based on the settings configuration"""
-        try:
-            cache = caches[stats2_settings.CACHE_KEY]
-        except InvalidCacheBackendError:
-            cache = caches['default']
-        return cache
+            self.content_type = content_type or \
+                ContentType.objects.get_for_model(self.model_instance)
+
+    @property
+    def backend(self):
+        """
+        Storage backend of the stat, set by name on ``STATS2_STAT_BACKENDS``
+
+        :rtype: :class:`django_stats2.backends.base.BaseBackend`
+        """
+        if self._backend is None:
+            self._backend = get_stat_backend(self.name)
+        return self._backend
+
+    @property
+    def granularity(self):
+        """
+        ``minute``, ``hour`` or ``day``, set by name on
+        ``STATS2_GRANULARITY``
+        """
+        return stats2_settings.GRANULARITY.get(self.name, 'day')
 
+    def _get_bucket(self, date=None):
+        """
+        Returns the day an increment done at ``date`` (now by default) is
+        stored in, or the start of its minute or hour for the stats with a
+        finer granularity.
+        """
+        if date is None:
+            date = timezone.now()
+        if not isinstance(date, datetime):
+            return date
+
+        if self.granularity == 'minute':
+            return date.replace(second=0, microsecond=0)
+        if self.granularity == 'hour':
+            return date.replace(minute=0, second=0, microsecond=0)
+        return date.date()
+
+    # Keys
     def _get_stat_prefix(self):
         """
         Return the stat prefix for the cache key
         - Return the lowercase class name for models
         - '_global' otherwise
         """
+        if self._prefix:
+            return self._prefix
         if self.model_instance:
             return self.model_instance.__class__.__name__.lower()
         return '_global'
 
-    def _get_cache_key(self, value_type='total', date=None, date_end=None):
+    @classmethod
+    def _get_key_suffixes(cls):
+        """
+        Returns the ``cache_key_format`` of the class without the
+        ``cache_key_base``, or None for the formats not starting with it.
+        """
+        suffixes = cls.__dict__.get('_key_suffixes')
+        if suffixes is None:
+            suffixes = dict(
+                (value_type,
+                 key_format[len(cls.cache_key_base):]
+                 if key_format.startswith(cls.cache_key_base) else None)
+                for value_type, key_format in cls.cache_key_format.items())
+            cls._key_suffixes = suffixes
+        return suffixes
+
+    def _get_key_base(self):
+        """
+        Returns the start of the cache keys of the stat, built again only if
+        the model instance primary key changes (once saved).
+        """
+        pk = self.model_instance.pk if self.model_instance else None
+        if self._key_base is None or self._key_base[0] != pk:
+            self._key_base = (pk, self.cache_key_base.format(
+                cache_key_prefix=self.cache_key_prefix,
+                prefix=self._get_stat_prefix(),
+                name=self.name,
+                pk=pk or ''))
+            self._cache_keys = {}
+        return self._key_base[1]
+
+    def _get_cache_key(self, value_type='total', date=None, date_end=None,
+                       generation=None):
+        """
+        :param generation: Generation of the stat, for the cache keys of
+            values derived from it
+        """
         if isinstance(date, datetime):
             date = date.date()
 
         if isinstance(date_end, datetime):
             date_end = date_end.date()
 
-        return self.cache_key_format.get(value_type).format(
-            cache_key_prefix=self.cache_key_prefix,
-            prefix=self._get_stat_prefix(),
-            name=self.name,
-            pk=self.object_id or '',
-            date=date,
-            date_end=date_end)
-
-    def _get_cache(self, value_type='total', date=None, date_end=None):
-        cache_key = self._get_cache_key(value_type, date, date_end)
-        return self.cache.get(cache_key)
-
-    def _set_cache(self, value_type='total', date=None, value=0, date_end=None):  # noqa
-        cache_key = self._get_cache_key(value_type, date, date_end)
-        timeout = getattr(stats2_settings,
-                          'CACHE_TIMEOUT_{}'.format(value_type).upper(),
-                          None)
-        self.cache.set(cache_key, value, timeout=timeout)
-
-    def _incr_cache(self, date, value):
-        cache_key_history = self._get_cache_key('history', date)
-        cache_key_total = self._get_cache_key('total', date)
-        try:
-            self.cache.incr(cache_key_history, value)
-        except ValueError:
-            self._set_cache('history', date, value)
-
-        try:
-            self.cache.incr(cache_key_total, value)
-        except ValueError:
-            # Will get cached on get()
-            pass
-
-    def _decr_cache(self, date, value):
-        cache_key_history = self._get_cache_key('history', date)
-        cache_key_total = self._get_cache_key('total', date)
-
-        try:
-            self.cache.decr(cache_key_history, value)
-        except ValueError:
-            self._set_cache('history', date, value)
-
-        try:
-            self.cache.decr(cache_key_total, value)
-        except ValueError:
-            # Will get cached on get()
-            pass
-
-    def _delete_cache(self, date=None):
-        value_type = 'history' if date else 'total'
-        cache_key = self._get_cache_key(value_type, date)
-        caches[stats2_settings.CACHE_KEY].delete(cache_key)
-
-    # Database handlers
+        key_base = self._get_key_base()
+        memo_key = (value_type, date, date_end)
+        cache_key = self._cache_keys.get(memo_key)
+        if cache_key is not None and generation is None:
+            return cache_key
+
+        suffix = self._get_key_suffixes()[value_type]
+        if suffix is None:
+            cache_key = self.cache_key_format[value_type].format(
+                cache_key_prefix=self.cache_key_prefix,
+                prefix=self._get_stat_prefix(),
+                name=self.name,
+                pk=self.object_id or '',
+                date=date,
+                date_end=date_end,
+                generation=generation)
+        else:
+            cache_key = key_base + suffix.format(date=date,
+                                                 date_end=date_end,
+                                                 generation=generation)
+
+        # Generations change on every write, their keys are not kept
+        if generation is None:
+            self._cache_keys[memo_key] = cache_key
+        return cache_key
+
+    def _get_generation_keys(self):
+        """
+        Returns the generation cache keys changed by a write: the stat own
+        one and, for model stats, the one of the model rankings.
+        """
+        self._get_key_base()
+        cache_keys = self._cache_keys.get('generation_keys')
+        if cache_keys is None:
+            cache_keys = [self._get_cache_key('generation')]
+            if self.model_instance:
+                cache_keys.append(leaderboard.get_generation_key(
+                    self._get_stat_prefix(), self.name))
+            self._cache_keys['generation_keys'] = cache_keys
+        return cache_keys
+
+    def _get_row_key(self, date):
+        """
+        Returns the ``(content_type_id, object_id, name, date)`` tuple that
+        identifies the ModelStat row of this Stat for the given date.
+        """
+        if isinstance(date, datetime):
+            date = date.date()
+
+        content_type_id = None
+        if self.model_instance:
+            content_type_id = self.content_type.pk
+
+        return (content_type_id, self.object_id, self.name, date)
+
     def _get_manager_kwargs(self, date=None):
         """Returns kwargs to filter ModelStat by Stat type"""
         if self.model_instance:
@@ -129,130 +216,55 @@ class Stat(object):
 
         return manager_kwargs
 
-    def _get_model_queryset(self, date=timezone.now().date()):
-        """Returns the ModelStat queryset for this Stat"""
-        _kwargs = self._get_manager_kwargs(date)
-
-        try:
-            model_obj, created = ModelStat.objects.get_or_create(**_kwargs)
-        except ModelStat.MultipleObjectsReturned:
-            # Race condition detected.
-            # try to merge all object into the first one found
-            items = ModelStat.objects.filter(**_kwargs)
-            model_obj = items.first()
-            duplicates = items.exclude(pk=model_obj.pk)
-
-            for item in duplicates:
-                model_obj.value += item.value
-
-            model_obj.save()
-            duplicates.delete()
-
-        return model_obj
-
-    def _get_ddbb(self, value_type='total', date=None):
-        if value_type == 'total':
-            stat_result = ModelStat.objects.filter(
-                **self._get_manager_kwargs()
-            ).aggregate(Sum('value'))
-            stat = stat_result.get('value__sum')
-
-            return stat or 0
-
-        if value_type == 'history':
-            try:
-                stat_result = self._get_model_queryset(date)
-                return stat_result.value
-            except ModelStat.DoesNotExist:
-                # Assume zero
-                pass
-
-        return 0
-
-    def _get_ddbb_between(self, date_start, date_end):
-        try:
-            stat_result = ModelStat.objects.filter(
-                date__gte=date_start,
-                date__lte=date_end,
-                **self._get_manager_kwargs()
-            ).aggregate(Sum('value'))
-            stat = stat_result.get('value__sum')
-            return stat
-        except ModelStat.DoesNotExist:
-            # Assume zero
-            pass
-
-        return 0
-
-    def _set_ddbb(self, date, value):
-        object_kwargs = self._get_manager_kwargs(date)
-
-        try:
-            obj = ModelStat.objects.get(**object_kwargs)
-        except ModelStat.DoesNotExist:
-            obj = ModelStat(**object_kwargs)
-
-        obj.value = value
-        obj.save()
-
-    def _incr_ddbb(self, date, value):
-        model = self._get_model_queryset(date)
-        model.incr(value)
-
-    def _decr_ddbb(self, date, value):
-        model = self._get_model_queryset(date)
-        model.decr(value)
+    def _get_rollup_kwargs(self):
+        """
+        Returns kwargs to filter ModelStatRollup and ModelStatTotal by Stat
+        type.
 
-    # Globals
-    def _get_value(self, date=None):
-        value_type = 'history' if date else 'total'
+        Unlike ModelStat, the rollup, total, bucket and sketch tables store
+        the global stats with a 0 content type and object id instead of
+        NULL, so their rows are unique and can be upserted too.
+        """
+        content_type_id, object_id, name, date = self._get_row_key(None)
+        return {
+            'content_type_id': content_type_id or 0,
+            'object_id': object_id or 0,
+            'name': name,
+        }
 
-        if not stats2_settings.USE_CACHE:
-            return self._get_ddbb(value_type, date)
+    # Globals
+    def _get_prefetch_key(self, date=None):
+        if isinstance(date, datetime):
+            date = date.date()
+        return ('history' if date else 'total', date)
 
-        cache_value = self._get_cache(value_type, date)
+    def _set_prefetched(self, value, date=None):
+        self._prefetched[self._get_prefetch_key(date)] = value
 
-        # If we don't have a cache value we must retireve it from the ddbb
-        if cache_value is None:
-            ddbb_value = self._get_ddbb(value_type, date)
+    def _get_value(self, date=None):
+        if isinstance(date, datetime):
+            date = date.date()
 
-            # Store in cache for future access
-            self._set_cache(value_type, date, ddbb_value)
-            cache_value = ddbb_value
+        prefetch_key = self._get_prefetch_key(date)
+        if prefetch_key in self._prefetched:
+            return self._prefetched[prefetch_key]
 
-        return cache_value
+        return self.backend.get(self, date or None)
 
     def _get_between(self, date_start, date_end):
-        cache_value = self._get_cache('between', date_start, date_end)
-
-        if not stats2_settings.USE_CACHE:
-            return self.get_ddbb_between(date_start, date_end)
-
-        # If we don't have the cache value we retrieve it from the ddbb
-        if cache_value is None:
-            ddbb_value = self._get_ddbb_between(date_start, date_end)
-
-            # Store in cache for future access
-            self._set_cache('between', date_start,
-                            date_end=date_end, value=ddbb_value)
-            cache_value = ddbb_value
+        if isinstance(date_start, datetime):
+            date_start = date_start.date()
+        if isinstance(date_end, datetime):
+            date_end = date_end.date()
 
-        return cache_value
+        return self.backend.between(self, date_start, date_end)
 
     def _set_value(self, value, date=None):
-        value_type = 'history' if date else 'total'
-
-        if stats2_settings.USE_CACHE:
-            self._set_cache(value_type=value_type, date=date, value=value)
-
-        if stats2_settings.DDBB_DIRECT_INSERT:
-            self._set_ddbb(date=date, value=value)
-
-        # Delete cache for this totals if a specified date is modified
-        # and database direct insert is present
-        if date and stats2_settings.DDBB_DIRECT_INSERT:
-            self._delete_cache()
+        if isinstance(date, datetime):
+            date = date.date()
 
+        self._prefetched.clear()
+        self.backend.set(self, value, date or None)
         return value
 
     # Public
@@ -266,26 +278,110 @@ class Stat(object):
         assert date_start < date_end, "Start date must be before end date."
         return self._get_between(date_start, date_end)
 
+    def get_series(self, date_start, date_end, fill_zeros=True):
+        """
+        Returns the value of every day between both dates (included).
+
+        :param fill_zeros: Include the days with a zero value
+        :type fill_zeros: bool
+        :returns: Ordered mapping of date to value
+        :rtype: :class:`collections.OrderedDict`
+        """
+        if isinstance(date_start, datetime):
+            date_start = date_start.date()
+        if isinstance(date_end, datetime):
+            date_end = date_end.date()
+
+        assert date_start <= date_end, "Start date must be before end date."
+
+        series = self.backend.range(self, date_start, date_end)
+        return OrderedDict((date, int(value))
+                           for date, value in series.items()
+                           if value or fill_zeros)
+
+    def get_buckets(self, date_start, date_end=None, fill_zeros=True):
+        """
+        Returns the value of every minute or hour of the days between both
+        dates (included), for the stats with a finer ``STATS2_GRANULARITY``.
+
+        :param date_end: Last day, defaults to ``date_start``
+        :param fill_zeros: Include the buckets with a zero value
+        :type fill_zeros: bool
+        :returns: Ordered mapping of the start of the bucket to its value
+        :rtype: :class:`collections.OrderedDict`
+        """
+        if isinstance(date_start, datetime):
+            date_start = date_start.date()
+        if isinstance(date_end, datetime):
+            date_end = date_end.date()
+        date_end = date_end or date_start
+
+        assert self.granularity != 'day', "The stat is stored by day."
+        assert date_start <= date_end, "Start date must be before end date."
+
+        buckets = self.backend.buckets(self, date_start, date_end)
+        return OrderedDict((bucket, int(value))
+                           for bucket, value in buckets.items()
+                           if value or fill_zeros)
+
     def total(self):
         return int(self._get_value())
 
-    def set(self, value, date=datetime.today()):
-        return self._set_value(value, date)
+    def set(self, value, date=None):
+        flush_stat(self)
+        return self._set_value(value, date or timezone.now().date())
 
-    def incr(self, value=1, date=timezone.now().date()):
-        if stats2_settings.USE_CACHE:
-            self._incr_cache(date, value)
-        if stats2_settings.DDBB_DIRECT_INSERT:
-            self._incr_ddbb(date, value)
+    def incr(self, value=1, date=None):
+        """
+        :param date: Day or moment of the increment, defaults to now
+        """
+        date = self._get_bucket(date)
 
-    def decr(self, value=1, date=timezone.now().date()):
-        if stats2_settings.USE_CACHE:
-            self._decr_cache(date, value)
-        if stats2_settings.DDBB_DIRECT_INSERT:
-            self._decr_ddbb(date, value)
+        self._prefetched.clear()
+        leaderboard.track(self, value)
+        if not add_to_buffer(self, date, value):
+            self.backend.incr_many([(self, date, value)])
 
-    def store(self, value, date=datetime.now().date()):
-        return self._set_ddbb(date, value)
+    def decr(self, value=1, date=None):
+        self.incr(-value, date)
+
+    def store(self, value, date=None):
+        date = date or timezone.now().date()
+        if isinstance(date, datetime):
+            date = date.date()
+
+        flush_stat(self)
+        self._prefetched.clear()
+        self.backend.store(self, value, date)
+
+    # Async, see django_stats2.aio
+    def aget(self, date=None):
+        from django_stats2 import aio
+        return aio.get(self, date)
+
+    def atotal(self):
+        from django_stats2 import aio
+        return aio.get(self)
+
+    def aget_between_date(self, date_start, date_end):
+        assert date_start < date_end, "Start date must be before end date."
+        from django_stats2 import aio
+        return aio.get_between(self, date_start, date_end)
+
+    def aget_series(self, date_start, date_end, fill_zeros=True):
+        from django_stats2 import aio
+        return aio.get_series(self, date_start, date_end, fill_zeros)
+
+    def aset(self, value, date=None):
+        from django_stats2 import aio
+        return aio.set(self, value, date)
+
+    def aincr(self, value=1, date=None):
+        from django_stats2 import aio
+        return aio.incr(self, value, date)
+
+    def adecr(self, value=1, date=None):
+        return self.aincr(-value, date)
 
     @property
     def object_id(self):
@@ -302,3 +398,23 @@ class Stat(object):
 
     def __int__(self):
         return self.total()
+
+
+def get_stat(content_type_id, object_id, name):
+    """
+    Returns the stat of a stored row, global if it has no content type (0
+    or None).
+
+    :returns: The stat, or None if the model of the content type no longer
+        exists
+    :rtype: :class:`Stat`
+    """
+    if not content_type_id:
+        return Stat(name=name)
+
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    model = content_type.model_class()
+    if model is None:
+        return None
+    return Stat(name=name, model_instance=model(pk=object_id),
+                content_type=content_type)
@@ -33,3 +33,98 @@ CACHE_TIMEOUT_HISTORY = getattr(settings,
 CACHE_TIMEOUT_BETWEEN = getattr(settings,
                                 'STATS2_CACHE_TIMEOUT_BETWEEN',
                                 60*60*24)
+
+# Cache timeout for the minute and hour values of a day
+CACHE_TIMEOUT_BUCKETS = getattr(settings,
+                                'STATS2_CACHE_TIMEOUT_BUCKETS',
+                                60*60*24)
+
+# Cache misses
+# Seconds the first process missing a value in the cache holds a lock on it
+# while it reads it from the database, so the rest wait for it instead of
+# running the same query. 0 disables the locks.
+MISS_LOCK_TIMEOUT = getattr(settings, 'STATS2_MISS_LOCK_TIMEOUT', 10)
+
+# Seconds a process waits for a locked value to be cached before reading
+# it from the database itself
+MISS_LOCK_WAIT = getattr(settings, 'STATS2_MISS_LOCK_WAIT', 0.5)
+
+# Early recomputation of the between values before they expire, the higher
+# the earlier (probabilistic, XFetch beta). 0 disables it.
+BETWEEN_EARLY_RECOMPUTE = getattr(settings,
+                                  'STATS2_BETWEEN_EARLY_RECOMPUTE', 0)
+
+# In-process cache of the values read, in front of the shared cache, by stat
+# name: {'name': seconds}. Writes done by the process drop the values they
+# change from it, writes done by other processes are seen once they expire.
+LOCAL_CACHE = getattr(settings, 'STATS2_LOCAL_CACHE', {})
+
+# Values kept in the in-process cache, the least recently used are dropped
+LOCAL_CACHE_SIZE = getattr(settings, 'STATS2_LOCAL_CACHE_SIZE', 1000)
+
+# Cache timeout for the top objects of a stat
+CACHE_TIMEOUT_TOP = getattr(settings,
+                            'STATS2_CACHE_TIMEOUT_TOP',
+                            60*60*24)
+
+# Number of objects tracked per stat by the in-memory heavy hitters
+# tracker used for approximate rankings, 0 disables it
+HEAVY_HITTERS_CAPACITY = getattr(settings,
+                                 'STATS2_HEAVY_HITTERS_CAPACITY',
+                                 0)
+
+# Layout of the stats in the cache: 'keys' for a key per day plus one for
+# the total, 'hash' for a single entry per stat (a hash on redis caches)
+CACHE_LAYOUT = getattr(settings, 'STATS2_CACHE_LAYOUT', 'keys')
+
+# Number of rows per day the values of some stats are spread over, by
+# stat name: {'name': shards}. Increments go to a random shard so hot
+# stats are not serialized on a single row lock, reads sum all of them.
+SHARDS = getattr(settings, 'STATS2_SHARDS', {})
+
+# Precision of the HyperLogLog sketches of the unique stats: 2 ** precision
+# bytes per stat and day, for a standard error of 1.04 / sqrt(2 ** precision).
+# Can't be changed once there are stored sketches.
+UNIQUE_PRECISION = getattr(settings, 'STATS2_UNIQUE_PRECISION', 12)
+
+# Granularity of the stats by name: {'name': 'minute' | 'hour'}, the rest
+# of the stats are stored by day. Stats with a finer granularity keep their
+# daily values too.
+GRANULARITY = getattr(settings, 'STATS2_GRANULARITY', {})
+
+# Days the minute and hour values are kept for, None to keep them forever.
+# Older ones are deleted by the `stats2_flush` command.
+BUCKET_RETENTION = getattr(settings, 'STATS2_BUCKET_RETENTION', 7)
+
+# Days the daily values are kept for, by stat name: {'name': days}. Older
+# whole months are deleted by the `stats2_compact` command, their values are
+# kept in the monthly rollups and the totals.
+RETENTION = getattr(settings, 'STATS2_RETENTION', {})
+
+# Write-behind
+# Record cache increments as pending deltas so they can be persisted into
+# the database later on with the `stats2_flush` management command.
+# Has no effect when DDBB_DIRECT_INSERT is enabled.
+WRITE_BEHIND = getattr(settings,
+                       'STATS2_WRITE_BEHIND',
+                       USE_CACHE and not DDBB_DIRECT_INSERT)
+
+# Number of pending deltas written to the database on every flush batch
+FLUSH_BATCH_SIZE = getattr(settings, 'STATS2_FLUSH_BATCH_SIZE', 500)
+
+# Storage backends
+# Backends by alias, same format as django CACHES:
+# {'alias': {'BACKEND': 'dotted.path.Backend', 'OPTIONS': {...}}}
+# The 'default' one stores the values in the cache and/or the database
+# as set above.
+BACKENDS = getattr(settings, 'STATS2_BACKENDS', {})
+
+# Backend alias by stat name: {'name': 'alias'}, the rest of the stats use
+# the 'default' one
+STAT_BACKENDS = getattr(settings, 'STATS2_STAT_BACKENDS', {})
+
+# Metrics
+# Collect in-process counters and timers of the cache hits and misses,
+# database reads and writes, merged duplicates and flushes from the
+# `django_stats2.signals`, served by the `django_stats2.views.metrics` view.
+METRICS = getattr(settings, 'STATS2_METRICS', False)
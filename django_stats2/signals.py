@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Signals sent by the stats internals, to instrument them. All of them are
+sent with keyword arguments only, ``duration`` is always in seconds.
+"""
+from django.dispatch import Signal
+
+
+# Values read from the cache by the default backend.
+# Arguments: value_type ('total', 'history', 'between' or 'buckets'),
+# hits, misses
+cache_read = Signal()
+
+# Values read from the database when missing in the cache (or with the
+# cache disabled).
+# Arguments: value_type, values, duration
+ddbb_read = Signal()
+
+# Increments or values written into the database.
+# Arguments: rows, duration
+ddbb_write = Signal()
+
+# Duplicated rows merged into one, created by races on the global stats or
+# by the shards of a stat being set.
+# Arguments: rows (number of rows removed)
+duplicates_merged = Signal()
+
+# Batch of write-behind deltas written into the database by a flush.
+# Arguments: rows, duration
+flushed = Signal()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export and import of the daily values of the stats, as CSV or
+JSON lines with the ``content_type`` (``app_label.model``, empty for global
+stats), ``object_id``, ``name``, ``date`` and ``value`` of every day.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+import django
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.dateparse import parse_date
+
+from django_stats2.models import ModelStat
+from django_stats2.objects import get_stat
+from django_stats2.utils import chunks
+
+
+FIELDS = ('content_type', 'object_id', 'name', 'date', 'value')
+FORMATS = ('csv', 'jsonl')
+
+# Rows fetched from the database at once when exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows written per transaction when importing
+IMPORT_BATCH_SIZE = 250
+
+
+def _iterator(queryset, chunk_size):
+    if django.VERSION >= (2, 0):
+        return queryset.iterator(chunk_size=chunk_size)
+    return queryset.iterator()
+
+
+def _get_label(content_type_id):
+    if content_type_id is None:
+        return ''
+    # Cached by the content types manager
+    content_type = ContentType.objects.get_for_id(content_type_id)
+    return '{}.{}'.format(content_type.app_label, content_type.model)
+
+
+def export_stats(names=None, date_start=None, date_end=None,
+                 chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the daily values of the stats, with their shards summed, reading
+    them from the database in chunks.
+
+    :param names: Names of the stats to export, all of them if None
+    :rtype: iterator of :class:`collections.OrderedDict`
+    """
+    queryset = ModelStat.objects.order_by()
+    if names is not None:
+        queryset = queryset.filter(name__in=names)
+    if date_start is not None:
+        queryset = queryset.filter(date__gte=date_start)
+    if date_end is not None:
+        queryset = queryset.filter(date__lte=date_end)
+
+    queryset = queryset \
+        .values('content_type_id', 'object_id', 'name', 'date') \
+        .annotate(value=Sum('value'))
+
+    for row in _iterator(queryset, chunk_size):
+        yield OrderedDict([
+            ('content_type', _get_label(row['content_type_id'])),
+            ('object_id', row['object_id']),
+            ('name', row['name']),
+            ('date', row['date'].isoformat()),
+            ('value', row['value']),
+        ])
+
+
+def write_rows(rows, output, format='csv'):
+    """
+    :param output: File like object to write the rows to
+    :param format: ``csv`` or ``jsonl``
+    :returns: Number of rows written
+    :rtype: int
+    """
+    count = 0
+    if format == 'csv':
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(['' if row[field] is None else row[field]
+                             for field in FIELDS])
+            count += 1
+    else:
+        for row in rows:
+            output.write(json.dumps(row) + '\n')
+            count += 1
+    return count
+
+
+def read_rows(input, format='csv'):
+    """
+    Yields the rows of the file like object as dicts
+
+    :param format: ``csv`` or ``jsonl``
+    """
+    if format == 'csv':
+        for row in csv.DictReader(input):
+            yield row
+    else:
+        for line in input:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _parse_row(row):
+    """
+    :returns: ``(content_type_id, object_id, name, date)`` key and value
+    :raises ValueError: With an unknown content type or a wrong value
+    """
+    content_type_id = object_id = None
+    label = row.get('content_type')
+    if label:
+        try:
+            content_type = ContentType.objects.get_by_natural_key(
+                *label.split('.', 1))
+        except (ContentType.DoesNotExist, TypeError):
+            raise ValueError(
+                'django_stats2: Unknown content type "{}".'.format(label))
+        content_type_id = content_type.pk
+        object_id = int(row['object_id'])
+
+    date = parse_date(str(row['date'])[:10])
+    if date is None:
+        raise ValueError(
+            'django_stats2: Wrong date "{}".'.format(row['date']))
+
+    return (content_type_id, object_id, row['name'], date), int(row['value'])
+
+
+def _get_existing(values):
+    """Returns the stored values of the keys, with the shards summed"""
+    groups = OrderedDict()
+    for key in values:
+        groups.setdefault((key[0], key[2]), []).append(key)
+
+    existing = {}
+    for (content_type_id, name), keys in groups.items():
+        queryset = ModelStat.objects.filter(
+            name=name, date__in=set(key[3] for key in keys))
+        if content_type_id is None:
+            queryset = queryset.filter(content_type__isnull=True,
+                                       object_id__isnull=True)
+        else:
+            queryset = queryset.filter(
+                content_type_id=content_type_id,
+                object_id__in=set(key[1] for key in keys))
+
+        for object_id, date, value in queryset.order_by() \
+                .values_list('object_id', 'date') \
+                .annotate(value=Sum('value')):
+            existing[(content_type_id, object_id, name, date)] = value
+    return existing
+
+
+def _clear_cache(keys):
+    """Drops the cached values of the keys, with a call per backend"""
+    stats = {}
+    rows = OrderedDict()
+    for content_type_id, object_id, name, date in keys:
+        stat_key = (content_type_id, object_id, name)
+        if stat_key not in stats:
+            stats[stat_key] = get_stat(*stat_key)
+        stat = stats[stat_key]
+        if stat is not None:
+            rows.setdefault(stat.backend, []).append((stat, date))
+
+    for backend, backend_rows in rows.items():
+        backend.clear_cache(backend_rows)
+
+
+def import_stats(rows, add=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Stores the daily values of the rows into the database in batches,
+    keeping the rollups and totals up to date, and drops the cached values
+    of the stats imported.
+
+    :param rows: Dicts like the ones of :func:`export_stats`
+    :param add: Add the values to the stored ones instead of replacing them
+    :returns: Number of rows imported
+    :rtype: int
+    :raises ValueError: With the first wrong row
+    """
+    count = 0
+    for batch in chunks((_parse_row(row) for row in rows), batch_size):
+        values = OrderedDict()
+        for key, value in batch:
+            values[key] = values.get(key, 0) + value
+
+        with transaction.atomic():
+            if not add:
+                existing = _get_existing(values)
+                values = OrderedDict(
+                    (key, value - existing.get(key, 0))
+                    for key, value in values.items())
+
+            ModelStat.objects.incr_many(
+                key + (value, ) for key, value in values.items() if value)
+
+        _clear_cache(values)
+        count += len(batch)
+    return count
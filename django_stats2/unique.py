@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Stats counting distinct identifiers, like unique visitors, using a daily
+HyperLogLog sketch of bounded size no matter the traffic.
+
+The sketch of the day is kept in the cache and merged into its
+:class:`django_stats2.models.ModelStatSketch` row only when it changes,
+which stops happening soon for busy days since most identifiers don't
+raise any register. Totals and date ranges merge the daily sketches.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.hyperloglog import HyperLogLog
+from django_stats2.models import ModelStatSketch
+from django_stats2.objects import Stat
+from django_stats2.utils import get_cache, get_generation
+
+
+class UniqueStat(Stat):
+    __slots__ = ()
+
+    cache_key_format = {
+        'history': '{cache_key_prefix}:{prefix}:{name}:{pk}:{date}:unique',
+        'total': '{cache_key_prefix}:{prefix}:{name}:{pk}:total:unique:{generation}',  # noqa
+        'between': '{cache_key_prefix}:{prefix}:{name}:{pk}:{date}_{date_end}:unique:{generation}',  # noqa
+        'generation': '{cache_key_prefix}:{prefix}:{name}:{pk}:unique:generation',  # noqa
+    }
+
+    def _get_generation_keys(self):
+        return [self._get_cache_key('generation')]
+
+    def _get_queryset(self, **filters):
+        filters.update(self._get_rollup_kwargs())
+        return ModelStatSketch.objects.filter(**filters)
+
+    def _merge_sketches(self, **filters):
+        sketch = HyperLogLog()
+        for registers in self._get_queryset(**filters) \
+                .values_list('registers', flat=True):
+            sketch.merge(HyperLogLog(registers))
+        return sketch
+
+    def get_sketch(self, date):
+        """
+        Returns the sketch of the day
+
+        :rtype: :class:`django_stats2.hyperloglog.HyperLogLog`
+        """
+        if isinstance(date, datetime):
+            date = date.date()
+
+        cache_key = self._get_cache_key('history', date)
+        if stats2_settings.USE_CACHE:
+            registers = get_cache().get(cache_key)
+            if registers is not None:
+                return HyperLogLog(registers)
+
+        registers = self._get_queryset(date=date) \
+            .values_list('registers', flat=True).first()
+        if registers is not None:
+            sketch = HyperLogLog(registers)
+        else:
+            sketch = HyperLogLog()
+
+        if stats2_settings.USE_CACHE:
+            get_cache().set(cache_key, sketch.to_bytes(),
+                            timeout=stats2_settings.CACHE_TIMEOUT_HISTORY)
+        return sketch
+
+    def _get_count(self, value_type, date_start=None, date_end=None):
+        """Merges the sketches of all the days or between both dates"""
+        filters = {}
+        if date_start:
+            filters.update(date__gte=date_start, date__lte=date_end)
+
+        if not stats2_settings.USE_CACHE:
+            return self._merge_sketches(**filters).count()
+
+        cache = get_cache()
+        generation = get_generation(cache,
+                                    self._get_cache_key('generation'))
+        cache_key = self._get_cache_key(value_type, date_start, date_end,
+                                        generation=generation)
+        value = cache.get(cache_key)
+
+        if value is None:
+            value = self._merge_sketches(**filters).count()
+            cache.set(cache_key, value, timeout=getattr(
+                stats2_settings,
+                'CACHE_TIMEOUT_{}'.format(value_type.upper())))
+
+        return value
+
+    # Public
+    def add(self, identifier, date=None):
+        """
+        Adds the identifier to the distinct ones of the day
+
+        :param identifier: Any value identifying the visitor, user...
+        """
+        date = date or timezone.now().date()
+        if isinstance(date, datetime):
+            date = date.date()
+
+        sketch = self.get_sketch(date)
+        if not sketch.add(identifier):
+            return
+
+        content_type_id, object_id, name, date = self._get_row_key(date)
+        sketch = ModelStatSketch.objects.merge(
+            (content_type_id or 0, object_id or 0, name, date), sketch)
+
+        if stats2_settings.USE_CACHE:
+            cache = get_cache()
+            # The merged sketch includes the additions of other processes
+            cache.set(self._get_cache_key('history', date),
+                      sketch.to_bytes(),
+                      timeout=stats2_settings.CACHE_TIMEOUT_HISTORY)
+            cache.delete_many(self._get_generation_keys())
+
+    def get(self, date=None):
+        if date:
+            return self.get_sketch(date).count()
+        return self.total()
+
+    def get_between_date(self, date_start, date_end):
+        if isinstance(date_start, datetime):
+            date_start = date_start.date()
+        if isinstance(date_end, datetime):
+            date_end = date_end.date()
+
+        assert date_start < date_end, "Start date must be before end date."
+        return self._get_count('between', date_start, date_end)
+
+    def get_series(self, date_start, date_end, fill_zeros=True):
+        if isinstance(date_start, datetime):
+            date_start = date_start.date()
+        if isinstance(date_end, datetime):
+            date_end = date_end.date()
+
+        assert date_start <= date_end, "Start date must be before end date."
+
+        counts = dict(
+            (date, HyperLogLog(registers).count())
+            for date, registers in self._get_queryset(
+                date__gte=date_start, date__lte=date_end,
+            ).values_list('date', 'registers'))
+
+        series = OrderedDict()
+        for days in range((date_end - date_start).days + 1):
+            date = date_start + timedelta(days=days)
+            if counts.get(date) or fill_zeros:
+                series[date] = counts.get(date, 0)
+        return series
+
+    def total(self):
+        return self._get_count('total')
+
+    def incr(self, value=1, date=None):
+        raise NotImplementedError('Unique stats are updated with add().')
+
+    def set(self, value, date=None):
+        raise NotImplementedError('Unique stats are updated with add().')
+
+    def store(self, value, date=None):
+        raise NotImplementedError('Unique stats are updated with add().')
+
+    # Async, the sketches are read in a thread
+    def aget(self, date=None):
+        from asgiref.sync import sync_to_async
+        return sync_to_async(self.get)(date)
+
+    def atotal(self):
+        from asgiref.sync import sync_to_async
+        return sync_to_async(self.total)()
+
+    def aget_between_date(self, date_start, date_end):
+        from asgiref.sync import sync_to_async
+        return sync_to_async(self.get_between_date)(date_start, date_end)
+
+    def aget_series(self, date_start, date_end, fill_zeros=True):
+        from asgiref.sync import sync_to_async
+        return sync_to_async(self.get_series)(date_start, date_end,
+                                              fill_zeros)
+
+    def aincr(self, value=1, date=None):
+        raise NotImplementedError('Unique stats are updated with add().')
+
+    def aset(self, value, date=None):
+        raise NotImplementedError('Unique stats are updated with add().')
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import time
+from datetime import datetime, time as datetime_time, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.utils import timezone
+
+from django_stats2 import settings as stats2_settings
+
+
+def get_cache():
+    """Returns a django cache object based on the settings configuration"""
+    try:
+        cache = caches[stats2_settings.CACHE_KEY]
+    except InvalidCacheBackendError:
+        cache = caches['default']
+    return cache
+
+
+def get_generation(cache, cache_key):
+    """
+    Returns the generation stored in ``cache_key``, part of the cache keys
+    of derived values so all of them are invalidated at once deleting it.
+    """
+    generation = cache.get(cache_key)
+
+    if generation is None:
+        # Never reuse a previous generation, even if the key was evicted
+        generation = int(time.time() * 1000000)
+        if not cache.add(cache_key, generation, timeout=None):
+            generation = cache.get(cache_key, generation)
+
+    return generation
+
+
+def chunks(items, size):
+    """
+    Yields successive lists of ``size`` elements from ``items``, consuming
+    it as they are needed
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Length of the buckets of the stats with a finer granularity than a day
+GRANULARITY_STEPS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+}
+
+
+def get_bucket_range(date_start, date_end, granularity):
+    """
+    Returns the start of every minute or hour of the days between both dates
+    (included).
+
+    :param granularity: ``minute`` or ``hour``
+    :type granularity: string
+    :rtype: list
+    """
+    step = GRANULARITY_STEPS[granularity]
+    start = datetime.combine(date_start, datetime_time())
+    end = datetime.combine(date_end + timedelta(days=1), datetime_time())
+    if settings.USE_TZ:
+        # Days are in UTC, as the buckets of timezone.now()
+        start = timezone.make_aware(start, timezone.get_fixed_timezone(0))
+        end = timezone.make_aware(end, timezone.get_fixed_timezone(0))
+
+    buckets = []
+    while start < end:
+        buckets.append(start)
+        start += step
+    return buckets
+
+
+def get_month_end(date):
+    """Returns the last day of the month of the date"""
+    next_month = (date.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def split_date_range(date_start, date_end):
+    """
+    Splits the range between both dates (included) into the fewest
+    full years, full months and remaining days.
+
+    :returns: Tuple with the list of ``(start, end)`` day ranges, the list
+        of first days of the full months and the list of first days of
+        the full years
+    :rtype: tuple
+    """
+    days, months, years = [], [], []
+    current = date_start
+
+    while current <= date_end:
+        if current.month == 1 and current.day == 1 and \
+                current.replace(month=12, day=31) <= date_end:
+            years.append(current)
+            current = current.replace(year=current.year + 1)
+        elif current.day == 1 and get_month_end(current) <= date_end:
+            months.append(current)
+            current = get_month_end(current) + timedelta(days=1)
+        else:
+            end = min(get_month_end(current), date_end)
+            days.append((current, end))
+            current = end + timedelta(days=1)
+
+    return days, months, years
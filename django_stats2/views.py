@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from django.http import Http404, HttpResponse
+
+from django_stats2 import metrics as stats2_metrics
+from django_stats2 import settings as stats2_settings
+
+
+def metrics(request):
+    """
+    Serves the metrics of the process in the Prometheus text format, only
+    while ``STATS2_METRICS`` is enabled.
+    """
+    if not stats2_settings.METRICS:
+        raise Http404
+    return HttpResponse(stats2_metrics.registry.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Fills the cache with the totals and the recent days of the stats, read from
+the database with a few grouped queries, so the first reads after a cache
+flush don't all fall through to the database at once.
+"""
+from collections import OrderedDict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from django_stats2.models import ModelStat, ModelStatTotal
+from django_stats2.objects import get_stat
+from django_stats2.utils import chunks
+
+
+# Stats read from the database and cached at once
+WARM_BATCH_SIZE = 500
+
+
+def _get_history(stats, days):
+    """
+    Returns the values of the last days of the stats, with the missing
+    days as 0
+    """
+    today = timezone.now().date()
+    dates = [today - timedelta(days=day) for day in range(days)]
+
+    groups = OrderedDict()
+    for key in stats:
+        groups.setdefault((key[0], key[2]), []).append(key[1])
+
+    lookups = []
+    for (content_type_id, name), object_ids in groups.items():
+        if content_type_id:
+            lookups.append(Q(content_type_id=content_type_id, name=name,
+                             object_id__in=object_ids))
+        else:
+            lookups.append(Q(content_type__isnull=True,
+                             object_id__isnull=True, name=name))
+
+    rows = ModelStat.objects.filter(reduce(or_, lookups),
+                                    date__gte=dates[-1], date__lte=today) \
+        .order_by() \
+        .values_list('content_type_id', 'object_id', 'name', 'date') \
+        .annotate(value=Sum('value'))
+    values = dict(((content_type_id or 0, object_id or 0, name, date), value)
+                  for content_type_id, object_id, name, date, value in rows)
+
+    return OrderedDict(
+        (date, dict((stat, values.get(key + (date, ), 0))
+                    for key, stat in stats.items()))
+        for date in dates)
+
+
+def warm_cache(names=None, models=None, days=7, batch_size=WARM_BATCH_SIZE):
+    """
+    Caches the totals and the values of the last ``days`` (today included)
+    of every stat with stored values.
+
+    :param names: Names of the stats to warm, all of them if None
+    :param models: Models of the stats to warm, along with the global
+        stats, all of them if None
+    :type models: list
+    :returns: Number of stats cached
+    :rtype: int
+    """
+    queryset = ModelStatTotal.objects.order_by()
+    if names is not None:
+        queryset = queryset.filter(name__in=names)
+    if models is not None:
+        content_types = ContentType.objects.get_for_models(*models)
+        queryset = queryset.filter(content_type_id__in=[0] + [
+            content_type.pk for content_type in content_types.values()])
+
+    totals = queryset.values_list('content_type_id', 'object_id', 'name') \
+        .annotate(value=Sum('value'))
+
+    count = 0
+    for batch in chunks(totals.iterator(), batch_size):
+        stats = OrderedDict()
+        by_backend = OrderedDict()
+        for content_type_id, object_id, name, value in batch:
+            stat = get_stat(content_type_id, object_id, name)
+            if stat is not None:
+                stats[(content_type_id, object_id, name)] = stat
+                by_backend.setdefault(stat.backend, {})[stat] = value
+
+        for backend, values in by_backend.items():
+            backend.warm_cache(values)
+
+        if stats and days:
+            for date, values in _get_history(stats, days).items():
+                by_backend = OrderedDict()
+                for stat, value in values.items():
+                    by_backend.setdefault(stat.backend, {})[stat] = value
+                for backend, backend_values in by_backend.items():
+                    backend.warm_cache(backend_values, date)
+
+        count += len(stats)
+    return count
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind journal for the cache-only increments.
+
+While ``STATS2_WRITE_BEHIND`` is enabled every increment is also added to a
+*delta* key in the cache. The first time a delta key is created it gets
+registered in a journal (a sequence of numbered slots) so :func:`flush` can
+find it later on and drain it into :class:`django_stats2.models.ModelStat`.
+"""
+from datetime import datetime
+from timeit import default_timer
+
+from django.utils import timezone
+
+from django_stats2 import settings as stats2_settings
+from django_stats2 import signals
+from django_stats2.models import ModelStat
+from django_stats2.utils import chunks, get_cache
+
+
+key_format = {
+    'delta': '{cache_key_prefix}:delta:{content_type_id}:{pk}:{name}:{date}',
+    'slot': '{cache_key_prefix}:journal:{index}',
+    'sequence': '{cache_key_prefix}:journal:sequence',
+    'state': '{cache_key_prefix}:journal:state',
+    'lock': '{cache_key_prefix}:journal:lock',
+}
+
+# Seconds a flush is allowed to run before another one can take over
+LOCK_TIMEOUT = 60 * 10
+
+# Seconds the delta of a past day is kept once retired from the journal,
+# late increments in the meantime register it again
+RETIRED_DELTA_TIMEOUT = 60 * 60 * 24
+
+
+def _get_key(key_type, **kwargs):
+    return key_format[key_type].format(
+        cache_key_prefix=stats2_settings.CACHE_PREFIX, **kwargs)
+
+
+def _get_delta_key(content_type_id, object_id, name, date):
+    # Minute or hour buckets for the stats with a finer granularity
+    return _get_key('delta', content_type_id=content_type_id or '',
+                    pk=object_id or '', name=name, date=date.isoformat())
+
+
+def _to_date(date):
+    # Minute and hour buckets are datetimes
+    if isinstance(date, datetime):
+        return date.date()
+    return date
+
+
+def _register(cache, entry):
+    """Appends the entry to the journal"""
+    sequence_key = _get_key('sequence')
+    try:
+        index = cache.incr(sequence_key)
+    except ValueError:
+        cache.add(sequence_key, 0, timeout=None)
+        index = cache.incr(sequence_key)
+    cache.set(_get_key('slot', index=index), entry, timeout=None)
+
+
+def record(cache, content_type_id, object_id, name, date, value,
+           cache_keys=()):
+    """
+    Adds ``value`` to the pending delta of the stat for the given date.
+
+    :param cache_keys: Cache keys removed on flush, like the stat total,
+        so they get computed again from the database.
+    """
+    delta_key = _get_delta_key(content_type_id, object_id, name, date)
+
+    entry = (content_type_id, object_id, name, date, list(cache_keys))
+
+    try:
+        current = cache.incr(delta_key, value)
+    except ValueError:
+        if cache.add(delta_key, value, timeout=None):
+            _register(cache, entry)
+        else:
+            # Created by another process in the meantime
+            cache.incr(delta_key, value)
+    else:
+        if current == value and _to_date(date) < timezone.now().date():
+            # Drained delta of a past day, possibly retired by a flush
+            _register(cache, entry)
+
+
+def flush(batch_size=None, cache=None):
+    """
+    Writes all the pending deltas into the database.
+
+    Only one flush can run at the same time, concurrent calls return
+    straight away.
+
+    :param batch_size: Number of journal slots processed per query
+    :type batch_size: int
+    :returns: Number of stat rows updated
+    :rtype: int
+    """
+    cache = cache or get_cache()
+    batch_size = batch_size or stats2_settings.FLUSH_BATCH_SIZE
+    lock_key = _get_key('lock')
+
+    if not cache.add(lock_key, True, timeout=LOCK_TIMEOUT):
+        return 0
+
+    try:
+        return _flush(cache, batch_size)
+    finally:
+        cache.delete(lock_key)
+
+
+def _flush(cache, batch_size):
+    state_key = _get_key('state')
+    start, checked = cache.get(state_key) or (0, 0)
+    sequence = cache.get(_get_key('sequence')) or 0
+    today = timezone.now().date()
+    advance = True
+    flushed = 0
+
+    for indexes in chunks(range(start + 1, sequence + 1), batch_size):
+        slot_keys = [_get_key('slot', index=index) for index in indexes]
+        slots = cache.get_many(slot_keys)
+        delta_keys = dict(
+            (slot_key, _get_delta_key(*slots[slot_key][:4]))
+            for slot_key in slot_keys if slot_key in slots)
+        deltas = cache.get_many(list(delta_keys.values()))
+
+        rows = []
+        pending = []
+        seen = set()
+        for index, slot_key in zip(indexes, slot_keys):
+            entry = slots.get(slot_key)
+            delta_key = delta_keys.get(slot_key)
+            # Deltas registered again have more than one slot
+            value = deltas.get(delta_key, 0) if delta_key not in seen else 0
+            seen.add(delta_key)
+            if value:
+                rows.append(entry[:4] + (value, ))
+            pending.append((index, slot_key, delta_key, value, entry))
+
+        started = default_timer()
+        ModelStat.objects.incr_many(rows)
+        signals.flushed.send(sender=ModelStat, rows=len(rows),
+                             duration=default_timer() - started)
+
+        stale = []
+        retired = []
+        for index, slot_key, delta_key, value, entry in pending:
+            if entry is None:
+                if index > checked:
+                    # Registered but not written yet, keep it for the
+                    # next flush
+                    advance = False
+                elif advance:
+                    # Retired or evicted
+                    start = index
+                continue
+
+            remaining = 0
+            if value:
+                # Keep anything added since the delta was read
+                try:
+                    remaining = cache.decr(delta_key, value)
+                except ValueError:
+                    pass
+                stale.extend(entry[4])
+
+            if _to_date(entry[3]) < today and not remaining:
+                # Past days rarely get new increments, stop tracking them.
+                # The delta is left to expire instead of deleted, so the
+                # increments done since it was drained are not lost, and
+                # late increments register it again.
+                stale.append(slot_key)
+                retired.append(delta_key)
+                if advance:
+                    start = index
+            else:
+                advance = False
+
+        cache.delete_many(stale)
+        if hasattr(cache, 'touch'):
+            # Django >= 2.1
+            for delta_key in retired:
+                cache.touch(delta_key, RETIRED_DELTA_TIMEOUT)
+        flushed += len(rows)
+
+    cache.set(state_key, (start, sequence), timeout=None)
+    return flushed
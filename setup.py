@@ -30,7 +30,10 @@ setup(
     name='django_stats2',
     packages=[
         'django_stats2',
+        'django_stats2/backends',
         'django_stats2/migrations',
+        'django_stats2/management',
+        'django_stats2/management/commands',
     ],
     version=VERSION,
     description='Easily create stats for your models',
@@ -0,0 +1,36 @@
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.test.testcases import TransactionTestCase
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.models import (
+    ModelStat, ModelStatBucket, ModelStatRollup, ModelStatSketch,
+    ModelStatTotal)
+
+from .models import Note
+
+
+class StatsTestCase(TransactionTestCase):
+    """
+    Removes the notes, and the stored and cached stats values, after every
+    test.
+    """
+    def setUp(self):
+        # Warm up the content types cache, cleared between tests
+        ContentType.objects.get_for_model(Note)
+        self.cache = caches[stats2_settings.CACHE_KEY]
+        self.today = datetime.date.today()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+
+    def tearDown(self):
+        Note.objects.all().delete()
+        self.reset()
+
+    def reset(self):
+        """Removes the stored and cached stats values"""
+        for model in (ModelStat, ModelStatBucket, ModelStatRollup,
+                      ModelStatSketch, ModelStatTotal):
+            model.objects.all().delete()
+        self.cache.clear()
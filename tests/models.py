@@ -2,7 +2,8 @@
 
 from django.db import models
 
-from django_stats2.fields import StatField
+from django_stats2.fields import StatField, UniqueStatField
+from django_stats2.managers import StatsManager
 from django_stats2.mixins import StatsMixin
 
 
@@ -12,3 +13,6 @@ class Note(StatsMixin, models.Model):
 
     reads = StatField()
     edits = StatField()
+    visitors = UniqueStatField()
+
+    objects = StatsManager()
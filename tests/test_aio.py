@@ -0,0 +1,204 @@
+import asyncio
+import datetime
+from collections import OrderedDict
+from unittest import skipIf
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from asgiref.sync import sync_to_async
+    from django_stats2 import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+from django.core.cache import caches
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.models import ModelStat, ModelStatSketch
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+from .models import Note
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class AsyncCache(object):
+    """Wraps a cache adding the async methods of django >= 4.0"""
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __getattr__(self, name):
+        if name.startswith('a') and hasattr(self.cache, name[1:]):
+            return sync_to_async(getattr(self.cache, name[1:]))
+        return getattr(self.cache, name)
+
+
+@skipIf(aio is None, 'asgiref is not installed')
+class AsyncStatTestCase(StatsTestCase):
+    def setUp(self):
+        super(AsyncStatTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = self.note.reads
+
+    def test_incr_and_get(self):
+        run(self.stat.aincr(3, date=self.today))
+        run(self.stat.adecr(date=self.today))
+        run(self.stat.aset(5, date=self.yesterday))
+
+        self.assertEqual(run(self.stat.aget(self.today)), 2)
+        self.assertEqual(run(self.stat.atotal()), 7)
+        self.assertEqual(
+            run(self.stat.aget_between_date(self.yesterday, self.today)), 7)
+        self.assertEqual(
+            list(run(self.stat.aget_series(self.yesterday,
+                                           self.today)).values()),
+            [5, 2])
+        self.assertEqual(self.stat.total(), 7)
+
+    def test_series(self):
+        last_week = self.today - datetime.timedelta(days=7)
+        run(self.stat.aincr(date=last_week))
+        run(self.stat.aincr(2, date=self.today))
+
+        series = run(self.stat.aget_series(last_week, self.today))
+        self.assertEqual(series, self.stat.get_series(last_week, self.today))
+        self.assertEqual(len(series), 8)
+        self.assertEqual(
+            run(self.stat.aget_series(last_week, self.today,
+                                      fill_zeros=False)),
+            OrderedDict([(last_week, 1), (self.today, 2)]))
+
+    def test_set_defaults_to_today(self):
+        run(self.stat.aincr(2, date=self.yesterday))
+        run(self.stat.aset(10))
+
+        self.assertEqual(self.stat.get(self.today), 10)
+        self.assertEqual(self.stat.total(), 12)
+
+    def test_global_stat(self):
+        stat = Stat(name='visits')
+        run(stat.aincr(date=self.today))
+
+        self.assertEqual(run(stat.atotal()), 1)
+
+    def test_buffered_stats(self):
+        async def view():
+            async with aio.buffered_stats():
+                await self.stat.aincr(date=self.today)
+                await self.stat.aincr(date=self.today)
+                await self.note.edits.aincr(date=self.today)
+                self.assertEqual(
+                    await sync_to_async(ModelStat.objects.count)(), 0)
+
+        run(view())
+
+        self.assertEqual(self.stat.total(), 2)
+        self.assertEqual(self.note.edits.total(), 1)
+
+    def test_set_after_buffered_increments(self):
+        async def view():
+            async with aio.buffered_stats():
+                await self.stat.aincr(date=self.today)
+                await self.stat.aset(0, date=self.today)
+
+        run(view())
+
+        self.assertEqual(self.stat.get(self.today), 0)
+
+    def test_buffers_are_local_to_the_task(self):
+        async def buffered():
+            async with aio.buffered_stats():
+                await asyncio.sleep(0)
+                await self.stat.aincr(date=self.today)
+                await asyncio.sleep(0)
+
+        async def direct():
+            await asyncio.sleep(0)
+            await self.note.edits.aincr(date=self.today)
+            await asyncio.sleep(0)
+            self.assertEqual(self.note.edits.get(self.today), 1)
+
+        run(asyncio.gather(buffered(), direct()))
+
+        self.assertEqual(self.stat.total(), 1)
+
+    def test_prefetch_stats(self):
+        self.stat.incr(2, date=self.today)
+        self.note.edits.incr(date=self.today)
+        note = Note.objects.get()
+
+        run(aio.prefetch_stats([note], 'reads', 'edits'))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(note.reads.total(), 2)
+            self.assertEqual(note.edits.total(), 1)
+
+
+    def test_unique_stat(self):
+        self.addCleanup(ModelStatSketch.objects.all().delete)
+        for i in range(50):
+            self.note.visitors.add(i, date=self.today)
+        self.note.visitors.add(0, date=self.yesterday)
+
+        self.assertEqual(run(self.note.visitors.atotal()), 50)
+        self.assertEqual(run(self.note.visitors.aget(self.today)), 50)
+        self.assertEqual(
+            run(self.note.visitors.aget_between_date(self.yesterday,
+                                                     self.today)),
+            50)
+        self.assertEqual(
+            list(run(self.note.visitors.aget_series(self.yesterday,
+                                                    self.today)).values()),
+            [1, 50])
+
+        note = Note.objects.get()
+        run(aio.prefetch_stats([note], 'reads', 'visitors'))
+        self.assertEqual(note.visitors._prefetched, {})
+
+@skipIf(aio is None, 'asgiref is not installed')
+class NativeAsyncCacheTestCase(AsyncStatTestCase):
+    def setUp(self):
+        super(NativeAsyncCacheTestCase, self).setUp()
+        patcher = mock.patch(
+            'django_stats2.backends.cache.get_cache',
+            return_value=AsyncCache(caches[stats2_settings.CACHE_KEY]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_miss_lock_is_released(self):
+        cache = caches[stats2_settings.CACHE_KEY]
+        self.stat.incr(3, date=self.today)
+        cache.clear()
+
+        self.assertEqual(run(self.stat.atotal()), 3)
+        self.assertIsNone(cache.get(self.stat._get_cache_key() + ':lock'))
+
+    def test_waits_for_the_locked_value(self):
+        cache = caches[stats2_settings.CACHE_KEY]
+        cache_key = self.stat._get_cache_key()
+        cache.set(cache_key + ':lock', True)
+
+        async def sleep(seconds):
+            # Cached by the process holding the lock
+            cache.set(cache_key, 5)
+
+        with mock.patch('asyncio.sleep', side_effect=sleep):
+            with self.assertNumQueries(0):
+                self.assertEqual(run(self.stat.atotal()), 5)
+
+        # Not released, it's not ours
+        self.assertTrue(cache.get(cache_key + ':lock'))
+
+    def test_cache_is_used_natively(self):
+        cache = self.stat.backend.cache_backend.cache
+        self.assertIs(aio._get_async_cache(self.stat.backend), cache)
+
+        run(self.stat.aincr(date=self.today))
+        self.assertEqual(cache.get(self.stat._get_cache_key('history',
+                                                            self.today)), 1)
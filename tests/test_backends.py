@@ -0,0 +1,419 @@
+import datetime
+import time
+from unittest import skipIf
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test.testcases import TransactionTestCase
+from django.utils import timezone
+
+from django_stats2 import backends
+from django_stats2 import settings as stats2_settings
+from django_stats2.backends.cache import CacheBackend, HashCacheBackend
+from django_stats2.backends.memory import MemoryBackend
+from django_stats2.backends.redis import RedisHashBackend
+from django_stats2.buffer import buffered_stats
+from django_stats2.models import ModelStat
+from django_stats2.objects import Stat
+from django_stats2.prefetch import prefetch_stats
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class FakeRedis(object):
+    """Redis client stand-in with the hash commands used by the backend"""
+    def __init__(self):
+        self.hashes = {}
+        self.round_trips = 0
+
+    def hget(self, key, field):
+        self.round_trips += 1
+        return self.hashes.get(key, {}).get(field)
+
+    def hmget(self, key, fields):
+        self.round_trips += 1
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    def hset(self, key, field, value):
+        self.round_trips += 1
+        self.hashes.setdefault(key, {})[field] = str(value).encode()
+
+    def hincrby(self, key, field, value):
+        self.round_trips += 1
+        values = self.hashes.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + value).encode()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args):
+            self.commands.append((name, args))
+        return command
+
+    def execute(self):
+        results = [getattr(self.client, name)(*args)
+                   for name, args in self.commands]
+        self.client.round_trips -= len(self.commands) - 1
+        return results
+
+
+class BackendOperationsBase(object):
+    def setUp(self):
+        super(BackendOperationsBase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+
+    def tearDown(self):
+        super(BackendOperationsBase, self).tearDown()
+        backends._backends.clear()
+
+    def test_backend_is_selected_by_name(self):
+        self.assertIsInstance(self.note.reads.backend, self.backend_class)
+        self.assertIs(self.note.reads.backend,
+                      Stat(name='reads').backend)
+        self.assertIs(self.note.edits.backend, backends.get_backend())
+
+    def test_operations(self):
+        stat = self.note.reads
+
+        with self.assertNumQueries(0):
+            stat.incr(3, date=self.today)
+            stat.decr(date=self.today)
+            stat.set(5, date=self.yesterday)
+
+            self.assertEqual(stat.get(date=self.today), 2)
+            self.assertEqual(stat.total(), 7)
+            self.assertEqual(stat.get_between_date(self.yesterday,
+                                                   self.today), 7)
+            self.assertEqual(list(stat.get_series(self.yesterday,
+                                                  self.today).values()),
+                             [5, 2])
+
+        self.assertEqual(ModelStat.objects.count(), 0)
+
+    def test_global_stats(self):
+        stat = Stat(name='reads')
+        stat.incr(date=self.today)
+
+        self.assertEqual(stat.total(), 1)
+        self.assertEqual(self.note.reads.total(), 0)
+
+    def test_buffer_writes_every_backend(self):
+        with buffered_stats():
+            self.note.reads.incr(date=self.today)
+            self.note.reads.incr(date=self.today)
+            self.note.edits.incr(date=self.today)
+
+        self.assertEqual(self.note.reads.total(), 2)
+        self.assertEqual(ModelStat.objects.get().name, 'edits')
+
+    @mock.patch.object(stats2_settings, 'GRANULARITY', {'reads': 'hour'})
+    def test_buckets(self):
+        moment = datetime.datetime.combine(self.today, datetime.time(10))
+        if settings.USE_TZ:
+            moment = timezone.make_aware(moment, timezone.utc)
+        self.note.reads.incr(2, date=moment)
+        self.note.reads.incr(date=moment + datetime.timedelta(minutes=30))
+        self.note.reads.incr(date=moment + datetime.timedelta(hours=1))
+
+        self.assertEqual(
+            self.note.reads.get_buckets(self.today, fill_zeros=False),
+            {moment: 3, moment + datetime.timedelta(hours=1): 1})
+        self.assertEqual(len(self.note.reads.get_buckets(self.today)), 24)
+        self.assertEqual(self.note.reads.get(self.today), 4)
+        self.assertEqual(self.note.reads.total(), 4)
+
+    def test_prefetch(self):
+        self.note.reads.incr(2, date=self.today)
+        self.note.edits.incr(3, date=self.today)
+        note = Note.objects.get()
+
+        prefetch_stats([note], 'reads', 'edits')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(note.reads.total(), 2)
+            self.assertEqual(note.edits.total(), 3)
+
+
+@mock.patch.object(stats2_settings, 'STAT_BACKENDS', {'reads': 'memory'})
+@mock.patch.object(stats2_settings, 'BACKENDS', {
+    'memory': {'BACKEND': 'django_stats2.backends.memory.MemoryBackend'},
+})
+class MemoryBackendTestCase(BackendOperationsBase, StatsTestCase):
+    backend_class = MemoryBackend
+
+
+@mock.patch.object(stats2_settings, 'STAT_BACKENDS', {'reads': 'redis'})
+@mock.patch.object(stats2_settings, 'BACKENDS', {
+    'redis': {
+        'BACKEND': 'django_stats2.backends.redis.RedisHashBackend',
+        'OPTIONS': {'CLIENT': 'tests.test_backends.FakeRedis'},
+    },
+})
+class RedisHashBackendTestCase(BackendOperationsBase, StatsTestCase):
+    backend_class = RedisHashBackend
+
+    def test_single_hash_per_stat(self):
+        self.note.reads.incr(date=self.today)
+        self.note.reads.incr(date=self.yesterday)
+
+        client = self.note.reads.backend.client
+        self.assertEqual(list(client.hashes),
+                         [self.note.reads._get_cache_key('hash')])
+        self.assertEqual(
+            sorted(client.hashes[self.note.reads._get_cache_key('hash')]),
+            sorted(['total', self.today.isoformat(),
+                    self.yesterday.isoformat()]))
+
+    def test_incr_is_a_single_round_trip(self):
+        client = self.note.reads.backend.client
+
+        self.note.reads.incr(date=self.today)
+
+        self.assertEqual(client.round_trips, 1)
+
+
+class GetBackendTestCase(TransactionTestCase):
+    def tearDown(self):
+        backends._backends.clear()
+
+    def test_unknown_alias(self):
+        self.assertRaises(ImproperlyConfigured, backends.get_backend,
+                          'unknown')
+
+    @mock.patch.object(stats2_settings, 'GRANULARITY', {'reads': 'hour'})
+    @mock.patch.object(stats2_settings, 'STAT_BACKENDS',
+                       {'reads': 'cache', 'edits': 'cache'})
+    @mock.patch.object(stats2_settings, 'BACKENDS', {
+        'cache': {'BACKEND': 'django_stats2.backends.cache.CacheBackend'},
+    })
+    def test_buckets_not_supported(self):
+        self.assertRaises(ImproperlyConfigured, backends.get_stat_backend,
+                          'reads')
+        self.assertIsInstance(backends.get_stat_backend('edits'),
+                              CacheBackend)
+
+
+class HashCacheLayoutTestCase(StatsTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(stats2_settings, 'BACKENDS', {
+            'default': {
+                'BACKEND': 'django_stats2.backends.default.DefaultBackend',
+                'OPTIONS': {'LAYOUT': 'hash'},
+            },
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Backends created by previous tests with the default settings
+        backends._backends.clear()
+
+        super(HashCacheLayoutTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = self.note.reads
+
+    def tearDown(self):
+        super(HashCacheLayoutTestCase, self).tearDown()
+        backends._backends.clear()
+        self.clear_cache()
+
+    def clear_cache(self):
+        self.cache.clear()
+
+    def get_fields(self):
+        return self.cache.get(self.stat._get_cache_key('hash'))
+
+    def test_layout(self):
+        self.assertIsInstance(self.stat.backend.cache_backend,
+                              HashCacheBackend)
+
+    def test_single_entry_per_stat(self):
+        self.stat.incr(2, date=self.yesterday)
+        self.stat.incr(date=self.today)
+
+        self.assertEqual(self.get_fields(), {
+            self.yesterday.isoformat(): 2,
+            self.today.isoformat(): 1,
+        })
+        self.assertIsNone(self.cache.get(self.stat._get_cache_key('total')))
+
+    def test_total_is_only_incremented_once_cached(self):
+        self.stat.incr(2, date=self.today)
+        self.assertEqual(self.stat.total(), 2)
+
+        self.stat.incr(date=self.today)
+
+        self.assertEqual(self.get_fields()['total'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.stat.total(), 3)
+
+    def test_reads_are_cached(self):
+        self.stat.set(3, date=self.yesterday)
+        self.stat.incr(date=self.today)
+        self.clear_cache()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.stat.get(date=self.yesterday), 3)
+            self.assertEqual(
+                list(self.stat.get_series(self.yesterday,
+                                          self.today).values()),
+                [3, 1])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.stat.get(date=self.yesterday), 3)
+            self.assertEqual(
+                list(self.stat.get_series(self.yesterday,
+                                          self.today).values()),
+                [3, 1])
+
+    def test_set_drops_the_cached_total(self):
+        self.stat.incr(date=self.today)
+        self.stat.total()
+
+        self.stat.set(5, date=self.yesterday)
+
+        self.assertNotIn('total', self.get_fields())
+        self.assertEqual(self.stat.total(), 6)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisHashCacheLayoutTestCase(HashCacheLayoutTestCase):
+    def setUp(self):
+        super(RedisHashCacheLayoutTestCase, self).setUp()
+        self.client = fakeredis.FakeStrictRedis()
+        patcher = mock.patch.object(HashCacheBackend, 'get_client',
+                                    return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def clear_cache(self):
+        super(RedisHashCacheLayoutTestCase, self).clear_cache()
+        self.client.flushall()
+
+    def get_fields(self):
+        fields = self.client.hgetall(
+            self.cache.make_key(self.stat._get_cache_key('hash')))
+        return dict((field.decode(), int(value))
+                    for field, value in fields.items())
+
+    def test_incr_is_a_single_round_trip(self):
+        with mock.patch.object(self.client, 'pipeline',
+                               wraps=self.client.pipeline) as pipeline:
+            self.stat.incr(date=self.today)
+
+        self.assertEqual(pipeline.call_count, 1)
+
+
+@mock.patch.object(stats2_settings, 'MISS_LOCK_WAIT', 0.1)
+class CacheMissLockTestCase(StatsTestCase):
+    def setUp(self):
+        super(CacheMissLockTestCase, self).setUp()
+        self.stat = Stat(name='total_visits')
+        self.stat.incr(3, date=self.today)
+        self.cache.clear()
+
+    def lock(self, cache_key):
+        self.cache.set(cache_key + ':lock', True)
+
+    def test_lock_is_released(self):
+        self.assertEqual(self.stat.total(), 3)
+
+        self.assertIsNone(
+            self.cache.get(self.stat._get_cache_key() + ':lock'))
+
+    def test_waits_for_the_locked_value(self):
+        cache_key = self.stat._get_cache_key()
+        self.lock(cache_key)
+
+        def sleep(seconds):
+            # Cached by the process holding the lock
+            self.cache.set(cache_key, 5)
+
+        with mock.patch('time.sleep', side_effect=sleep) as sleep_mock:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.stat.total(), 5)
+
+        self.assertEqual(sleep_mock.call_count, 1)
+        # Not released, it's not ours
+        self.assertTrue(self.cache.get(cache_key + ':lock'))
+
+    def test_reads_the_value_after_waiting(self):
+        self.lock(self.stat._get_cache_key('history', self.today))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.stat.get(self.today), 3)
+
+    @mock.patch.object(stats2_settings, 'MISS_LOCK_TIMEOUT', 0)
+    def test_disabled(self):
+        self.lock(self.stat._get_cache_key())
+
+        with mock.patch('time.sleep') as sleep_mock:
+            self.assertEqual(self.stat.total(), 3)
+
+        self.assertFalse(sleep_mock.called)
+
+    def get_between_key(self):
+        return self.stat._get_cache_key(
+            'between', self.yesterday, self.today,
+            generation=self.stat.backend.cache_backend.get_generation(
+                self.stat))
+
+    def test_between_waits_for_the_locked_value(self):
+        cache_key = self.get_between_key()
+        self.lock(cache_key)
+
+        def sleep(seconds):
+            self.cache.set(cache_key, 7)
+
+        with mock.patch('time.sleep', side_effect=sleep):
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    self.stat.get_between_date(self.yesterday, self.today), 7)
+
+    @mock.patch.object(stats2_settings, 'BETWEEN_EARLY_RECOMPUTE', 1)
+    def test_between_early_recompute(self):
+        self.assertEqual(
+            self.stat.get_between_date(self.yesterday, self.today), 3)
+        cache_key = self.get_between_key()
+        # Cached along with the time it took and its expiration
+        value, delta, expiry = self.cache.get(cache_key)
+        self.assertEqual(value, 3)
+        self.assertGreater(expiry, time.time())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.stat.get_between_date(self.yesterday, self.today), 3)
+
+        # Slow to compute and about to expire
+        self.cache.set(cache_key, (3, 60 * 60, time.time() + 1))
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.stat.get_between_date(self.yesterday, self.today), 3)
+        self.assertGreater(self.cache.get(cache_key)[2], time.time() + 60)
+
+    @mock.patch.object(stats2_settings, 'BETWEEN_EARLY_RECOMPUTE', 1)
+    def test_between_early_recompute_locked(self):
+        cache_key = self.get_between_key()
+        self.cache.set(cache_key, (5, 60 * 60, time.time() + 1))
+        self.lock(cache_key)
+
+        # Being refreshed by another process
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.stat.get_between_date(self.yesterday, self.today), 5)
@@ -0,0 +1,126 @@
+import datetime
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.buffer import buffered_stats, get_buffer
+from django_stats2.middleware import StatsBufferMiddleware
+from django_stats2.models import ModelStat
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class BufferTestCase(StatsTestCase):
+    def setUp(self):
+        super(BufferTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = Stat(name='total_visits')
+
+    def test_increments_are_written_on_exit(self):
+        with buffered_stats():
+            with self.assertNumQueries(0):
+                for i in range(10):
+                    self.note.reads.incr(date=self.today)
+                    self.stat.incr(date=self.today)
+
+            self.assertIsNone(caches[stats2_settings.CACHE_KEY].get(
+                self.note.reads._get_cache_key('history', self.today)))
+
+        self.assertEqual(self.note.reads.get(date=self.today), 10)
+        self.assertEqual(self.note.reads.total(), 10)
+        self.assertEqual(self.stat.get(date=self.today), 10)
+        self.assertEqual(
+            ModelStat.objects.get(name='reads', object_id=self.note.pk).value,
+            10)
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 10)
+
+    def test_flush_is_a_single_bulk_write(self):
+        ModelStat.objects.create(name='total_visits', date=self.today, value=1)
+
+        # One upsert for the model stats, update plus insert for the global
+        # ones (within a savepoint) and one upsert for the rollups and totals
+        with self.assertNumQueries(9):
+            with buffered_stats():
+                for i in range(10):
+                    self.note.reads.incr(date=self.today)
+                    self.note.edits.incr(date=self.today)
+                    self.stat.incr(date=self.today)
+                    self.stat.incr(
+                        date=self.today + datetime.timedelta(days=-1))
+
+        self.assertEqual(ModelStat.objects.count(), 4)
+        self.assertEqual(
+            ModelStat.objects.get(name='total_visits', date=self.today).value,
+            11)
+
+    def test_decr_is_coalesced(self):
+        with buffered_stats():
+            self.stat.incr(3, date=self.today)
+            self.stat.decr(date=self.today)
+
+        self.assertEqual(self.stat.get(date=self.today), 2)
+        self.assertEqual(ModelStat.objects.get().value, 2)
+
+    def test_set_after_buffered_increments(self):
+        with buffered_stats():
+            self.stat.incr(date=self.today)
+            self.note.reads.incr(date=self.today)
+            self.stat.set(0, date=self.today)
+            self.stat.incr(2, date=self.today)
+
+            # Increments of other stats are still buffered
+            self.assertEqual(
+                ModelStat.objects.filter(name='reads').count(), 0)
+
+        self.assertEqual(self.stat.get(date=self.today), 2)
+        self.assertEqual(self.stat.total(), 2)
+        self.assertEqual(self.note.reads.get(date=self.today), 1)
+
+    def test_flush_invalidates_between_values(self):
+        date_start = self.today + datetime.timedelta(days=-1)
+        self.assertEqual(self.stat.get_between_date(date_start, self.today), 0)
+
+        with buffered_stats():
+            self.stat.incr(2, date=self.today)
+
+        self.assertEqual(self.stat.get_between_date(date_start, self.today), 2)
+
+    def test_nested_blocks_flush_on_outermost_exit(self):
+        with buffered_stats() as outer:
+            with buffered_stats() as inner:
+                self.stat.incr(date=self.today)
+
+            self.assertIs(outer, inner)
+            self.assertEqual(ModelStat.objects.count(), 0)
+
+        self.assertIsNone(get_buffer())
+        self.assertEqual(ModelStat.objects.get().value, 1)
+
+    def test_decorator(self):
+        @buffered_stats()
+        def task():
+            self.stat.incr(date=self.today)
+            self.stat.incr(date=self.today)
+            return ModelStat.objects.count()
+
+        self.assertEqual(task(), 0)
+        self.assertEqual(ModelStat.objects.get().value, 2)
+
+    def test_middleware(self):
+        middleware = StatsBufferMiddleware()
+        request = RequestFactory().get('/')
+
+        middleware.process_request(request)
+        self.stat.incr(date=self.today)
+        self.stat.incr(date=self.today)
+        self.assertEqual(ModelStat.objects.count(), 0)
+
+        response = middleware.process_response(request, HttpResponse())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(get_buffer())
+        self.assertEqual(ModelStat.objects.get().value, 2)
@@ -0,0 +1,132 @@
+import datetime
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.models import ModelStat
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class CompactTestCase(StatsTestCase):
+    def setUp(self):
+        super(CompactTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = Stat(name='total_visits')
+        self.old_days = [datetime.date(2015, 1, 10),
+                         datetime.date(2015, 1, 20),
+                         datetime.date(2015, 3, 5)]
+
+        for day in self.old_days:
+            self.stat.incr(2, date=day)
+            self.note.reads.incr(1, date=day)
+        self.stat.incr(1, date=self.today)
+        self.note.reads.incr(1, date=self.today)
+
+    def compact(self, *args):
+        out = StringIO()
+        call_command('stats2_compact', *args, stdout=out)
+        caches[stats2_settings.CACHE_KEY].clear()
+        return out.getvalue()
+
+    def test_totals_and_months_are_kept(self):
+        out = self.compact('--days', '30')
+
+        self.assertIn('Compacted 6 daily stat values.', out)
+        self.assertFalse(ModelStat.objects.filter(
+            date__lt=self.today.replace(day=1)).exists())
+        self.assertEqual(self.stat.total(), 7)
+        self.assertEqual(self.note.reads.total(), 4)
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 1, 1), datetime.date(2015, 12, 31)), 6)
+        self.assertEqual(self.stat.get(self.today), 1)
+
+    def test_current_months_are_kept(self):
+        # The retention ends in the middle of the current month
+        self.stat.incr(1, date=self.today - datetime.timedelta(days=1))
+
+        self.compact('--days', '0')
+
+        self.assertEqual(ModelStat.objects.filter(
+            date__gte=self.today.replace(day=1)).count(),
+            2 + int(self.today.day > 1))
+
+    def test_stats_without_retention_are_kept(self):
+        self.assertIn('Compacted 0 daily stat values.', self.compact())
+        self.assertEqual(ModelStat.objects.count(), 8)
+
+    @mock.patch.object(stats2_settings, 'RETENTION',
+                       {'reads': 30, 'total_visits': None})
+    def test_retention_by_stat(self):
+        self.compact('--days', '30')
+
+        self.assertEqual(ModelStat.objects.filter(name='reads').count(), 1)
+        self.assertEqual(
+            ModelStat.objects.filter(name='total_visits').count(), 4)
+
+    def test_stat_option(self):
+        self.compact('--days', '30', '--stat', 'reads')
+
+        self.assertEqual(ModelStat.objects.filter(name='reads').count(), 1)
+        self.assertEqual(
+            ModelStat.objects.filter(name='total_visits').count(), 4)
+
+    def test_small_batches(self):
+        self.compact('--days', '30', '--batch-size', '1')
+
+        self.assertEqual(ModelStat.objects.count(), 2)
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 1, 1), datetime.date(2015, 1, 31)), 4)
+
+    def test_missing_rollups_are_folded(self):
+        # Written without updating the aggregates
+        ModelStat.objects.create(name='total_visits', value=5,
+                                 date=datetime.date(2015, 2, 1))
+
+        self.compact('--days', '30')
+
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 2, 1), datetime.date(2015, 2, 28)), 5)
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 1, 1), datetime.date(2015, 12, 31)), 11)
+        self.assertEqual(self.stat.total(), 12)
+
+    def test_lower_days_are_folded(self):
+        # Updated without the aggregates
+        ModelStat.objects.filter(name='total_visits',
+                                 date=datetime.date(2015, 1, 20)) \
+            .update(value=0)
+
+        self.compact('--days', '30')
+
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 1, 1), datetime.date(2015, 1, 31)), 2)
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 1, 1), datetime.date(2015, 12, 31)), 4)
+        self.assertEqual(self.stat.total(), 5)
+
+    def test_set_sharded_stat(self):
+        with mock.patch.object(stats2_settings, 'SHARDS',
+                               {'total_visits': 4}):
+            for i in range(40):
+                self.stat.incr(date=datetime.date(2015, 2, 10))
+            # Merges the shards of the day into one row
+            self.stat.set(100, date=datetime.date(2015, 2, 10))
+
+        self.compact('--days', '30')
+
+        self.assertEqual(self.stat.get_between_date(
+            datetime.date(2015, 2, 1), datetime.date(2015, 2, 28)), 100)
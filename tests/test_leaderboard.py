@@ -0,0 +1,94 @@
+import datetime
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django_stats2 import leaderboard
+from django_stats2 import settings as stats2_settings
+from django_stats2.leaderboard import HeavyHitters, top
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class TopTestCase(StatsTestCase):
+    def setUp(self):
+        super(TopTestCase, self).setUp()
+        self.last_week = self.today + datetime.timedelta(days=-7)
+        self.notes = []
+        for i in range(5):
+            note = Note.objects.create(title=str(i), content=str(i))
+            note.reads.incr(i + 1, date=self.today)
+            note.reads.incr(10 - i * 2, date=self.last_week)
+            self.notes.append(note)
+
+    def test_top_totals(self):
+        # Ranking query and instances
+        with self.assertNumQueries(2):
+            ranking = top(Note, 'reads', 3)
+
+        self.assertEqual(ranking, [(self.notes[0], 11),
+                                   (self.notes[1], 10),
+                                   (self.notes[2], 9)])
+
+    def test_top_between_dates(self):
+        ranking = top(Note, 'reads', 2,
+                      self.today + datetime.timedelta(days=-1), self.today)
+
+        self.assertEqual(ranking, [(self.notes[4], 5), (self.notes[3], 4)])
+
+    def test_top_is_cached_until_a_write(self):
+        top(Note, 'reads', 3)
+
+        # Only the instances
+        with self.assertNumQueries(1):
+            top(Note, 'reads', 3)
+
+        self.notes[4].reads.incr(10, date=self.today)
+
+        self.assertEqual(top(Note, 'reads', 1), [(self.notes[4], 17)])
+
+    def test_top_skips_deleted_instances(self):
+        top(Note, 'reads', 2)
+        self.notes[0].delete()
+
+        self.assertEqual(top(Note, 'reads', 2), [(self.notes[1], 10)])
+
+
+class HeavyHittersTestCase(TestCase):
+    def test_space_saving(self):
+        tracker = HeavyHitters(2)
+        tracker.add('a', 5)
+        tracker.add('b', 2)
+        tracker.add('c')
+
+        # 'c' replaced 'b' and inherited its count as the error
+        self.assertEqual(tracker.top(2), [('a', 5, 0), ('c', 3, 2)])
+        self.assertEqual(tracker.top(1), [('a', 5, 0)])
+
+
+@mock.patch.object(stats2_settings, 'HEAVY_HITTERS_CAPACITY', 10)
+class ApproximateTopTestCase(StatsTestCase):
+    def setUp(self):
+        super(ApproximateTopTestCase, self).setUp()
+        self.notes = [Note.objects.create(title=str(i), content=str(i))
+                      for i in range(3)]
+
+    def tearDown(self):
+        super(ApproximateTopTestCase, self).tearDown()
+        leaderboard._trackers.clear()
+
+    def test_approximate_top(self):
+        for i, note in enumerate(self.notes):
+            note.reads.incr(i + 1)
+        self.notes[0].reads.decr()
+
+        # Only the instances
+        with self.assertNumQueries(1):
+            ranking = top(Note, 'reads', 2, approximate=True)
+
+        self.assertEqual(ranking, [(self.notes[2], 3), (self.notes[1], 2)])
+        self.assertEqual(top(Note, 'edits', approximate=True), [])
@@ -0,0 +1,99 @@
+from unittest import TestCase
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django_stats2 import settings as stats2_settings
+from django_stats2.local import LocalCache
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+
+
+class LocalCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = LocalCache(max_entries=2)
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', 1, ttl=10)
+        self.assertEqual(self.cache.get('a'), 1)
+
+    def test_expiration(self):
+        with mock.patch('django_stats2.local.default_timer',
+                        return_value=100):
+            self.cache.set('a', 1, ttl=10)
+        with mock.patch('django_stats2.local.default_timer',
+                        return_value=111):
+            self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_are_dropped(self):
+        self.cache.set('a', 1, ttl=10)
+        self.cache.set('b', 2, ttl=10)
+        self.cache.get('a')
+        self.cache.set('c', 3, ttl=10)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_delete_many(self):
+        self.cache.set('a', 1, ttl=10)
+        self.cache.delete_many(['a', 'b'])
+        self.assertIsNone(self.cache.get('a'))
+
+
+@mock.patch.object(stats2_settings, 'LOCAL_CACHE', {'total_visits': 60})
+class LocalCacheBackendTestCase(StatsTestCase):
+    def setUp(self):
+        super(LocalCacheBackendTestCase, self).setUp()
+        self.stat = Stat(name='total_visits')
+        self.other = Stat(name='total_reads')
+        self.stat.incr(3, date=self.today)
+        self.other.incr(2, date=self.today)
+        self.stat.backend.local_cache.clear()
+
+        self.cache_get_many = mock.patch.object(
+            type(self.cache), 'get_many', autospec=True,
+            side_effect=type(self.cache).get_many)
+
+    def test_reads_skip_the_shared_cache(self):
+        self.assertEqual(self.stat.total(), 3)
+        self.assertEqual(self.stat.get(self.today), 3)
+
+        with self.cache_get_many as get_many:
+            self.assertEqual(self.stat.total(), 3)
+            self.assertEqual(self.stat.get(self.today), 3)
+            self.assertEqual(self.other.total(), 2)
+
+        # Only the stat not listed
+        self.assertEqual(get_many.call_count, 1)
+
+    def test_writes_drop_the_local_values(self):
+        self.assertEqual(self.stat.total(), 3)
+        self.assertEqual(self.stat.get(self.today), 3)
+
+        self.stat.incr(2, date=self.today)
+        self.assertEqual(self.stat.total(), 5)
+        self.assertEqual(self.stat.get(self.today), 5)
+
+        self.stat.set(1, date=self.today)
+        self.assertEqual(self.stat.get(self.today), 1)
+
+    def test_writes_of_other_processes_are_seen_on_expiration(self):
+        self.assertEqual(self.stat.total(), 3)
+        # Written by another process
+        self.cache.set(self.stat._get_cache_key(), 10)
+        self.assertEqual(self.stat.total(), 3)
+
+        with mock.patch('django_stats2.local.default_timer',
+                        side_effect=lambda: 10 ** 10):
+            self.assertEqual(self.stat.total(), 10)
+
+    def test_disabled(self):
+        with mock.patch.object(stats2_settings, 'LOCAL_CACHE', {}):
+            self.assertEqual(self.stat.total(), 3)
+        self.assertEqual(len(self.stat.backend.local_cache), 0)
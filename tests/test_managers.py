@@ -0,0 +1,88 @@
+import datetime
+from unittest import skipIf
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import django
+
+from django_stats2 import settings as stats2_settings
+
+from .base import StatsTestCase
+from .models import Note
+
+
+@skipIf(django.VERSION < (1, 11), 'Subqueries require Django 1.11')
+class WithStatsTestCase(StatsTestCase):
+    def setUp(self):
+        super(WithStatsTestCase, self).setUp()
+        self.last_month = self.today - datetime.timedelta(days=40)
+        self.notes = [Note.objects.create(title=str(i), content=str(i))
+                      for i in range(3)]
+
+        self.notes[0].reads.incr(5, date=self.last_month)
+        self.notes[0].reads.incr(1, date=self.today)
+        self.notes[1].reads.incr(3, date=self.yesterday)
+        self.notes[1].edits.incr(2, date=self.today)
+
+    def get_values(self, queryset, field):
+        return [(note.pk, getattr(note, field)) for note in queryset]
+
+    def test_order_by_total(self):
+        notes = Note.objects.with_stats('reads').order_by('-reads_value')
+
+        self.assertEqual(self.get_values(notes, 'reads_value'), [
+            (self.notes[0].pk, 6),
+            (self.notes[1].pk, 3),
+            (self.notes[2].pk, 0),
+        ])
+
+    def test_filter_range(self):
+        notes = Note.objects \
+            .with_stats('reads', date_start=self.yesterday) \
+            .filter(reads_value__gte=2)
+
+        self.assertEqual(self.get_values(notes, 'reads_value'),
+                         [(self.notes[1].pk, 3)])
+
+    def test_date(self):
+        notes = Note.objects.with_stats('reads', 'edits', date=self.today) \
+            .order_by('pk')
+
+        self.assertEqual(
+            [(note.reads_value, note.edits_value) for note in notes],
+            [(1, 0), (0, 2), (0, 0)])
+
+    def test_alias(self):
+        notes = Note.objects \
+            .with_stats(old_reads='reads', date_end=self.last_month) \
+            .order_by('-old_reads')
+
+        self.assertEqual(self.get_values(notes, 'old_reads')[0],
+                         (self.notes[0].pk, 5))
+        # The stat field keeps working
+        self.assertEqual(notes[0].reads.total(), 6)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            notes = list(Note.objects.with_stats('reads', 'edits'))
+        self.assertEqual(len(notes), 3)
+
+    @mock.patch.object(stats2_settings, 'SHARDS', {'reads': 4})
+    def test_shards_are_summed(self):
+        for i in range(20):
+            self.notes[2].reads.incr(date=self.today)
+
+        note = Note.objects.with_stats('reads').get(pk=self.notes[2].pk)
+
+        self.assertEqual(note.reads_value, 20)
+
+    def test_unknown_stat(self):
+        with self.assertRaises(ValueError):
+            Note.objects.with_stats('title')
+
+    def test_unique_stat(self):
+        with self.assertRaises(ValueError):
+            Note.objects.with_stats('visitors')
@@ -0,0 +1,115 @@
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.core.cache import caches
+from django.http import Http404
+from django.test.client import RequestFactory
+
+from django_stats2 import metrics
+from django_stats2 import settings as stats2_settings
+from django_stats2 import views
+from django_stats2 import writebehind
+from django_stats2.models import ModelStat
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+
+
+class MetricsTestCase(StatsTestCase):
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        metrics.registry.reset()
+        metrics.connect()
+        self.addCleanup(metrics.disconnect)
+        self.stat = Stat(name='total_visits')
+
+    def test_cache_hits_and_misses(self):
+        self.stat.incr(2, date=self.today)
+        caches[stats2_settings.CACHE_KEY].clear()
+
+        self.assertEqual(self.stat.total(), 2)
+        self.assertEqual(self.stat.total(), 2)
+
+        registry = metrics.registry
+        self.assertEqual(
+            registry.get('stats2_cache_misses_total', value_type='total'), 1)
+        self.assertEqual(
+            registry.get('stats2_cache_hits_total', value_type='total'), 1)
+        self.assertEqual(registry.get('stats2_ddbb_read_seconds_count',
+                                      value_type='total'), 1)
+        self.assertEqual(registry.get('stats2_ddbb_read_values_total',
+                                      value_type='total'), 1)
+
+    def test_ddbb_writes(self):
+        self.stat.incr(date=self.today)
+        self.stat.set(5, date=self.today)
+
+        self.assertEqual(
+            metrics.registry.get('stats2_ddbb_write_seconds_count'), 2)
+        self.assertEqual(
+            metrics.registry.get('stats2_ddbb_write_rows_total'), 2)
+        self.assertGreaterEqual(
+            metrics.registry.get('stats2_ddbb_write_seconds_sum'), 0)
+
+    def test_duplicates_merged(self):
+        # Duplicated rows of a global stat, created by a race
+        for i in range(3):
+            ModelStat.objects.create(name='total_visits', date=self.today,
+                                     value=1)
+
+        self.stat.set(5, date=self.today)
+
+        self.assertEqual(metrics.registry.get(
+            'stats2_duplicates_merged_total', model='modelstat'), 2)
+        self.assertEqual(ModelStat.objects.get().value, 5)
+
+    @mock.patch.object(stats2_settings, 'DDBB_DIRECT_INSERT', False)
+    @mock.patch.object(stats2_settings, 'WRITE_BEHIND', True)
+    def test_flush(self):
+        self.stat.incr(3, date=self.today)
+        Stat(name='total_reads').incr(date=self.today)
+
+        self.assertEqual(writebehind.flush(), 2)
+
+        self.assertEqual(metrics.registry.get('stats2_flush_seconds_count'),
+                         1)
+        self.assertEqual(metrics.registry.get('stats2_flush_rows_total'), 2)
+
+    def test_disconnect(self):
+        metrics.disconnect()
+        self.stat.incr(date=self.today)
+
+        self.assertEqual(
+            metrics.registry.get('stats2_ddbb_write_rows_total'), 0)
+
+    def test_render(self):
+        metrics.registry.incr('stats2_cache_hits_total', 3,
+                              value_type='total')
+        metrics.registry.observe('stats2_flush_seconds', 0.5)
+
+        lines = metrics.registry.render().splitlines()
+
+        self.assertIn('# TYPE stats2_cache_hits_total counter', lines)
+        self.assertIn('stats2_cache_hits_total{value_type="total"} 3', lines)
+        self.assertIn('# TYPE stats2_flush_seconds summary', lines)
+        self.assertIn('stats2_flush_seconds_count 1', lines)
+        self.assertIn('stats2_flush_seconds_sum 0.5', lines)
+
+    def test_view(self):
+        self.stat.incr(date=self.today)
+        request = RequestFactory().get('/metrics')
+
+        with mock.patch.object(stats2_settings, 'METRICS', True):
+            response = views.metrics(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'stats2_ddbb_write_rows_total 1', response.content)
+
+    def test_view_disabled(self):
+        request = RequestFactory().get('/metrics')
+
+        with self.assertRaises(Http404):
+            views.metrics(request)
@@ -4,6 +4,7 @@ from .models import Note
 
 from django.contrib.contenttypes.models import ContentType
 
+from django_stats2.fields import StatField
 from django_stats2.objects import Stat
 
 
@@ -57,3 +58,23 @@ class MixinTestCase(TestCase):
         # Check that the instance is different
         self.assertNotEqual(id(getattr(note1, self.stat_name1)),
                             id(getattr(note2, self.stat_name1)))
+
+    def test_stats_are_created_on_first_access(self):
+        self.assertNotIn(self.stat_name1, self.note.__dict__)
+
+        attr = getattr(self.note, self.stat_name1)
+
+        self.assertIs(self.note.__dict__[self.stat_name1], attr)
+        self.assertIs(getattr(self.note, self.stat_name1), attr)
+
+    def test_loaded_instances_do_not_create_stats(self):
+        Note.objects.create(title='1', content='1')
+        note = Note.objects.first()
+
+        self.assertNotIn(self.stat_name1, note.__dict__)
+        note.delete()
+
+    def test_stat_fields_are_registered_on_the_model(self):
+        self.assertIsInstance(Note.reads, StatField)
+        self.assertEqual(sorted(self.note._get_stat_fields()),
+                         ['edits', 'reads', 'visitors'])
@@ -1,13 +1,30 @@
 import datetime
+import itertools
 from unittest import TestCase
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 from django.core.cache import caches
+from django.core.management import call_command
 from django.test.testcases import TransactionTestCase
+from django.utils import timezone
 
 from django_stats2 import settings as stats2_settings
+from django_stats2.buffer import buffered_stats
+from django_stats2.leaderboard import top
 from django_stats2.objects import Stat
-from django_stats2.models import ModelStat
+from django_stats2.models import (
+    ModelStat, ModelStatBucket, ModelStatRollup, ModelStatTotal)
 
+from .base import StatsTestCase
 from .models import Note
 
 
@@ -20,6 +37,30 @@ class StatTestCase(TestCase):
         self.assertEqual(self.stat._get_stat_prefix(), '_global')
         self.assertEqual(self.note.reads._get_stat_prefix(), 'note')
 
+    def test_cache_keys(self):
+        day = datetime.date(2016, 1, 1)
+        self.assertEqual(self.stat._get_cache_key('history', day),
+                         'stats2:_global:total_visits::2016-01-01')
+        self.assertEqual(
+            self.note.reads._get_cache_key('between', day, day,
+                                           generation=1),
+            'stats2:note:reads:{}:2016-01-01_2016-01-01:1'.format(
+                self.note.pk))
+
+    def test_cache_keys_follow_the_instance_pk(self):
+        note = Note(title='Title', content='Content')
+        stat = note.reads
+        self.assertEqual(stat._get_cache_key(), 'stats2:note:reads::total')
+
+        note.save()
+
+        self.assertEqual(stat._get_cache_key(),
+                         'stats2:note:reads:{}:total'.format(note.pk))
+        note.delete()
+
+    def test_stats_have_slots(self):
+        self.assertFalse(hasattr(self.stat, '__dict__'))
+
 
 class ModelStatTotalsTestCase(TestCase):
     def setUp(self):
@@ -39,15 +80,11 @@ class ModelStatTotalsTestCase(TestCase):
         self.assertEquals(ModelStat.objects.count(), 0)
 
 
-class ModelStatCacheTestCase(TransactionTestCase):
+class ModelStatCacheTestCase(StatsTestCase):
     def setUp(self):
+        super(ModelStatCacheTestCase, self).setUp()
         self.note = Note.objects.create(title='Title', content='Content')
 
-    def tearDown(self):
-        self.note.delete()
-        ModelStat.objects.all().delete()
-        caches[stats2_settings.CACHE_KEY].clear()
-
     def test_retrieve_stat_create_cache(self):
         value = self.note.reads.get()
 
@@ -194,6 +231,50 @@ class StatOperationsBase:
         )
         self.assertEqual(four_days, 4)
 
+    def test_get_between_is_invalidated_on_writes(self):
+        date_start = datetime.date.today() + datetime.timedelta(days=-2)
+        date_end = datetime.date.today()
+        self.stat.set(date=date_start, value=1)
+        self.assertEqual(self.stat.get_between_date(date_start, date_end), 1)
+
+        self.stat.incr(2, date=date_end)
+        self.assertEqual(self.stat.get_between_date(date_start, date_end), 3)
+
+        self.stat.set(date=date_start, value=5)
+        self.assertEqual(self.stat.get_between_date(date_start, date_end), 7)
+
+        self.stat.store(4, date=date_end)
+        self.assertEqual(self.stat.get_between_date(date_start, date_end), 9)
+
+        self.stat.decr(date=date_end)
+        self.assertEqual(self.stat.get_between_date(date_start, date_end), 8)
+
+    def test_get_series(self):
+        today = datetime.date.today()
+        for i in range(1, 6):
+            day = today + datetime.timedelta(days=i*-1)
+            self.stat.set(date=day, value=i)
+
+        caches[stats2_settings.CACHE_KEY].clear()
+        date_start = today + datetime.timedelta(days=-6)
+
+        with self.assertNumQueries(1):
+            series = self.stat.get_series(date_start, today)
+
+        self.assertEqual(list(series.keys()),
+                         [date_start + datetime.timedelta(days=i)
+                          for i in range(7)])
+        self.assertEqual(list(series.values()), [0, 5, 4, 3, 2, 1, 0])
+
+        # Test cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.stat.get_series(date_start, today), series)
+
+        self.assertEqual(
+            list(self.stat.get_series(date_start, today,
+                                      fill_zeros=False).values()),
+            [5, 4, 3, 2, 1])
+
     def test_store(self):
         day = datetime.date.today()
         self.stat.store(3, date=day)
@@ -203,7 +284,8 @@ class StatOperationsBase:
 
 
 class ModelStatOperationsTestCase(StatOperationsBase, TransactionTestCase):
-    queries_per_set = 3
+    # Transaction, stat lookup, stat insert, rollups and totals upserts
+    queries_per_set = 5
 
     def setUp(self):
         self.note = Note.objects.create(title='Title', content='Content')
@@ -216,7 +298,7 @@ class ModelStatOperationsTestCase(StatOperationsBase, TransactionTestCase):
 
 
 class GlobalStatOperationsTestCase(StatOperationsBase, TransactionTestCase):
-    queries_per_set = 3
+    queries_per_set = 5
 
     def setUp(self):
         self.stat = Stat(name='total_visits')
@@ -226,6 +308,291 @@ class GlobalStatOperationsTestCase(StatOperationsBase, TransactionTestCase):
         caches[stats2_settings.CACHE_KEY].clear()
 
 
+class AtomicIncrTestCase(TransactionTestCase):
+    def setUp(self):
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.today = datetime.date.today()
+
+    def tearDown(self):
+        self.note.delete()
+        ModelStat.objects.all().delete()
+        caches[stats2_settings.CACHE_KEY].clear()
+
+    def test_model_stat_incr_is_a_single_statement_per_table(self):
+        self.note.reads.incr(date=self.today)
+
+        # Transaction, stat upsert, rollups upsert and totals upsert
+        with self.assertNumQueries(4):
+            self.note.reads.incr(2, date=self.today)
+
+        self.assertEqual(ModelStat.objects.get().value, 3)
+
+    def test_global_stat_incr_is_a_single_statement_per_table(self):
+        stat = Stat(name='visits')
+        stat.incr(date=self.today)
+
+        # Transaction, stat update, rollups upsert and totals upsert
+        with self.assertNumQueries(4):
+            stat.incr(2, date=self.today)
+
+        self.assertEqual(ModelStat.objects.get().value, 3)
+
+    def test_global_stat_incr_merges_duplicates(self):
+        ModelStat.objects.create(name='visits', date=self.today, value=2)
+        ModelStat.objects.create(name='visits', date=self.today, value=3)
+
+        Stat(name='visits').incr(date=self.today)
+
+        self.assertEqual(ModelStat.objects.get().value, 6)
+
+    def test_get_date_does_not_create_rows(self):
+        self.assertEqual(self.note.reads.get(date=self.today), 0)
+        self.assertEqual(ModelStat.objects.count(), 0)
+
+    def test_rows_are_written_in_key_order(self):
+        yesterday = self.today - datetime.timedelta(days=1)
+        rows = [
+            Stat(name='visits')._get_row_key(self.today) + (1, ),
+            self.note.reads._get_row_key(self.today) + (1, ),
+            self.note.edits._get_row_key(yesterday) + (1, ),
+            self.note.reads._get_row_key(yesterday) + (1, ),
+        ]
+
+        manager = ModelStat.objects
+        with mock.patch.object(manager, '_supports_upsert',
+                               return_value=False), \
+                mock.patch.object(manager, '_incr_fallback',
+                                  wraps=manager._incr_fallback) as fallback:
+            manager.incr_many(rows)
+
+        keys = [key[:4] for key in fallback.call_args[0][0]]
+        self.assertEqual(keys, [
+            rows[2][:4], rows[3][:4], rows[1][:4], rows[0][:4]])
+
+
+class RollupTestCase(TransactionTestCase):
+    def setUp(self):
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = self.note.reads
+
+        # One value per day between 2015-12-20 and 2017-01-10
+        day = datetime.date(2015, 12, 20)
+        rows = []
+        while day <= datetime.date(2017, 1, 10):
+            rows.append(self.stat._get_row_key(day) + (1, ))
+            day += datetime.timedelta(days=1)
+        ModelStat.objects.incr_many(rows)
+
+    def tearDown(self):
+        self.note.delete()
+        ModelStat.objects.all().delete()
+        ModelStatRollup.objects.all().delete()
+        ModelStatTotal.objects.all().delete()
+        caches[stats2_settings.CACHE_KEY].clear()
+
+    def test_rollups_are_maintained(self):
+        self.assertEqual(
+            ModelStatRollup.objects.get(
+                period=ModelStatRollup.PERIOD_MONTH,
+                date=datetime.date(2016, 2, 1)).value,
+            29)
+        self.assertEqual(
+            ModelStatRollup.objects.get(
+                period=ModelStatRollup.PERIOD_YEAR,
+                date=datetime.date(2016, 1, 1)).value,
+            366)
+
+        self.stat.set(10, date=datetime.date(2016, 2, 3))
+        self.stat.decr(date=datetime.date(2016, 2, 4))
+
+        self.assertEqual(
+            ModelStatRollup.objects.get(
+                period=ModelStatRollup.PERIOD_MONTH,
+                date=datetime.date(2016, 2, 1)).value,
+            37)
+
+    def test_totals_are_maintained(self):
+        self.assertEqual(ModelStatTotal.objects.get().value, 12 + 366 + 10)
+
+        self.stat.set(date=datetime.date(2016, 1, 1), value=5)
+        self.stat.decr(date=datetime.date(2017, 1, 1))
+
+        self.assertEqual(ModelStatTotal.objects.get().value, 12 + 366 + 10 + 3)
+
+    def test_total_is_a_single_row_lookup(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.stat.total(), 12 + 366 + 10)
+
+    def test_between_combines_rollups_and_days(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                self.stat.get_between_date(datetime.date(2015, 12, 25),
+                                           datetime.date(2017, 1, 5)),
+                7 + 366 + 5)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.stat.get_between_date(datetime.date(2016, 3, 1),
+                                           datetime.date(2016, 4, 30)),
+                31 + 30)
+
+
+class ShardsTestCase(StatsTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(stats2_settings, 'SHARDS',
+                                    {'visits': 4, 'reads': 4})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        super(ShardsTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+
+    def incr(self, stat, times, date):
+        shards = itertools.cycle(range(4))
+        with mock.patch.object(ModelStat.objects, 'get_shard',
+                               side_effect=lambda name: next(shards)):
+            for i in range(times):
+                stat.incr(date=date)
+
+    def test_increments_are_spread_over_the_shards(self):
+        stat = Stat(name='visits')
+        self.incr(stat, 8, self.today)
+        self.incr(stat, 2, self.yesterday)
+        caches[stats2_settings.CACHE_KEY].clear()
+
+        self.assertEqual(
+            sorted(ModelStat.objects.filter(date=self.today)
+                   .values_list('shard', 'value')),
+            [(0, 2), (1, 2), (2, 2), (3, 2)])
+        self.assertEqual(ModelStatTotal.objects.count(), 4)
+
+        self.assertEqual(stat.get(self.today), 8)
+        self.assertEqual(stat.total(), 10)
+        self.assertEqual(stat.get_between_date(self.yesterday, self.today), 10)
+        self.assertEqual(
+            list(stat.get_series(self.yesterday, self.today).values()),
+            [2, 8])
+
+    def test_set_merges_the_shards(self):
+        stat = Stat(name='visits')
+        self.incr(stat, 8, self.today)
+
+        stat.set(3, date=self.today)
+
+        self.assertEqual(ModelStat.objects.get().value, 3)
+        caches[stats2_settings.CACHE_KEY].clear()
+        self.assertEqual(stat.total(), 3)
+
+    def test_model_stats(self):
+        other = Note.objects.create(title='Other', content='Other')
+        self.incr(self.note.reads, 3, self.today)
+        self.incr(other.reads, 2, self.today)
+        caches[stats2_settings.CACHE_KEY].clear()
+
+        self.assertEqual(ModelStat.objects.count(), 5)
+        self.assertEqual(self.note.reads.total(), 3)
+        self.assertEqual(top(Note, 'reads'), [(self.note, 3), (other, 2)])
+
+    def test_stats_not_sharded(self):
+        self.note.edits.incr(date=self.today)
+        self.note.edits.incr(date=self.today)
+
+        self.assertEqual(ModelStat.objects.get().shard, 0)
+
+
+class GranularityTestCase(StatsTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(stats2_settings, 'GRANULARITY',
+                                    {'visits': 'hour', 'reads': 'minute'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        super(GranularityTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = Stat(name='visits')
+        self.day = datetime.date(2016, 5, 10)
+        self.moment = timezone.make_aware(datetime.datetime(2016, 5, 10, 10),
+                                          timezone.utc)
+
+    def at(self, **kwargs):
+        return self.moment + datetime.timedelta(**kwargs)
+
+    def test_hourly_buckets(self):
+        self.stat.incr(date=self.at(minutes=15))
+        self.stat.incr(2, date=self.at(minutes=45))
+        self.stat.incr(date=self.at(hours=1, minutes=5))
+
+        buckets = self.stat.get_buckets(self.day)
+        self.assertEqual(len(buckets), 24)
+        self.assertEqual(buckets[self.moment], 3)
+        self.assertEqual(
+            self.stat.get_buckets(self.day, fill_zeros=False),
+            {self.moment: 3, self.at(hours=1): 1})
+
+        # Days are kept along with the buckets
+        self.assertEqual(self.stat.get(self.day), 4)
+        self.assertEqual(self.stat.total(), 4)
+
+    def test_minute_buckets(self):
+        stat = self.note.reads
+        stat.incr(date=self.at(seconds=10))
+        stat.incr(date=self.at(seconds=50))
+        stat.incr(date=self.at(minutes=1))
+
+        self.assertEqual(len(stat.get_buckets(self.day)), 24 * 60)
+        self.assertEqual(
+            stat.get_buckets(self.day, fill_zeros=False),
+            {self.moment: 2, self.at(minutes=1): 1})
+
+    def test_buckets_are_cached_until_a_write(self):
+        self.stat.incr(date=self.at(minutes=15))
+        self.stat.get_buckets(self.day)
+
+        with self.assertNumQueries(0):
+            self.stat.get_buckets(self.day)
+
+        self.stat.incr(date=self.at(minutes=20))
+
+        self.assertEqual(self.stat.get_buckets(self.day)[self.moment], 2)
+
+    def test_buffer_coalesces_by_bucket(self):
+        with buffered_stats():
+            self.stat.incr(date=self.at(minutes=15))
+            self.stat.incr(date=self.at(minutes=30))
+            self.stat.incr(date=self.at(hours=2))
+
+        self.assertEqual(
+            self.stat.get_buckets(self.day, fill_zeros=False),
+            {self.moment: 2, self.at(hours=2): 1})
+
+    def test_dates_default_to_now(self):
+        with mock.patch('django.utils.timezone.now',
+                        return_value=self.at(minutes=30)):
+            self.stat.incr()
+            self.note.edits.incr()
+            self.note.edits.set(5)
+
+        self.assertEqual(self.stat.get_buckets(self.day)[self.moment], 1)
+        self.assertEqual(self.note.edits.get(self.day), 5)
+
+    def test_daily_stats_have_no_buckets(self):
+        self.note.edits.incr(date=self.at(minutes=15))
+
+        self.assertEqual(ModelStatBucket.objects.count(), 0)
+        self.assertEqual(self.note.edits.get(self.day), 1)
+
+    def test_flush_prunes_old_buckets(self):
+        self.stat.incr(date=self.at(minutes=15))
+        self.stat.incr()
+
+        out = StringIO()
+        call_command('stats2_flush', stdout=out)
+
+        self.assertIn('Pruned 1 stat buckets.', out.getvalue())
+        self.assertEqual(ModelStatBucket.objects.count(), 1)
+        self.assertEqual(self.stat.total(), 2)
+
+
 class RaceConditionTestCase(TransactionTestCase):
     """Ad-Hoc test for race conditions on the get_or_create method
     when multiple proceeses call _get_model_queryset at the same time
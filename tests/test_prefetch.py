@@ -0,0 +1,53 @@
+from django_stats2.prefetch import prefetch_stats
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class PrefetchStatsTestCase(StatsTestCase):
+    def setUp(self):
+        super(PrefetchStatsTestCase, self).setUp()
+        for i in range(5):
+            note = Note.objects.create(title=str(i), content=str(i))
+            note.reads.incr(i, date=self.today)
+            note.reads.incr(1, date=self.yesterday)
+            note.edits.incr(2, date=self.today)
+        self.cache.clear()
+
+    def test_prefetch_totals(self):
+        # Instances, stats grouped query
+        with self.assertNumQueries(2):
+            notes = prefetch_stats(Note.objects.order_by('pk'),
+                                   'reads', 'edits')
+
+        with self.assertNumQueries(0):
+            self.assertEqual([note.reads.total() for note in notes],
+                             [1, 2, 3, 4, 5])
+            self.assertEqual([note.edits.get() for note in notes],
+                             [2] * 5)
+
+    def test_prefetch_date(self):
+        notes = prefetch_stats(Note.objects.order_by('pk'), 'reads',
+                               date=self.today)
+
+        with self.assertNumQueries(0):
+            self.assertEqual([note.reads.get(date=self.today)
+                              for note in notes],
+                             [0, 1, 2, 3, 4])
+
+    def test_prefetch_fills_the_cache(self):
+        prefetch_stats(Note.objects.all(), 'reads')
+
+        # Only the instances query, values come from the cache
+        with self.assertNumQueries(1):
+            notes = prefetch_stats(Note.objects.order_by('pk'), 'reads')
+
+        self.assertEqual(notes[-1].reads.total(), 5)
+
+    def test_writes_discard_prefetched_values(self):
+        note = prefetch_stats(Note.objects.order_by('pk'), 'reads')[0]
+        self.assertEqual(note.reads.total(), 1)
+
+        note.reads.incr(date=self.today)
+
+        self.assertEqual(note.reads.total(), 2)
@@ -0,0 +1,134 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+
+from django_stats2 import settings as stats2_settings
+from django_stats2 import transfer
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class TransferTestCase(StatsTestCase):
+    def setUp(self):
+        super(TransferTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = Stat(name='total_visits')
+
+        self.note.reads.incr(3, date=self.yesterday)
+        self.note.reads.incr(2, date=self.today)
+        self.stat.incr(5, date=self.today)
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as output:
+            output.write(content)
+        return path
+
+    def test_csv_round_trip(self):
+        path = os.path.join(self.directory, 'stats.csv')
+        out = StringIO()
+        call_command('stats2_export', '--output', path, stdout=out)
+        self.assertIn('Exported 3 daily stat values.', out.getvalue())
+
+        self.reset()
+        out = StringIO()
+        call_command('stats2_import', path, stdout=out)
+
+        self.assertIn('Imported 3 daily stat values.', out.getvalue())
+        self.assertEqual(self.note.reads.get(self.yesterday), 3)
+        self.assertEqual(self.note.reads.total(), 5)
+        self.assertEqual(self.stat.total(), 5)
+        self.assertEqual(self.note.reads.get_between_date(
+            self.yesterday, self.today), 5)
+
+    def test_jsonl_export(self):
+        out = StringIO()
+        call_command('stats2_export', '--format', 'jsonl', '--stat',
+                     'total_visits', stdout=out)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(rows, [{
+            'content_type': '', 'object_id': None, 'name': 'total_visits',
+            'date': self.today.isoformat(), 'value': 5}])
+
+    def test_export_date_range(self):
+        rows = list(transfer.export_stats(date_end=self.yesterday))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['content_type'], 'tests.note')
+        self.assertEqual(rows[0]['object_id'], self.note.pk)
+        self.assertEqual(rows[0]['value'], 3)
+
+    def test_import_replaces_values(self):
+        # Cached before the import
+        self.assertEqual(self.note.reads.total(), 5)
+        self.assertEqual(self.note.reads.get(self.today), 2)
+
+        path = self.write('stats.jsonl', json.dumps({
+            'content_type': 'tests.note', 'object_id': self.note.pk,
+            'name': 'reads', 'date': self.today.isoformat(), 'value': 10,
+        }) + '\n')
+        call_command('stats2_import', path, '--format', 'jsonl',
+                     stdout=StringIO())
+
+        self.assertEqual(self.note.reads.get(self.today), 10)
+        self.assertEqual(self.note.reads.total(), 13)
+
+    def test_import_adds_values(self):
+        path = self.write('stats.csv', 'content_type,object_id,name,date,'
+                          'value\n,,total_visits,{},4\n'.format(self.today))
+        call_command('stats2_import', path, '--add', stdout=StringIO())
+
+        self.assertEqual(self.stat.get(self.today), 9)
+        self.assertEqual(self.stat.total(), 9)
+
+    def test_batches(self):
+        rows = [{'content_type': '', 'object_id': '', 'name': 'total_visits',
+                 'date': (self.today - datetime.timedelta(days=day))
+                 .isoformat(), 'value': 1}
+                for day in range(10)]
+
+        self.assertEqual(transfer.import_stats(rows, batch_size=3), 10)
+        self.assertEqual(self.stat.total(), 10)
+
+    def test_cache_is_cleared_per_batch(self):
+        rows = [{'content_type': '', 'object_id': '', 'name': 'total_visits',
+                 'date': (self.today - datetime.timedelta(days=day))
+                 .isoformat(), 'value': 1}
+                for day in range(10)]
+
+        cache = caches[stats2_settings.CACHE_KEY]
+        with mock.patch.object(cache, 'delete_many',
+                               wraps=cache.delete_many) as delete_many:
+            transfer.import_stats(rows, batch_size=5)
+
+        # The values and the generations of each batch
+        self.assertEqual(delete_many.call_count, 4)
+        self.assertEqual(len(delete_many.call_args_list[0][0][0]), 6)
+
+    def test_unknown_content_type(self):
+        path = self.write('stats.csv', 'content_type,object_id,name,date,'
+                          'value\nfoo.bar,1,reads,2017-01-01,4\n')
+
+        with self.assertRaises(CommandError):
+            call_command('stats2_import', path, stdout=StringIO())
@@ -0,0 +1,105 @@
+from unittest import TestCase
+
+from django_stats2.hyperloglog import HyperLogLog
+from django_stats2.models import ModelStatSketch
+from django_stats2.unique import UniqueStat
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class HyperLogLogTestCase(TestCase):
+    def test_count(self):
+        sketch = HyperLogLog()
+        self.assertEqual(sketch.count(), 0)
+
+        for i in range(20000):
+            sketch.add(i)
+            sketch.add(str(i))
+
+        self.assertEqual(len(sketch.to_bytes()), 4096)
+        # Within three standard errors
+        self.assertAlmostEqual(sketch.count(), 20000, delta=20000 * 0.05)
+
+    def test_small_counts_are_exact(self):
+        sketch = HyperLogLog()
+        for i in range(50):
+            sketch.add('visitor-{}'.format(i))
+            sketch.add('visitor-{}'.format(i))
+
+        self.assertEqual(sketch.count(), 50)
+
+    def test_merge(self):
+        sketch = HyperLogLog()
+        other = HyperLogLog()
+        for i in range(100):
+            sketch.add(i)
+            other.add(i + 50)
+
+        sketch.merge(HyperLogLog(other.to_bytes()))
+
+        self.assertAlmostEqual(sketch.count(), 150, delta=150 * 0.05)
+        self.assertRaises(ValueError, sketch.merge, HyperLogLog(precision=4))
+
+
+class UniqueStatTestCase(StatsTestCase):
+    def setUp(self):
+        super(UniqueStatTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = self.note.visitors
+
+    def test_field(self):
+        self.assertIsInstance(self.stat, UniqueStat)
+        self.assertEqual(self.stat.name, 'visitors')
+
+    def test_counts(self):
+        for visitor in ('a', 'b', 'c', 'a'):
+            self.stat.add(visitor, date=self.yesterday)
+        for visitor in ('a', 'd', 'd'):
+            self.stat.add(visitor, date=self.today)
+
+        self.assertEqual(self.stat.get(self.yesterday), 3)
+        self.assertEqual(self.stat.get(self.today), 2)
+        self.assertEqual(self.stat.total(), 4)
+        self.assertEqual(
+            self.stat.get_between_date(self.yesterday, self.today), 4)
+        self.assertEqual(
+            list(self.stat.get_series(self.yesterday, self.today).values()),
+            [3, 2])
+
+    def test_sketches_are_persisted_per_day(self):
+        self.stat.add('a', date=self.yesterday)
+        self.stat.add('b', date=self.today)
+        self.cache.clear()
+
+        self.assertEqual(ModelStatSketch.objects.count(), 2)
+        self.assertEqual(self.stat.get(self.today), 1)
+        self.assertEqual(self.stat.total(), 2)
+
+    def test_unchanged_sketch_is_not_written(self):
+        self.stat.add('a', date=self.today)
+
+        with self.assertNumQueries(0):
+            self.stat.add('a', date=self.today)
+
+    def test_total_is_invalidated(self):
+        self.stat.add('a', date=self.today)
+        self.assertEqual(self.stat.total(), 1)
+
+        self.stat.add('b', date=self.yesterday)
+
+        self.assertEqual(self.stat.total(), 2)
+
+    def test_global_stat(self):
+        stat = UniqueStat(name='visitors')
+        stat.add('a', date=self.today)
+        stat.add('b', date=self.today)
+
+        self.assertEqual(stat.get(self.today), 2)
+        self.assertEqual(self.stat.get(self.today), 0)
+
+    def test_counters_are_not_supported(self):
+        self.assertRaises(NotImplementedError, self.stat.incr)
+        self.assertRaises(NotImplementedError, self.stat.aincr)
+        self.assertRaises(NotImplementedError, self.stat.adecr)
+        self.assertRaises(NotImplementedError, self.stat.aset, 1)
@@ -0,0 +1,34 @@
+import datetime
+from unittest import TestCase
+
+from django_stats2.utils import get_month_end, split_date_range
+
+
+class SplitDateRangeTestCase(TestCase):
+    def test_month_end(self):
+        self.assertEqual(get_month_end(datetime.date(2016, 2, 10)),
+                         datetime.date(2016, 2, 29))
+        self.assertEqual(get_month_end(datetime.date(2016, 12, 31)),
+                         datetime.date(2016, 12, 31))
+
+    def test_days_within_a_month(self):
+        self.assertEqual(
+            split_date_range(datetime.date(2016, 2, 3),
+                             datetime.date(2016, 2, 10)),
+            ([(datetime.date(2016, 2, 3), datetime.date(2016, 2, 10))],
+             [], []))
+
+    def test_years_months_and_days(self):
+        days, months, years = split_date_range(datetime.date(2015, 10, 15),
+                                               datetime.date(2017, 2, 10))
+
+        self.assertEqual(days, [
+            (datetime.date(2015, 10, 15), datetime.date(2015, 10, 31)),
+            (datetime.date(2017, 2, 1), datetime.date(2017, 2, 10)),
+        ])
+        self.assertEqual(months, [
+            datetime.date(2015, 11, 1),
+            datetime.date(2015, 12, 1),
+            datetime.date(2017, 1, 1),
+        ])
+        self.assertEqual(years, [datetime.date(2016, 1, 1)])
@@ -0,0 +1,91 @@
+import datetime
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from django_stats2 import settings as stats2_settings
+from django_stats2 import writebehind
+from django_stats2.objects import Stat
+from django_stats2.warm import warm_cache
+
+from .base import StatsTestCase
+from .models import Note
+
+
+class WarmTestCase(StatsTestCase):
+    def setUp(self):
+        super(WarmTestCase, self).setUp()
+        self.notes = [Note.objects.create(title=str(i), content=str(i))
+                      for i in range(3)]
+        self.stat = Stat(name='total_visits')
+        self.today = timezone.now().date()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+
+        for note in self.notes:
+            note.reads.incr(2, date=self.yesterday)
+            note.reads.incr(1, date=self.today)
+        self.notes[0].edits.incr(4, date=self.today)
+        self.stat.incr(5, date=self.today)
+
+        self.cache.clear()
+
+    def test_totals_and_history_are_cached(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(warm_cache(days=2), 5)
+
+        with self.assertNumQueries(0):
+            for note in self.notes:
+                self.assertEqual(note.reads.total(), 3)
+                self.assertEqual(note.reads.get(self.yesterday), 2)
+                self.assertEqual(note.reads.get(self.today), 1)
+            self.assertEqual(self.notes[0].edits.total(), 4)
+            self.assertEqual(self.stat.total(), 5)
+            self.assertEqual(self.stat.get(self.yesterday), 0)
+
+    def test_batches(self):
+        # One query for the totals and one per batch for the history
+        with self.assertNumQueries(4):
+            self.assertEqual(warm_cache(days=1, batch_size=2), 5)
+
+    def test_names(self):
+        self.assertEqual(warm_cache(names=['edits'], days=0), 1)
+
+        self.assertIsNotNone(
+            self.cache.get(self.notes[0].edits._get_cache_key()))
+        self.assertIsNone(self.cache.get(self.notes[0].reads._get_cache_key()))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('stats2_warm', '--model', 'tests.Note', '--stat',
+                     'reads', stdout=out)
+
+        self.assertIn('Warmed 3 stats.', out.getvalue())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.notes[1].reads.get(self.yesterday), 2)
+
+    def test_cached_values_are_kept(self):
+        with mock.patch.object(stats2_settings, 'DDBB_DIRECT_INSERT', False), \
+                mock.patch.object(stats2_settings, 'WRITE_BEHIND', True):
+            warm_cache(days=1)
+            # Not flushed yet
+            self.stat.incr(3, date=self.today)
+            warm_cache(days=1)
+
+            self.assertEqual(self.stat.get(self.today), 8)
+            writebehind.flush()
+            self.assertEqual(self.stat.get(self.today), 8)
+
+    def test_unknown_model(self):
+        with self.assertRaises(CommandError):
+            call_command('stats2_warm', '--model', 'tests.Unknown',
+                         stdout=StringIO())
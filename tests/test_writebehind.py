@@ -0,0 +1,163 @@
+import datetime
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.utils import timezone
+
+from django_stats2 import backends
+from django_stats2 import settings as stats2_settings
+from django_stats2 import writebehind
+from django_stats2.models import ModelStat, ModelStatBucket
+from django_stats2.objects import Stat
+
+from .base import StatsTestCase
+from .models import Note
+
+
+@mock.patch.object(stats2_settings, 'DDBB_DIRECT_INSERT', False)
+@mock.patch.object(stats2_settings, 'WRITE_BEHIND', True)
+class WriteBehindTestCase(StatsTestCase):
+    def setUp(self):
+        super(WriteBehindTestCase, self).setUp()
+        self.note = Note.objects.create(title='Title', content='Content')
+        self.stat = Stat(name='total_visits')
+
+    def test_incr_does_not_touch_database(self):
+        with self.assertNumQueries(0):
+            self.note.reads.incr(date=self.today)
+
+        self.assertEqual(ModelStat.objects.count(), 0)
+
+    def test_flush_writes_pending_deltas(self):
+        self.note.reads.incr(date=self.today)
+        self.note.reads.incr(2, date=self.today)
+        self.note.edits.incr(date=self.today)
+        self.stat.incr(5, date=self.today)
+        self.stat.decr(date=self.today)
+
+        self.assertEqual(writebehind.flush(), 3)
+
+        self.assertEqual(
+            ModelStat.objects.get(name='reads', object_id=self.note.pk).value,
+            3)
+        self.assertEqual(
+            ModelStat.objects.get(name='edits', object_id=self.note.pk).value,
+            1)
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 4)
+
+    def test_flush_twice_does_not_duplicate(self):
+        self.note.reads.incr(3, date=self.today)
+        writebehind.flush()
+
+        self.assertEqual(writebehind.flush(), 0)
+
+        self.note.reads.incr(date=self.today)
+        self.assertEqual(writebehind.flush(), 1)
+        self.assertEqual(ModelStat.objects.get(name='reads').value, 4)
+
+    def test_flush_keeps_cache_values(self):
+        self.note.reads.incr(3, date=self.today)
+        writebehind.flush()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.note.reads.get(date=self.today), 3)
+
+        # Totals get computed again from the database
+        self.assertEqual(self.note.reads.total(), 3)
+
+    def test_flush_retires_past_days(self):
+        self.stat.incr(2, date=self.yesterday)
+        writebehind.flush()
+
+        cache = caches[stats2_settings.CACHE_KEY]
+        self.assertIsNone(cache.get(writebehind._get_key('slot', index=1)))
+        self.assertEqual(cache.get(writebehind._get_delta_key(
+            None, None, 'total_visits', self.yesterday)), 0)
+
+        # Late increments are registered again
+        self.stat.incr(date=self.yesterday)
+        writebehind.flush()
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 3)
+
+    def test_increments_while_retiring_are_kept(self):
+        self.stat.incr(2, date=self.yesterday)
+        cache = caches[stats2_settings.CACHE_KEY]
+        decr = cache.decr
+
+        def late_decr(key, delta=1, version=None):
+            remaining = decr(key, delta, version=version)
+            # Done by another process right after the delta was drained
+            self.stat.incr(date=self.yesterday)
+            return remaining
+
+        with mock.patch.object(cache, 'decr', side_effect=late_decr):
+            writebehind.flush()
+        writebehind.flush()
+
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 3)
+        self.assertEqual(writebehind.flush(), 0)
+
+    def test_deltas_registered_twice_are_flushed_once(self):
+        self.stat.incr(2, date=self.today)
+        writebehind.flush()
+
+        # Drained but still tracked when the day is over
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        with mock.patch('django_stats2.writebehind.timezone.now',
+                        return_value=tomorrow):
+            self.stat.incr(date=self.today)
+            writebehind.flush()
+
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 3)
+
+    @mock.patch.object(stats2_settings, 'GRANULARITY',
+                       {'total_visits': 'hour'})
+    def test_flush_granular_stats(self):
+        self.addCleanup(ModelStatBucket.objects.all().delete)
+        self.stat.incr()
+        self.note.reads.incr(date=self.today)
+
+        for i in range(3):
+            writebehind.flush()
+
+        self.assertEqual(ModelStat.objects.get(name='reads').value, 1)
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 1)
+        self.assertEqual(
+            ModelStatBucket.objects.get(name='total_visits').value, 1)
+
+    def test_flush_command(self):
+        self.stat.incr(date=self.today)
+        out = StringIO()
+
+        call_command('stats2_flush', stdout=out)
+
+        self.assertIn('Flushed 1 stat deltas.', out.getvalue())
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 1)
+
+    def test_flush_backend_cache(self):
+        patcher = mock.patch.object(stats2_settings, 'BACKENDS', {
+            'default': {
+                'BACKEND': 'django_stats2.backends.default.DefaultBackend',
+                'OPTIONS': {'CACHE': 'other'},
+            },
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        backends._backends.clear()
+        self.addCleanup(backends._backends.clear)
+        self.addCleanup(caches['other'].clear)
+
+        self.stat.incr(5, date=self.today)
+        call_command('stats2_flush', stdout=StringIO())
+
+        self.assertEqual(ModelStat.objects.get(name='total_visits').value, 5)